@@ -1,8 +1,18 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
+import hashlib
 import os
+import uuid
 from werkzeug.utils import secure_filename
-from nf_processor import NotaFiscalProcessor
+from nf_processor import parse_page_spec
+from processor_registry import registry
+from job_queue import JobManager, QueueFullError
+from result_cache import ResultCache, make_cache_key
+from metrics import JOBS_IN_FLIGHT, record_error, render_metrics, start_collecting, stop_collecting
+from log_config import configure_logging, get_logger
+
+configure_logging()
+logger = get_logger('app')
 
 app = Flask(__name__)
 CORS(app)  # Habilita CORS para todas as rotas
@@ -15,12 +25,97 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # Cria pasta de uploads se não existir
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+@app.before_request
+def start_stage_timings():
+    # Tempos por etapa desta requisição, devolvidos no cabeçalho Server-Timing
+    g.stage_timings, g.stage_timings_token = start_collecting()
+
+@app.after_request
+def add_server_timing(response):
+    timings = g.get('stage_timings')
+    if timings is not None and timings.durations:
+        response.headers['Server-Timing'] = timings.server_timing()
+        response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@app.teardown_request
+def stop_stage_timings(exc):
+    token = g.pop('stage_timings_token', None)
+    if token is not None:
+        stop_collecting(token)
+
 def allowed_file(filename):
     """Verifica se o arquivo tem extensão permitida."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_upload(file, filepath, chunk_size=1024 * 1024):
+    """Grava o arquivo enviado em blocos, calculando o SHA-256 do conteúdo na mesma passada."""
+    digest = hashlib.sha256()
+    with open(filepath, 'wb') as f:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def remove_upload(filepath):
+    """Remove o arquivo enviado, se ainda existir; uma falha na remoção só é registrada no log."""
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Não foi possível remover '{filepath}': {e}")
+
+def unique_upload_path(filename):
+    """Caminho único na pasta de uploads, evitando colisão entre requisições simultâneas com o mesmo arquivo."""
+    return os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{secure_filename(filename)}")
+
+def result_cache_key(content_hash, pages, split=False):
+    """Chave do cache: conteúdo do arquivo, configuração do processador, páginas solicitadas e modo lote."""
+    parts = [content_hash, registry.get().cache_namespace(), pages]
+    if split:
+        parts.append('lote')
+    return make_cache_key(*parts)
+
+def parse_form_flag(value):
+    """Interpreta um campo opcional de sim/não do formulário (debug, split): True/False, ou None se ausente."""
+    if value is None or value == '':
+        return None
+    return value.strip().lower() in ('1', 'true', 'sim', 'yes')
+
+def result_has_error(result):
+    """Indica se o resultado (de uma nota ou de um lote, ver process_batch) contém algum erro."""
+    if not result or 'erro' in result:
+        return True
+    return any(not document['resultado'] or 'erro' in document['resultado'] for document in result.get('documentos', ()))
+
+def run_processing_job(filepath, pages=None, debug=None, job_id=None, cache_key=None, split=False):
+    """
+    Executa o processamento de um arquivo dentro de um worker do pool de jobs. Com 'split', o
+    arquivo é tratado como um lote de várias notas (ver NotaFiscalProcessor.process_batch).
+    """
+    processor = registry.get()
+    if split:
+        result = processor.process_batch(filepath, pages=pages, debug=debug, job_id=job_id)
+    else:
+        result = processor.process_document(filepath, pages=pages, debug=debug, job_id=job_id)
+    if cache_key and not result_has_error(result):
+        result_cache.put(cache_key, result)
+    return result
+
+# Resultados já processados, indexados pelo hash do conteúdo (configurável por OCR_RESULT_CACHE_*)
+result_cache = ResultCache()
+
+# Pool de workers para processamento assíncrono (configurável por OCR_JOB_WORKERS)
+job_manager = JobManager(run_processing_job)
+
 @app.route('/api/process-invoice', methods=['POST'])
 def process_invoice():
+    if not registry.is_ready() and not registry.initialize():
+        return jsonify({'error': 'Serviço indisponível: processador não configurado'}), 503
     try:
         # Verifica se há arquivo na requisição
         if 'file' not in request.files:
@@ -31,38 +126,136 @@ def process_invoice():
         if file.filename == '':
             return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
 
+        try:
+            pages = parse_page_spec(request.form.get('pages'))
+        except ValueError as e:
+            return jsonify({'error': f'Parâmetro pages inválido: {e}'}), 400
+
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            filepath = unique_upload_path(file.filename)
+            # O arquivo é removido ao final em qualquer caso, inclusive se o processamento falhar
+            try:
+                content_hash = save_upload(file, filepath)
 
-            print(f"[INFO] Arquivo recebido: {filename}")
+                logger.info(f"Arquivo recebido: {os.path.basename(filepath)}")
 
-            # Processamento
-            processor = NotaFiscalProcessor()
-            result = processor.process_document(filepath)
+                debug = parse_form_flag(request.form.get('debug'))
+                cache_key = result_cache_key(content_hash, pages)
+                # Com depuração solicitada o arquivo é reprocessado para gerar as imagens
+                cached = result_cache.get(cache_key) if not debug else None
+                if cached is not None:
+                    logger.info("Resultado obtido do cache (arquivo já processado).")
+                    return jsonify(cached)
 
-            # Remove arquivo após o processamento
-            os.remove(filepath)
+                # Processamento com o processador compartilhado (já inicializado)
+                JOBS_IN_FLIGHT.labels(mode='sync').inc()
+                try:
+                    result = registry.get().process_document(filepath, pages=pages, debug=debug)
+                finally:
+                    JOBS_IN_FLIGHT.labels(mode='sync').dec()
+            finally:
+                remove_upload(filepath)
+
+            if not result_has_error(result):
+                result_cache.put(cache_key, result)
 
             if result:
-                print("[INFO] Dados extraídos com sucesso.")
+                logger.info("Dados extraídos com sucesso.")
                 return jsonify(result)
             else:
-                print("[WARNING] Falha na extração de dados.")
+                logger.warning("Falha na extração de dados.")
                 return jsonify({'error': 'Não foi possível extrair os dados da nota fiscal'}), 400
 
         return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
 
     except Exception as e:
-        print(f"[ERROR] Erro no processamento: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        record_error('http')
+        logger.exception(f"Erro no processamento: {str(e)}")
         return jsonify({'error': 'Erro interno no servidor'}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    if not registry.is_ready() and not registry.initialize():
+        return jsonify({'error': 'Serviço indisponível: processador não configurado'}), 503
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+
+        file = request.files['file']
+
+        if file.filename == '':
+            return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
+
+        if not allowed_file(file.filename):
+            return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
+
+        try:
+            pages = parse_page_spec(request.form.get('pages'))
+        except ValueError as e:
+            return jsonify({'error': f'Parâmetro pages inválido: {e}'}), 400
+
+        filepath = unique_upload_path(file.filename)
+        filename = os.path.basename(filepath)
+        # Depois de enfileirado, o job remove o arquivo ao terminar (cleanup_path); antes disso,
+        # qualquer saída (cache, fila cheia ou erro) remove o arquivo aqui
+        job_owns_file = False
+        try:
+            content_hash = save_upload(file, filepath)
+
+            debug = parse_form_flag(request.form.get('debug'))
+            # PDF com várias notas digitalizadas em sequência: separa e extrai cada nota
+            split = parse_form_flag(request.form.get('split')) or False
+            cache_key = result_cache_key(content_hash, pages, split)
+            cached = result_cache.get(cache_key) if not debug else None
+            if cached is not None:
+                job_id = job_manager.add_completed(cached)
+                logger.info(f"Job {job_id} concluído a partir do cache para o arquivo: {filename}")
+                return jsonify({'job_id': job_id, 'status': job_manager.get(job_id)['status']}), 202
+
+            try:
+                job_id = job_manager.submit(filepath, cleanup_path=filepath, pages=pages,
+                                            debug=debug, cache_key=cache_key, split=split)
+            except QueueFullError as e:
+                logger.warning(f"{e}")
+                return jsonify({'error': 'Servidor ocupado, tente novamente em instantes'}), 503
+            job_owns_file = True
+        finally:
+            if not job_owns_file:
+                remove_upload(filepath)
+
+        logger.info(f"Job {job_id} criado para o arquivo: {filename}")
+        return jsonify({'job_id': job_id, 'status': job_manager.get(job_id)['status']}), 202
+
+    except Exception as e:
+        record_error('http')
+        logger.exception(f"Erro ao criar job: {str(e)}")
+        return jsonify({'error': 'Erro interno no servidor'}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado ou expirado'}), 404
+    return jsonify(job)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok'})
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    status = registry.status()
+    return jsonify(status), (200 if status['pronto'] else 503)
+
 if __name__ == '__main__':
+    # Servidor de desenvolvimento. Para produção use 'python serve.py --workers N'.
+    # Com o reloader ativo este arquivo roda em dois processos; só o processo filho,
+    # que de fato atende as requisições, inicializa o processador.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        registry.initialize()
     app.run(debug=True, port=5000)
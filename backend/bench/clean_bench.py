@@ -0,0 +1,98 @@
+"""
+Compara a limpeza original do texto do OCR (um str.replace por caractere seguido de re.sub) com
+normalize_ocr_text, nos modos que unem tudo em uma linha e que preservam as linhas.
+
+Uso (a partir do diretório backend):
+    python bench/clean_bench.py                  # texto sintético de 20 páginas densas
+    python bench/clean_bench.py --pages 200 -n 5
+    python bench/clean_bench.py texto_ocr.txt    # texto próprio
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from nf_processor import OCR_REMOVED_CHARS, normalize_ocr_text  # noqa: E402
+
+
+def original_clean(text):
+    """Implementação anterior de clean_ocr_text, mantida aqui como referência."""
+    for char in OCR_REMOVED_CHARS:
+        text = text.replace(char, "")
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def synthetic_ocr_text(pages=20, seed=42):
+    """Texto parecido com a saída do Tesseract para páginas densas de itens, com colunas e ruído."""
+    rng = random.Random(seed)
+    words = ('PARAFUSO', 'SEXTAVADO', 'AÇO', 'INOX', 'CABO', 'FLEXÍVEL', 'mm', 'UN', 'CX', 'SERVIÇO',
+             'MANUTENÇÃO', 'PREVENTIVA', 'Rua', 'das', 'Flores', 'CNPJ:', 'Emitente', 'TOTAL')
+    noise = '|"$%*&()[]{}\\`~<>^'
+    page_texts = []
+    for _ in range(pages):
+        lines = []
+        for _ in range(90):
+            description = ' '.join(rng.choice(words) for _ in range(rng.randint(2, 6)))
+            if rng.random() < 0.3:
+                description = f"{rng.choice(noise)} {description} {rng.choice(noise)}"
+            gap = ' ' * rng.randint(2, 14)
+            amount = f"{rng.randint(1, 9999)},{rng.randint(0, 99):02d}"
+            lines.append(f"{rng.randint(1, 99999):05d}{gap}{description}{gap}{rng.randint(1, 50)}\t{amount}{gap}{amount}")
+            if rng.random() < 0.15:
+                lines.append('')
+        page_texts.append('\n'.join(lines))
+    return '\n\f'.join(page_texts)
+
+
+def measure(function, text, repeat):
+    function(text) # Aquecimento
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(text)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da limpeza do texto do OCR.")
+    parser.add_argument('text_file', nargs='?', help="Arquivo de texto de entrada (padrão: texto sintético).")
+    parser.add_argument('--pages', type=int, default=20, help="Páginas do texto sintético.")
+    parser.add_argument('-n', '--repeat', type=int, default=20, help="Repetições por implementação.")
+    args = parser.parse_args()
+
+    if args.text_file:
+        with open(args.text_file, encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = synthetic_ocr_text(args.pages)
+
+    variants = (
+        ('original', original_clean),
+        ('uma linha', lambda value: normalize_ocr_text(value, preserve_layout=False)),
+        ('com linhas', lambda value: normalize_ocr_text(value, preserve_layout=True)),
+    )
+    print(f"Texto: {len(text) / 1024:.0f} KB, {text.count(chr(10)) + 1} linhas, {args.repeat} repetições")
+    print(f"{'modo':<12}{'p50 (ms)':>12}{'min (ms)':>12}{'MB/s':>10}{'linhas':>10}{'caracteres':>12}")
+    results = {}
+    for name, function in variants:
+        timings, cleaned = measure(function, text, args.repeat)
+        results[name] = (statistics.median(timings), cleaned)
+        throughput = len(text.encode('utf-8')) / (1024 * 1024) / (statistics.median(timings) / 1000)
+        print(f"{name:<12}{statistics.median(timings):>12.2f}{min(timings):>12.2f}{throughput:>10.1f}"
+              f"{cleaned.count(chr(10)) + 1:>10}{len(cleaned):>12}")
+
+    if results['original'][1] != results['uma linha'][1]:
+        print("ATENÇÃO: o modo 'uma linha' não reproduz exatamente o resultado original.")
+    for name in ('uma linha', 'com linhas'):
+        print(f"Aceleração (p50, {name}): {results['original'][0] / results[name][0]:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,479 @@
+"""
+Gera um corpus sintético de notas fiscais (DANFE de NF-e e NFS-e) com gabarito, para medir
+desempenho e acurácia sem depender de documentos reais nem de rede.
+
+Cada documento é descrito uma única vez como uma lista de elementos (textos, linhas e
+retângulos em pontos de uma página A4) e materializado em um dos formatos:
+    digital  PDF com camada de texto (escrito diretamente, sem dependências)
+    scan     PDF só com imagem, simulando uma digitalização (ruído, leve inclinação)
+    photo    JPEG simulando uma foto de celular (rotação, perspectiva, iluminação, desfoque, ruído)
+
+Os valores dos campos (CNPJ e chave de acesso com dígitos verificadores válidos, datas, itens e
+totais coerentes) são gravados em '<id>.json' no formato retornado por extract_invoice_data, e o
+'manifest.json' lista todos os documentos.
+
+Uso (a partir do diretório backend):
+    python bench/corpus.py                              # 12 documentos em bench/corpus
+    python bench/corpus.py -n 40 --seed 7 --out /tmp/corpus --kinds digital,scan
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import zlib
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from field_rules import chave_check_digit, cnpj_check_digits  # noqa: E402
+
+KINDS = ('digital', 'scan', 'photo')
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842 # A4 em pontos
+
+COMPANY_PREFIXES = ('Comercial', 'Distribuidora', 'Indústria', 'Serviços', 'Tecnologia', 'Transportes', 'Papelaria')
+COMPANY_NAMES = ('Horizonte', 'Ipê Amarelo', 'São Jorge', 'Atlântico', 'Serra Azul', 'Bandeirantes', 'Paraná Sul')
+COMPANY_SUFFIXES = ('Ltda', 'S.A.', 'ME', 'EIRELI', 'Ltda EPP')
+STREETS = ('Rua das Flores', 'Avenida Brasil', 'Rua XV de Novembro', 'Avenida Paulista', 'Rua João Pessoa', 'Rua Sete de Setembro')
+CITIES = (('Curitiba', 'PR', 41), ('São Paulo', 'SP', 35), ('Porto Alegre', 'RS', 43), ('Belo Horizonte', 'MG', 31),
+          ('Florianópolis', 'SC', 42), ('Recife', 'PE', 26))
+PRODUCTS = ('Caneta esferográfica azul cx 50', 'Papel sulfite A4 75g resma', 'Grampeador de mesa 26/6', 'Cabo de rede CAT6 metro',
+            'Toner compatível HP 85A', 'Cadeira giratória executiva', 'Monitor LED 24 polegadas', 'Teclado USB ABNT2',
+            'Parafuso sextavado 8mm cento', 'Luva nitrílica tamanho M cx', 'Detergente neutro 5 litros', 'Café torrado 500g')
+SERVICES = ('Consultoria em tecnologia da informação', 'Manutenção preventiva de equipamentos', 'Desenvolvimento de software sob demanda',
+            'Treinamento de equipe', 'Suporte técnico mensal', 'Hospedagem de sistemas', 'Serviço de limpeza predial')
+
+
+# --- Valores dos campos ------------------------------------------------------------------
+
+def random_cnpj(rng):
+    base = f"{rng.randrange(10 ** 8):08d}0001"
+    return base + cnpj_check_digits(base)
+
+
+def make_chave(uf_code, issued, cnpj, number, rng, serie=1):
+    """Chave de acesso: cUF, AAMM, CNPJ, modelo 55, série, nNF, tipo de emissão, código numérico e DV."""
+    base = (f"{uf_code:02d}{issued:%y%m}{cnpj}55{serie:03d}{number:09d}1{rng.randrange(10 ** 8):08d}")
+    return base + chave_check_digit(base)
+
+
+def format_cnpj(cnpj):
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+def format_amount(value):
+    """1234.5 -> '1.234,50'."""
+    return f"{value:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def random_company(rng):
+    name = f"{rng.choice(COMPANY_PREFIXES)} {rng.choice(COMPANY_NAMES)} {rng.choice(COMPANY_SUFFIXES)}"
+    city, uf, uf_code = rng.choice(CITIES)
+    address = f"{rng.choice(STREETS)}, {rng.randint(10, 3999)} - Centro - {city}/{uf}"
+    return {'nome': name, 'cnpj': random_cnpj(rng), 'endereco': address, 'cidade': city, 'uf': uf, 'uf_code': uf_code}
+
+
+def random_invoice(rng, doc_type, item_count):
+    issuer = random_company(rng)
+    recipient = random_company(rng)
+    issued = date(2023, 1, 1) + timedelta(days=rng.randrange(700))
+    catalog = PRODUCTS if doc_type == 'nfe' else SERVICES
+    items = []
+    for _ in range(item_count):
+        quantity = float(rng.randint(1, 40)) if doc_type == 'nfe' else 1.0
+        unit = round(rng.uniform(2, 900 if doc_type == 'nfe' else 6000), 2)
+        items.append({
+            'descricao': rng.choice(catalog),
+            'quantidade': quantity,
+            'valor_unitario': unit,
+            'valor_total_item': round(quantity * unit, 2),
+        })
+    total = round(sum(item['valor_total_item'] for item in items), 2)
+    number = rng.randint(1, 999999) if doc_type == 'nfe' else rng.randint(2023000001, 2024999999)
+    chave = make_chave(issuer['uf_code'], issued, issuer['cnpj'], number, rng) if doc_type == 'nfe' else None
+    truth = {
+        'numero_nota_fiscal': str(number),
+        'data_emissao': issued.strftime('%d/%m/%Y'),
+        'valor_total': total,
+        'cnpj_emitente': issuer['cnpj'],
+        'nome_razao_social_emitente': issuer['nome'],
+        'endereco_emitente': issuer['endereco'],
+        'chave_acesso': chave,
+        'itens': items,
+    }
+    return truth, issuer, recipient, issued
+
+
+# --- Layout ---------------------------------------------------------------------------------
+
+class Layout:
+    """Elementos de cada página, em pontos com origem no canto superior esquerdo."""
+
+    def __init__(self):
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.pages.append([])
+
+    def text(self, x, y, value, size=8, bold=False):
+        self.pages[-1].append(('text', x, y, size, bold, value))
+
+    def label_value(self, x, y, label, value, size=8):
+        self.text(x, y, label, size=6)
+        self.text(x, y + size + 2, value, size=size, bold=True)
+
+    def line(self, x1, y1, x2, y2):
+        self.pages[-1].append(('line', x1, y1, x2, y2))
+
+    def rect(self, x, y, width, height):
+        self.pages[-1].append(('rect', x, y, width, height))
+
+
+ITEM_ROW_HEIGHT = 12
+ITEM_HEADER_HEIGHT = 16
+
+
+def _rows_fitting(top, bottom):
+    return (bottom - top - ITEM_HEADER_HEIGHT) // ITEM_ROW_HEIGHT + 1
+
+
+def _item_rows(items, top, bottom, draw_header, draw_row):
+    """Escreve o cabeçalho e as linhas de itens até 'bottom'; retorna os itens que não couberam."""
+    draw_header(top)
+    y = top + ITEM_HEADER_HEIGHT
+    for index, item in enumerate(items):
+        if y > bottom:
+            return items[index:]
+        draw_row(y, item)
+        y += ITEM_ROW_HEIGHT
+    return []
+
+
+def danfe_layout(truth, issuer, recipient, issued, rng):
+    layout = Layout()
+    chave = truth['chave_acesso']
+    number = int(truth['numero_nota_fiscal'])
+    overflow = max(0, len(truth['itens']) - _rows_fitting(308, 780))
+    total_pages = 1 + -(-overflow // _rows_fitting(150, 780))
+
+    def page_header(page):
+        layout.rect(30, 30, 535, 110)
+        layout.text(40, 42, 'EMITENTE', size=6)
+        layout.text(40, 54, issuer['nome'], size=11, bold=True)
+        layout.text(40, 72, issuer['endereco'], size=7)
+        layout.text(40, 84, f"CNPJ: {format_cnpj(issuer['cnpj'])}", size=8)
+        layout.text(40, 96, f"Inscrição Estadual: {rng.randrange(10 ** 9):09d}", size=7)
+        layout.text(300, 42, 'DANFE', size=12, bold=True)
+        layout.text(300, 58, 'Documento Auxiliar da Nota Fiscal Eletrônica', size=6)
+        layout.text(300, 70, '0 - ENTRADA  1 - SAÍDA   [1]', size=6)
+        digits = f"{number:09d}"
+        layout.text(300, 84, f"Nº {digits[:3]}.{digits[3:6]}.{digits[6:]}", size=10, bold=True)
+        layout.text(300, 98, 'SÉRIE 001', size=8)
+        layout.text(300, 110, f"Folha {page}/{total_pages}", size=7)
+        layout.line(30, 122, 565, 122)
+        layout.text(40, 126, 'CHAVE DE ACESSO', size=6)
+        layout.text(120, 126, ' '.join(chave[i:i + 4] for i in range(0, 44, 4)), size=8, bold=True)
+
+    page_header(1)
+    layout.label_value(40, 150, 'NATUREZA DA OPERAÇÃO', 'Venda de mercadoria adquirida de terceiros')
+    layout.label_value(330, 150, 'PROTOCOLO DE AUTORIZAÇÃO DE USO',
+                       f"1{rng.randrange(10 ** 14):014d} {issued:%d/%m/%Y} 10:{rng.randint(10, 59)}:{rng.randint(10, 59)}")
+    layout.rect(30, 175, 535, 70)
+    layout.text(40, 180, 'DESTINATÁRIO / REMETENTE', size=7, bold=True)
+    layout.label_value(40, 192, 'NOME / RAZÃO SOCIAL', recipient['nome'])
+    layout.label_value(330, 192, 'CNPJ / CPF', format_cnpj(recipient['cnpj']))
+    layout.label_value(40, 216, 'ENDEREÇO', recipient['endereco'])
+    layout.label_value(460, 216, 'DATA DA EMISSÃO', truth['data_emissao'])
+
+    subtotal = truth['valor_total']
+    layout.rect(30, 252, 535, 48)
+    layout.text(40, 256, 'CÁLCULO DO IMPOSTO', size=7, bold=True)
+    layout.label_value(40, 268, 'BASE DE CÁLCULO DO ICMS', format_amount(subtotal))
+    layout.label_value(170, 268, 'VALOR DO ICMS', format_amount(round(subtotal * 0.18, 2)))
+    layout.label_value(290, 268, 'VALOR TOTAL DOS PRODUTOS', format_amount(subtotal))
+    layout.label_value(440, 268, 'VALOR TOTAL DA NOTA', format_amount(subtotal))
+
+    def draw_header(y):
+        layout.text(40, y, 'DADOS DOS PRODUTOS / SERVIÇOS', size=7, bold=True)
+        layout.text(40, y + 9, 'CÓDIGO', size=6)
+        layout.text(90, y + 9, 'DESCRIÇÃO DO PRODUTO / SERVIÇO', size=6)
+        layout.text(330, y + 9, 'QTD', size=6)
+        layout.text(380, y + 9, 'V. UNITÁRIO', size=6)
+        layout.text(470, y + 9, 'V. TOTAL', size=6)
+        layout.line(30, y + 18, 565, y + 18)
+
+    def draw_row(y, item):
+        layout.text(40, y + 8, f"{rng.randrange(10 ** 5):05d}", size=7)
+        layout.text(90, y + 8, item['descricao'], size=7)
+        layout.text(330, y + 8, format_amount(item['quantidade']).replace(',00', ''), size=7)
+        layout.text(380, y + 8, format_amount(item['valor_unitario']), size=7)
+        layout.text(470, y + 8, format_amount(item['valor_total_item']), size=7)
+
+    remaining = _item_rows(truth['itens'], 308, 780, draw_header, draw_row)
+    page = 1
+    while remaining:
+        page += 1
+        layout.new_page()
+        page_header(page)
+        remaining = _item_rows(remaining, 150, 780, draw_header, draw_row)
+    return layout
+
+
+def nfse_layout(truth, issuer, recipient, issued, rng):
+    layout = Layout()
+    layout.rect(30, 30, 535, 70)
+    layout.text(40, 40, f"PREFEITURA MUNICIPAL DE {issuer['cidade'].upper()}", size=11, bold=True)
+    layout.text(40, 56, 'SECRETARIA MUNICIPAL DE FINANÇAS', size=7)
+    layout.text(40, 70, 'NOTA FISCAL DE SERVIÇOS ELETRÔNICA - NFS-e', size=9, bold=True)
+    layout.label_value(400, 38, 'Número da NFS-e', truth['numero_nota_fiscal'], size=10)
+    layout.label_value(400, 64, 'Data e Hora de Emissão',
+                       f"{truth['data_emissao']} {rng.randint(8, 18):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}")
+    layout.text(40, 106, f"Código de Verificação: {rng.randrange(16 ** 8):08X}", size=7)
+    layout.text(300, 106, f"RPS Nº {rng.randint(1, 9999)}  Série A  Emitido em {(issued - timedelta(days=1)):%d/%m/%Y}", size=7)
+
+    for top, title, company in ((122, 'PRESTADOR DE SERVIÇOS', issuer), (202, 'TOMADOR DE SERVIÇOS', recipient)):
+        layout.rect(30, top, 535, 72)
+        layout.text(40, top + 6, title, size=8, bold=True)
+        layout.label_value(40, top + 18, 'Nome/Razão Social', company['nome'])
+        layout.label_value(330, top + 18, 'CPF/CNPJ', format_cnpj(company['cnpj']))
+        layout.label_value(40, top + 42, 'Endereço', company['endereco'])
+
+    def draw_header(y):
+        layout.text(40, y, 'DISCRIMINAÇÃO DOS SERVIÇOS', size=8, bold=True)
+        layout.text(380, y, 'VALOR (R$)', size=7)
+        layout.line(30, y + 12, 565, y + 12)
+
+    def draw_row(y, item):
+        layout.text(40, y + 6, item['descricao'], size=8)
+        layout.text(380, y + 6, format_amount(item['valor_total_item']), size=8)
+
+    remaining = _item_rows(truth['itens'], 282, 690, draw_header, draw_row)
+    while remaining:
+        layout.new_page()
+        layout.text(40, 40, f"NFS-e {truth['numero_nota_fiscal']} - continuação", size=9, bold=True)
+        remaining = _item_rows(remaining, 60, 690, draw_header, draw_row)
+
+    total = format_amount(truth['valor_total'])
+    layout.rect(30, 700, 535, 60)
+    layout.label_value(40, 708, 'VALOR TOTAL DA NOTA', f"R$ {total}", size=10)
+    layout.label_value(200, 708, 'Base de Cálculo', total)
+    layout.label_value(330, 708, 'Alíquota', '5,00%')
+    layout.label_value(430, 708, 'Valor do ISS', format_amount(round(truth['valor_total'] * 0.05, 2)))
+    layout.text(40, 740, 'Valor Líquido da Nota: R$ ' + total, size=8)
+    return layout
+
+
+# --- PDF com camada de texto --------------------------------------------------------------
+
+def _pdf_string(value):
+    encoded = value.encode('cp1252', errors='replace')
+    return b'(' + encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _content_stream(elements):
+    ops = [b'0.5 w']
+    for element in elements:
+        kind = element[0]
+        if kind == 'text':
+            _, x, y, size, bold, value = element
+            font = b'/F2' if bold else b'/F1'
+            ops.append(b'BT %s %d Tf %.2f %.2f Td %s Tj ET' % (font, size, x, PAGE_HEIGHT - y - size, _pdf_string(value)))
+        elif kind == 'line':
+            _, x1, y1, x2, y2 = element
+            ops.append(b'%.2f %.2f m %.2f %.2f l S' % (x1, PAGE_HEIGHT - y1, x2, PAGE_HEIGHT - y2))
+        elif kind == 'rect':
+            _, x, y, width, height = element
+            ops.append(b'%.2f %.2f %.2f %.2f re S' % (x, PAGE_HEIGHT - y - height, width, height))
+    return b'\n'.join(ops)
+
+
+def write_text_pdf(layout, path):
+    """PDF mínimo (fontes Helvetica padrão, WinAnsiEncoding) com uma página por página do layout."""
+    objects = [None, None] # 1: catálogo, 2: árvore de páginas
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+    page_ids = []
+    for elements in layout.pages:
+        stream = zlib.compress(_content_stream(elements))
+        objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        content_id = len(objects)
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                       b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>' % (PAGE_WIDTH, PAGE_HEIGHT, content_id))
+        page_ids.append(len(objects))
+    objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % i for i in page_ids), len(page_ids))
+
+    output = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    output += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(output)
+
+
+# --- Versões rasterizadas ---------------------------------------------------------------------
+
+_font_cache = {}
+
+
+def _font(size_px, bold):
+    from PIL import ImageFont
+
+    key = (size_px, bold)
+    if key not in _font_cache:
+        names = ('DejaVuSans-Bold.ttf', 'arialbd.ttf') if bold else ('DejaVuSans.ttf', 'arial.ttf')
+        for name in names:
+            try:
+                _font_cache[key] = ImageFont.truetype(name, size_px)
+                break
+            except OSError:
+                continue
+        else:
+            _font_cache[key] = ImageFont.load_default(size=size_px)
+    return _font_cache[key]
+
+
+def render_page(elements, dpi):
+    """Rasteriza uma página do layout em tons de cinza."""
+    from PIL import Image, ImageDraw
+
+    scale = dpi / 72
+    page = Image.new('L', (int(PAGE_WIDTH * scale), int(PAGE_HEIGHT * scale)), 255)
+    draw = ImageDraw.Draw(page)
+    width = max(1, round(0.6 * scale))
+    for element in elements:
+        kind = element[0]
+        if kind == 'text':
+            _, x, y, size, bold, value = element
+            draw.text((x * scale, y * scale), value, fill=20, font=_font(max(6, round(size * scale)), bold))
+        elif kind == 'line':
+            _, x1, y1, x2, y2 = element
+            draw.line((x1 * scale, y1 * scale, x2 * scale, y2 * scale), fill=40, width=width)
+        elif kind == 'rect':
+            _, x, y, w, h = element
+            draw.rectangle((x * scale, y * scale, (x + w) * scale, (y + h) * scale), outline=40, width=width)
+    return page
+
+
+def _add_noise(image, rng, amount):
+    import numpy as np
+
+    noise = np.random.default_rng(rng.randrange(2 ** 32)).normal(0, amount, (image.height, image.width))
+    array = np.clip(np.asarray(image, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    from PIL import Image
+    return Image.fromarray(array, mode='L')
+
+
+def scan_effect(page, rng):
+    """Digitalização: leve inclinação, fundo acinzentado, ruído e compressão."""
+    from PIL import Image, ImageFilter
+
+    page = page.rotate(rng.uniform(-1.2, 1.2), resample=Image.Resampling.BICUBIC, expand=False, fillcolor=255)
+    page = page.point(lambda v: int(v * 0.88 + 18))
+    page = page.filter(ImageFilter.GaussianBlur(rng.uniform(0.3, 0.7)))
+    return _add_noise(page, rng, 6)
+
+
+def photo_effect(page, rng):
+    """Foto de celular: perspectiva, rotação, iluminação desigual, desfoque e ruído colorido."""
+    import numpy as np
+    from PIL import Image, ImageFilter
+
+    width, height = page.size
+    margin = int(width * 0.06)
+    jitter = lambda: rng.randint(0, margin) # noqa: E731
+    # Quadrilátero de origem (cantos da página vistos em perspectiva)
+    quad = (jitter(), jitter(), jitter(), height - jitter(), width - jitter(), height - jitter(), width - jitter(), jitter())
+    canvas = Image.new('L', (width + 2 * margin, height + 2 * margin), 90)
+    canvas.paste(page, (margin, margin))
+    quad = tuple(value + margin for value in quad)
+    page = canvas.transform((width, height), Image.Transform.QUAD, quad, resample=Image.Resampling.BICUBIC)
+    page = page.rotate(rng.uniform(-4, 4), resample=Image.Resampling.BICUBIC, expand=True, fillcolor=90)
+
+    array = np.asarray(page, dtype=np.float32)
+    ys, xs = np.mgrid[0:array.shape[0], 0:array.shape[1]]
+    cx, cy = rng.uniform(0.2, 0.8) * array.shape[1], rng.uniform(0.2, 0.8) * array.shape[0]
+    distance = np.hypot(xs - cx, ys - cy) / max(array.shape)
+    array = array * (1.0 - 0.45 * distance) # Iluminação mais fraca longe da fonte de luz
+    gray = Image.fromarray(np.clip(array, 0, 255).astype(np.uint8), mode='L')
+    gray = gray.filter(ImageFilter.GaussianBlur(rng.uniform(0.8, 1.6)))
+    gray = _add_noise(gray, rng, 9)
+    tint = (rng.uniform(0.95, 1.0), rng.uniform(0.92, 0.98), rng.uniform(0.82, 0.92))
+    return Image.merge('RGB', [gray.point(lambda v, t=t: int(v * t)) for t in tint])
+
+
+# --- Geração do corpus --------------------------------------------------------------------------
+
+def build_document(doc_id, kind, rng, out_dir, multi_page=False):
+    doc_type = rng.choice(('nfe', 'nfse'))
+    item_count = rng.randint(40, 70) if multi_page else rng.randint(1, 8)
+    truth, issuer, recipient, issued = random_invoice(rng, doc_type, item_count)
+    layout = (danfe_layout if doc_type == 'nfe' else nfse_layout)(truth, issuer, recipient, issued, rng)
+
+    if kind == 'digital':
+        filename = f"{doc_id}.pdf"
+        write_text_pdf(layout, os.path.join(out_dir, filename))
+    elif kind == 'scan':
+        filename = f"{doc_id}.pdf"
+        pages = [scan_effect(render_page(elements, 200), rng) for elements in layout.pages]
+        pages[0].save(os.path.join(out_dir, filename), 'PDF', resolution=200, save_all=True, append_images=pages[1:])
+    else:
+        filename = f"{doc_id}.jpg"
+        photo_effect(render_page(layout.pages[0], 150), rng).save(os.path.join(out_dir, filename), quality=rng.randint(70, 88))
+
+    with open(os.path.join(out_dir, f"{doc_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(truth, f, ensure_ascii=False, indent=2)
+    return {
+        'id': doc_id,
+        'arquivo': filename,
+        'gabarito': f"{doc_id}.json",
+        'formato': kind,
+        'tipo': doc_type,
+        'paginas': len(layout.pages),
+        'itens': item_count,
+    }
+
+
+def generate_corpus(out_dir, count=12, seed=42, kinds=KINDS, multi_page_ratio=0.25):
+    """Gera 'count' documentos alternando os formatos em 'kinds'; retorna o manifesto."""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    documents = []
+    for index in range(count):
+        kind = kinds[index % len(kinds)]
+        multi_page = kind != 'photo' and rng.random() < multi_page_ratio # Fotos têm sempre uma página
+        documents.append(build_document(f"nf_{index:04d}_{kind}", kind, rng, out_dir, multi_page=multi_page))
+    manifest = {'seed': seed, 'gerado_em': datetime.now().isoformat(timespec='seconds'), 'documentos': documents}
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um corpus sintético de notas fiscais com gabarito.")
+    parser.add_argument('--out', default=os.path.join(BACKEND_DIR, 'bench', 'corpus'), help="Diretório de saída.")
+    parser.add_argument('-n', '--count', type=int, default=12, help="Quantidade de documentos.")
+    parser.add_argument('--seed', type=int, default=42, help="Semente (o mesmo valor gera o mesmo corpus).")
+    parser.add_argument('--kinds', default=','.join(KINDS), help="Formatos, separados por vírgula: digital, scan, photo.")
+    parser.add_argument('--multi-page-ratio', type=float, default=0.25, help="Fração de PDFs com várias páginas de itens.")
+    args = parser.parse_args()
+
+    kinds = tuple(kind.strip() for kind in args.kinds.split(',') if kind.strip())
+    unknown = set(kinds) - set(KINDS)
+    if unknown or not kinds:
+        parser.error(f"Formatos inválidos: {', '.join(sorted(unknown)) or '(nenhum)'}")
+
+    manifest = generate_corpus(args.out, args.count, args.seed, kinds, args.multi_page_ratio)
+    pages = sum(doc['paginas'] for doc in manifest['documentos'])
+    print(f"{len(manifest['documentos'])} documento(s), {pages} página(s) gravados em {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Substituto local e determinístico do cliente da OpenAI para benchmarks.
+
+Implementa apenas a parte da interface usada pelo processador (client.chat.completions.create) e
+faz o papel de um modelo ideal: responde com o gabarito do documento em processamento ('truth',
+definido pelo benchmark a partir do manifesto do corpus), mas só com os valores que estão legíveis
+no texto recebido. Assim a acurácia medida reflete o que o pipeline perde (OCR, compressão do
+texto, campos preenchidos pelas regras de field_rules), sem comparar as regras com elas mesmas.
+A mesma entrada sempre produz a mesma resposta, sem rede e sem custo; a latência de uma chamada
+real pode ser simulada com 'latency_ms'.
+"""
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from corpus import format_amount
+
+TEXT_BLOCK_PATTERN = re.compile(r'```text\n(.*?)\n```', re.DOTALL)
+NUMBER_TOKEN_PATTERN = re.compile(r'\d[\d.]*')
+
+
+def _normalize(value):
+    return ' '.join(str(value).split()).casefold()
+
+
+def answer_from_truth(truth, text):
+    """
+    Resposta do modelo ideal: os campos do gabarito que aparecem no texto (CNPJ e chave pelos
+    dígitos, valores no formato brasileiro, nomes sem diferenciar maiúsculas); os demais ficam nulos.
+    """
+    truth = truth or {}
+    flat = _normalize(text)
+    digits = re.sub(r'\D', '', text)
+    numbers = {token.replace('.', '').lstrip('0') for token in NUMBER_TOKEN_PATTERN.findall(text)}
+
+    def legible(name, value):
+        if value is None:
+            return False
+        if name in ('cnpj_emitente', 'chave_acesso'):
+            return value in digits
+        if name == 'numero_nota_fiscal':
+            return value.lstrip('0') in numbers
+        if name == 'valor_total':
+            return format_amount(value) in text
+        return _normalize(value) in flat
+
+    answer = {name: value if legible(name, value) else None for name, value in truth.items() if name != 'itens'}
+    answer['itens'] = [dict(item) for item in truth.get('itens') or []
+                       if format_amount(item['valor_total_item']) in text and legible('descricao', item['descricao'])]
+    return answer
+
+
+class _Completions:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, model=None, messages=(), **kwargs):
+        user = next((message['content'] for message in reversed(messages) if message.get('role') == 'user'), '')
+        block = TEXT_BLOCK_PATTERN.search(user)
+        answer = answer_from_truth(self._client.truth, block.group(1) if block else user)
+        if self._client.latency_ms:
+            time.sleep(self._client.latency_ms / 1000)
+        with self._client._lock:
+            self._client.calls += 1
+        content = json.dumps(answer, ensure_ascii=False)
+        prompt_tokens = sum(len(message.get('content') or '') for message in messages) // 4
+        return SimpleNamespace(
+            model=model or self._client.model,
+            choices=[SimpleNamespace(index=0, finish_reason='stop',
+                                     message=SimpleNamespace(role='assistant', content=content, tool_calls=None))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(content) // 4,
+                                  total_tokens=prompt_tokens + len(content) // 4),
+        )
+
+
+class MockLLMClient:
+    """Cliente com a interface de openai.chat.completions usado no lugar da API nos benchmarks."""
+
+    model = 'mock-local'
+
+    def __init__(self, latency_ms=0):
+        self.latency_ms = latency_ms
+        self.truth = None # Gabarito do documento em processamento (ver answer_from_truth)
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_Completions(self))
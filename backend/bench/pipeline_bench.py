@@ -0,0 +1,379 @@
+"""
+Benchmark de ponta a ponta do processamento de notas fiscais sobre um corpus com gabarito.
+
+Processa cada documento do corpus (ver corpus.py) diretamente com NotaFiscalProcessor.process_document
+ou pelo endpoint Flask /api/process-invoice e reporta, em texto e em JSON:
+    - latência p50/p95/p99 do documento e de cada etapa (rasterize, preprocess, ocr, llm, ...);
+    - páginas por segundo e pico de memória residente;
+    - acurácia por campo em relação ao gabarito.
+
+Por padrão a chamada à OpenAI é substituída por um modelo local determinístico (mock_llm), que
+responde com os valores do gabarito legíveis no texto recebido, de modo que a execução não precisa
+de rede nem gera custo; use --real-llm para medir a API real.
+O modo --compare aponta regressões em relação a um resultado salvo e sai com código 1.
+
+Uso (a partir do diretório backend):
+    python bench/pipeline_bench.py --out bench/results/atual.json
+    python bench/pipeline_bench.py --mode http --repeat 3 --llm-latency-ms 800
+    python bench/pipeline_bench.py --compare bench/results/base.json --out bench/results/atual.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from preprocess_bench import peak_rss_mb  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(BENCH_DIR, 'corpus')
+SCALAR_FIELDS = ('numero_nota_fiscal', 'data_emissao', 'valor_total', 'cnpj_emitente',
+                 'nome_razao_social_emitente', 'endereco_emitente', 'chave_acesso')
+
+
+# --- Estatísticas e acurácia ---------------------------------------------------------------------
+
+def percentile(values, fraction):
+    """Percentil com interpolação linear (fraction entre 0 e 1)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values):
+    return {
+        'n': len(values),
+        'p50_ms': percentile(values, 0.50),
+        'p95_ms': percentile(values, 0.95),
+        'p99_ms': percentile(values, 0.99),
+        'max_ms': max(values) if values else None,
+    }
+
+
+def _normalize(value):
+    if value is None:
+        return None
+    return ' '.join(str(value).split()).casefold()
+
+
+def field_matches(name, expected, actual):
+    if expected is None:
+        return actual in (None, '')
+    if actual is None:
+        return False
+    if name == 'valor_total':
+        try:
+            return abs(float(actual) - float(expected)) < 0.01
+        except (TypeError, ValueError):
+            return False
+    if name in ('cnpj_emitente', 'chave_acesso'):
+        return ''.join(filter(str.isdigit, str(actual))) == expected
+    if name == 'numero_nota_fiscal':
+        return str(actual).lstrip('0') == expected.lstrip('0')
+    return _normalize(actual) == _normalize(expected)
+
+
+def items_score(expected, actual):
+    """Fração dos itens esperados encontrados no resultado (pelo valor total do item)."""
+    if not expected:
+        return None
+    remaining = [item.get('valor_total_item') for item in (actual or []) if isinstance(item, dict)]
+    found = 0
+    for item in expected:
+        for index, value in enumerate(remaining):
+            try:
+                if value is not None and abs(float(value) - item['valor_total_item']) < 0.01:
+                    found += 1
+                    del remaining[index]
+                    break
+            except (TypeError, ValueError):
+                continue
+    return found / len(expected)
+
+
+def score_document(truth, result):
+    scores = {}
+    for name in SCALAR_FIELDS:
+        scores[name] = 1.0 if field_matches(name, truth.get(name), (result or {}).get(name)) else 0.0
+    item_score = items_score(truth.get('itens'), (result or {}).get('itens'))
+    if item_score is not None:
+        scores['itens'] = item_score
+    return scores
+
+
+# --- Execução ----------------------------------------------------------------------------------------
+
+def load_corpus(corpus_dir, count, seed):
+    manifest_path = os.path.join(corpus_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        from corpus import generate_corpus
+        print(f"Corpus não encontrado em {corpus_dir}; gerando {count} documento(s) com semente {seed}...")
+        generate_corpus(corpus_dir, count=count, seed=seed)
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    documents = []
+    for doc in manifest['documentos']:
+        with open(os.path.join(corpus_dir, doc['gabarito']), encoding='utf-8') as f:
+            documents.append(dict(doc, path=os.path.join(corpus_dir, doc['arquivo']), truth=json.load(f)))
+    return documents
+
+
+def count_pages(doc, pages):
+    """Páginas efetivamente processadas do documento com a seleção informada."""
+    from nf_processor import parse_page_spec
+    selection = parse_page_spec(pages) or parse_page_spec(os.getenv('OCR_DEFAULT_PAGES', 'all'))
+    if selection is None:
+        return 1
+    if selection == 'all':
+        max_pages = int(os.getenv('OCR_MAX_PAGES', '20'))
+        return min(doc['paginas'], max_pages) if max_pages else doc['paginas']
+    return len([page for page in selection if page <= doc['paginas']])
+
+
+def parse_server_timing(header):
+    """'ocr;dur=12.5, llm;dur=3.0' -> {'ocr': 12.5, 'llm': 3.0} (ms)."""
+    timings = {}
+    for entry in (header or '').split(','):
+        parts = [part.strip() for part in entry.split(';')]
+        for part in parts[1:]:
+            if part.startswith('dur='):
+                timings[parts[0]] = float(part[4:])
+    return timings
+
+
+def make_processor(args):
+    from nf_processor import NotaFiscalProcessor
+    if args.real_llm:
+        return NotaFiscalProcessor()
+    from mock_llm import MockLLMClient
+    return NotaFiscalProcessor(llm_client=MockLLMClient(latency_ms=args.llm_latency_ms))
+
+
+def run_processor(processor, doc, pages):
+    from metrics import collect_timings
+    start = time.perf_counter()
+    with collect_timings() as timings:
+        result = processor.process_document(doc['path'], pages=pages)
+    elapsed = (time.perf_counter() - start) * 1000
+    return result, elapsed, {stage: seconds * 1000 for stage, seconds in timings.durations.items()}
+
+
+def run_http(client, doc, pages):
+    start = time.perf_counter()
+    with open(doc['path'], 'rb') as f:
+        response = client.post('/api/process-invoice', data={'file': (f, os.path.basename(doc['path'])), 'pages': pages or ''})
+    elapsed = (time.perf_counter() - start) * 1000
+    result = response.get_json(silent=True) or {}
+    if response.status_code != 200 and 'erro' not in result:
+        result = {'erro': result.get('error') or f"HTTP {response.status_code}"}
+    return result, elapsed, parse_server_timing(response.headers.get('Server-Timing'))
+
+
+def run_benchmark(args):
+    documents = load_corpus(args.corpus, args.count, args.seed)
+    # As repetições mediriam o cache de respostas do modelo, e não a extração
+    os.environ['OCR_LLM_CACHE_SIZE'] = '0'
+    processor = make_processor(args)
+
+    if args.mode == 'http':
+        # Cada repetição precisa reprocessar o arquivo, então o cache de resultados é desativado
+        os.environ['OCR_RESULT_CACHE_SIZE'] = '0'
+        import app as app_module
+        app_module.registry.factory = lambda: processor
+        app_module.registry.initialize()
+        client = app_module.app.test_client()
+        execute = lambda doc: run_http(client, doc, args.pages)  # noqa: E731
+    else:
+        execute = lambda doc: run_processor(processor, doc, args.pages)  # noqa: E731
+
+    def run(doc):
+        if not args.real_llm:
+            processor.llm_client.truth = doc['truth'] # O modelo local responde com o gabarito do documento
+        return execute(doc)
+
+    run(documents[0]) # Aquecimento: carrega modelos e caches antes de medir
+
+    records = []
+    start = time.perf_counter()
+    for repetition in range(args.repeat):
+        for doc in documents:
+            result, elapsed, stages = run(doc)
+            pages = count_pages(doc, args.pages)
+            record = {
+                'id': doc['id'], 'formato': doc['formato'], 'tipo': doc['tipo'], 'paginas': pages,
+                'repeticao': repetition, 'total_ms': elapsed, 'etapas_ms': stages,
+                'erro': (result or {}).get('erro') if isinstance(result, dict) else 'resultado inválido',
+                'acuracia': score_document(doc['truth'], result if isinstance(result, dict) else None),
+            }
+            records.append(record)
+            if args.verbose:
+                print(f"{doc['id']:<24}{elapsed:>10.1f} ms  {record['erro'] or ''}")
+    wall = time.perf_counter() - start
+    return build_report(args, records, wall, processor)
+
+
+def build_report(args, records, wall_seconds, processor):
+    stages = {}
+    for record in records:
+        for stage, value in record['etapas_ms'].items():
+            stages.setdefault(stage, []).append(value)
+    accuracy = {}
+    for record in records:
+        for name, score in record['acuracia'].items():
+            accuracy.setdefault(name, []).append(score)
+    by_format = {}
+    for record in records:
+        by_format.setdefault(record['formato'], []).append(record['total_ms'])
+    total_pages = sum(record['paginas'] for record in records)
+
+    return {
+        'meta': {
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'modo': args.mode,
+            'llm': 'openai' if args.real_llm else f"mock gabarito ({args.llm_latency_ms} ms)",
+            'paginas': args.pages or 'primeira',
+            'repeticoes': args.repeat,
+            'corpus': os.path.abspath(args.corpus),
+            'cache_namespace': processor.cache_namespace(),
+        },
+        'resumo': {
+            'documentos': len(records),
+            'paginas': total_pages,
+            'paginas_por_segundo': total_pages / wall_seconds if wall_seconds else None,
+            'erros': sum(1 for record in records if record['erro']),
+            'pico_rss_mb': peak_rss_mb(),
+            'latencia': summarize([record['total_ms'] for record in records]),
+            'acuracia_media': _mean([_mean(scores) for scores in accuracy.values()]),
+        },
+        'etapas': {stage: summarize(values) for stage, values in sorted(stages.items())},
+        'por_formato': {name: summarize(values) for name, values in sorted(by_format.items())},
+        'acuracia': {name: _mean(scores) for name, scores in accuracy.items()},
+        'documentos': records,
+    }
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# --- Relatório e comparação ---------------------------------------------------------------------------
+
+def _fmt(value, spec='.1f'):
+    return '-' if value is None else format(value, spec)
+
+
+def print_report(report):
+    summary = report['resumo']
+    meta = report['meta']
+    print(f"\nModo: {meta['modo']}  LLM: {meta['llm']}  páginas: {meta['paginas']}  commit: {meta['commit'] or '-'}")
+    print(f"Documentos: {summary['documentos']}  páginas: {summary['paginas']}  erros: {summary['erros']}  "
+          f"páginas/s: {_fmt(summary['paginas_por_segundo'], '.2f')}  pico RSS: {_fmt(summary['pico_rss_mb'])} MB")
+    print(f"\n{'etapa':<14}{'n':>6}{'p50 (ms)':>12}{'p95 (ms)':>12}{'p99 (ms)':>12}")
+    rows = [('documento', summary['latencia'])] + list(report['etapas'].items())
+    rows += [(f"[{name}]", stats) for name, stats in report['por_formato'].items()]
+    for name, stats in rows:
+        print(f"{name:<14}{stats['n']:>6}{_fmt(stats['p50_ms']):>12}{_fmt(stats['p95_ms']):>12}{_fmt(stats['p99_ms']):>12}")
+    print(f"\n{'campo':<30}{'acurácia':>10}")
+    for name, value in report['acuracia'].items():
+        print(f"{name:<30}{_fmt(value * 100 if value is not None else None):>9}%")
+
+
+def compare_reports(baseline, current, threshold=0.10, min_ms=5.0, accuracy_drop=0.02):
+    """
+    Lista as regressões do resultado atual em relação à base: latências (p50/p95 do documento e
+    p95 de cada etapa) acima de 'threshold' e de 'min_ms', queda de páginas/s acima de 'threshold'
+    e queda de acurácia de algum campo acima de 'accuracy_drop'.
+    """
+    regressions = []
+
+    def check_latency(label, old, new):
+        if old is None or new is None:
+            return
+        if new > old * (1 + threshold) and new - old > min_ms:
+            regressions.append(f"{label}: {old:.1f} ms -> {new:.1f} ms (+{(new / old - 1) * 100:.0f}%)")
+
+    for key in ('p50_ms', 'p95_ms'):
+        check_latency(f"documento {key}", baseline['resumo']['latencia'][key], current['resumo']['latencia'][key])
+    for stage, stats in current['etapas'].items():
+        if stage in baseline['etapas']:
+            check_latency(f"{stage} p95_ms", baseline['etapas'][stage]['p95_ms'], stats['p95_ms'])
+
+    old_rate, new_rate = baseline['resumo']['paginas_por_segundo'], current['resumo']['paginas_por_segundo']
+    if old_rate and new_rate and new_rate < old_rate * (1 - threshold):
+        regressions.append(f"páginas/s: {old_rate:.2f} -> {new_rate:.2f}")
+
+    for name, old in baseline['acuracia'].items():
+        new = current['acuracia'].get(name)
+        if old is not None and new is not None and new < old - accuracy_drop:
+            regressions.append(f"acurácia de {name}: {old * 100:.1f}% -> {new * 100:.1f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta do processamento de notas fiscais.")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="Diretório do corpus (gerado se não existir).")
+    parser.add_argument('--count', type=int, default=12, help="Documentos ao gerar um corpus novo.")
+    parser.add_argument('--seed', type=int, default=42, help="Semente ao gerar um corpus novo.")
+    parser.add_argument('--mode', choices=('processor', 'http'), default='processor',
+                        help="Chama process_document diretamente ou o endpoint Flask.")
+    parser.add_argument('--pages', default='all', help="Páginas processadas de cada PDF (padrão: todas).")
+    parser.add_argument('-n', '--repeat', type=int, default=1, help="Repetições do corpus inteiro.")
+    parser.add_argument('--real-llm', action='store_true', help="Usa a API da OpenAI em vez do modelo local.")
+    parser.add_argument('--llm-latency-ms', type=float, default=0, help="Latência simulada do modelo local.")
+    parser.add_argument('--out', help="Grava o resultado completo em JSON neste arquivo.")
+    parser.add_argument('--compare', help="Resultado JSON de referência para detectar regressões.")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Piora relativa tolerada (padrão: 10%%).")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Mostra a latência de cada documento.")
+    args = parser.parse_args()
+
+    # Mensagens por documento atrapalham a leitura do relatório; OCR_LOG_LEVEL=INFO as reativa
+    os.environ.setdefault('OCR_LOG_LEVEL', 'WARNING')
+    from log_config import configure_logging
+    configure_logging()
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nResultado gravado em {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, threshold=args.threshold)
+        if regressions:
+            print(f"\nRegressões em relação a {args.compare}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print(f"\nNenhuma regressão em relação a {args.compare}.")
+
+
+if __name__ == '__main__':
+    main()
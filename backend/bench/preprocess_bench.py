@@ -0,0 +1,122 @@
+"""
+Compara a latência por página e o pico de memória da cadeia de pré-processamento original do PIL
+com a versão fundida em NumPy.
+
+Uso (a partir do diretório backend):
+    python bench/preprocess_bench.py                 # página sintética A4 a 300 DPI
+    python bench/preprocess_bench.py nota.png -n 20  # imagem própria, 20 repetições
+
+Cada motor roda em um subprocesso separado, para que o pico de memória residente de um não
+contamine a medição do outro.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def synthetic_page(width=2480, height=3508, seed=42):
+    """Gera uma página A4 a 300 DPI com linhas de texto e ruído, parecida com uma nota digitalizada."""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(seed)
+    page = Image.new('RGB', (width, height), (245, 243, 238))
+    draw = ImageDraw.Draw(page)
+    for y in range(120, height - 120, 38):
+        x = 120
+        while x < width - 400:
+            word = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.,/-') for _ in range(rng.randint(3, 12)))
+            tone = rng.randint(0, 90)
+            draw.text((x, y), word, fill=(tone, tone, tone))
+            x += 14 * len(word) + rng.randint(20, 60)
+        if rng.random() < 0.1:
+            draw.line((100, y + 30, width - 100, y + 30), fill=(60, 60, 60), width=2)
+    return page.filter(ImageFilter.GaussianBlur(0.8))
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo, em MB."""
+    try:
+        # VmHWM é zerado no exec, ao contrário do ru_maxrss, que herda o pico do processo pai no Linux
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_engine(engine, image_path, repeat):
+    """Executado no subprocesso: mede um único motor e imprime o resultado em JSON."""
+    from PIL import Image
+    from image_preprocessing import preprocess
+
+    image = Image.open(image_path)
+    image.load()
+    baseline = peak_rss_mb()
+    preprocess(image, engine=engine).close() # Aquecimento (carrega bibliotecas e caches)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = preprocess(image, engine=engine)
+        timings.append((time.perf_counter() - start) * 1000)
+        result.close()
+
+    print(json.dumps({
+        'engine': engine,
+        'size': list(image.size),
+        'p50_ms': statistics.median(timings),
+        'min_ms': min(timings),
+        'max_ms': max(timings),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_delta_mb': peak_rss_mb() - baseline,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pré-processamento de imagens.")
+    parser.add_argument('image', nargs='?', help="Imagem de entrada (padrão: página sintética A4 a 300 DPI).")
+    parser.add_argument('-n', '--repeat', type=int, default=10, help="Repetições por motor.")
+    parser.add_argument('--engine', help=argparse.SUPPRESS) # Uso interno (subprocesso)
+    args = parser.parse_args()
+
+    if args.engine:
+        run_engine(args.engine, args.image, args.repeat)
+        return
+
+    image_path = args.image
+    if not image_path:
+        # A página sintética é gerada aqui e lida do disco pelos subprocessos, para que a geração
+        # não entre no pico de memória medido
+        image_path = os.path.join(tempfile.gettempdir(), 'preprocess_bench_page.png')
+        synthetic_page().save(image_path)
+
+    results = []
+    for engine in ('pil', 'fused'):
+        command = [sys.executable, os.path.abspath(__file__), '--engine', engine, '-n', str(args.repeat), image_path]
+        completed = subprocess.run(command, capture_output=True, text=True, check=True)
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"Imagem: {results[0]['size'][0]}x{results[0]['size'][1]} px, {args.repeat} repetições")
+    print(f"{'motor':<8}{'p50 (ms)':>12}{'min (ms)':>12}{'max (ms)':>12}{'pico RSS (MB)':>16}{'delta (MB)':>14}")
+    for r in results:
+        print(f"{r['engine']:<8}{r['p50_ms']:>12.1f}{r['min_ms']:>12.1f}{r['max_ms']:>12.1f}"
+              f"{r['peak_rss_mb']:>16.1f}{r['peak_delta_mb']:>14.1f}")
+    pil, fused = results
+    print(f"Aceleração (p50): {pil['p50_ms'] / fused['p50_ms']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import os
+import queue
+import random
+import threading
+import uuid
+from log_config import get_logger
+
+logger = get_logger('debug')
+
+
+class DebugSession:
+    """Artefatos de depuração de um único processamento (job ou requisição)."""
+
+    def __init__(self, writer, job_id):
+        self.writer = writer
+        self.job_id = job_id
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def save_image(self, image, name):
+        """Agenda a gravação de uma cópia da imagem em segundo plano."""
+        with self._lock:
+            self._counter += 1
+            sequence = self._counter
+        filename = f"{self.job_id}_{sequence:03d}_{name}.png"
+        self.writer.enqueue(image.copy(), filename)
+
+
+class DebugArtifactWriter:
+    def __init__(self, directory=None, enabled=None, sample_rate=None, max_bytes=None, queue_size=8):
+        """
+        Grava imagens intermediárias para depuração visual, desativado por padrão.
+
+        A captura acontece quando o processamento pede explicitamente (force=True), quando
+        OCR_DEBUG_ARTIFACTS=1 ou por amostragem (OCR_DEBUG_SAMPLE_RATE, entre 0 e 1). A codificação
+        PNG e a escrita em disco ocorrem em uma thread separada, com nomes únicos por job, e o
+        total em disco é limitado a OCR_DEBUG_MAX_MB removendo os arquivos mais antigos.
+        Se a fila estiver cheia, o artefato é descartado em vez de atrasar o processamento.
+        """
+        self.directory = directory or os.getenv('OCR_DEBUG_DIR', 'debug_artifacts')
+        self.enabled = enabled if enabled is not None else os.getenv('OCR_DEBUG_ARTIFACTS', '0') == '1'
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('OCR_DEBUG_SAMPLE_RATE', '0'))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv('OCR_DEBUG_MAX_MB', '200')) * 1024 * 1024)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._files = None # Lista (mtime, caminho, tamanho) dos artefatos em disco, carregada na primeira gravação
+        self._total_bytes = 0
+
+    def start(self, job_id=None, force=None):
+        """
+        Decide se o processamento atual terá artefatos de depuração.
+        Retorna um DebugSession, ou None quando a captura não foi selecionada.
+        """
+        if force is None:
+            force = self.enabled or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        if not force:
+            return None
+        return DebugSession(self, job_id or uuid.uuid4().hex)
+
+    def enqueue(self, image, filename):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((image, filename))
+        except queue.Full:
+            logger.warning(f"Fila de artefatos de depuração cheia; '{filename}' descartado.")
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='debug-artifacts', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            image, filename = self._queue.get()
+            try:
+                self._write(image, filename)
+            except Exception as e:
+                logger.error(f"Erro ao salvar imagem de depuração '{filename}': {e}")
+            finally:
+                image.close()
+                self._queue.task_done()
+
+    def _write(self, image, filename):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._files is None:
+            self._load_existing()
+
+        path = os.path.join(self.directory, filename)
+        image.save(path)
+        size = os.path.getsize(path)
+        self._files.append((os.path.getmtime(path), path, size))
+        self._total_bytes += size
+        logger.info(f"Imagem de depuração salva como: {path}")
+        self._evict()
+
+    def _load_existing(self):
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.png'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+        files.sort()
+        self._files = files
+        self._total_bytes = sum(size for _, _, size in files)
+
+    def _evict(self):
+        """Remove os artefatos mais antigos até o total caber em max_bytes."""
+        while self._files and self._total_bytes > self.max_bytes:
+            _, path, size = self._files.pop(0)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def flush(self):
+        """Aguarda a gravação de todos os artefatos pendentes."""
+        if self._thread is not None:
+            self._queue.join()
@@ -0,0 +1,114 @@
+"""
+Separação de um PDF com várias notas fiscais digitalizadas em sequência (lote) em documentos.
+
+Os limites entre as notas são decididos página a página, com sinais baratos extraídos do texto
+de cada página, em ordem de confiabilidade:
+    1. marcadores 'Página N de M' / 'Folha N/M': N = 1 abre uma nota, N > 1 continua a atual;
+    2. chave de acesso (dígito verificador válido): chave diferente abre uma nota, igual continua;
+    3. número da nota e CNPJ do emitente (ver field_rules): diferentes dos da nota atual abrem uma nota;
+    4. semelhança do cabeçalho (palavras das primeiras linhas) com o da primeira página da nota
+       atual: um cabeçalho diferente que parece o início de uma nota (emitente/CNPJ) abre uma nota.
+Sem nenhum desses sinais, a página continua a nota atual.
+"""
+import re
+from collections import namedtuple
+
+from field_rules import ISSUER_LABEL_PATTERN, extract_fields
+
+PAGE_MARKER_PATTERN = re.compile(r'\b(?:p[áa]g(?:ina)?|folha|fl)\.?\s*(\d{1,4})\s*(?:/|de)\s*(\d{1,4})\b', re.IGNORECASE)
+HEADER_WORD_PATTERN = re.compile(r'[^\W\d_]{3,}')
+
+# Linhas do início da página consideradas cabeçalho
+HEADER_LINES = 12
+
+# Confiança mínima (field_rules) para um campo servir de sinal de separação
+MIN_SIGNAL_CONFIDENCE = 0.8
+
+PageSignals = namedtuple('PageSignals', ['page', 'chave', 'cnpj', 'numero', 'marker', 'header', 'looks_like_start'])
+
+
+def header_words(text, lines=HEADER_LINES):
+    """Palavras (sem números) das primeiras linhas: iguais entre notas do mesmo layout e emitente."""
+    head = '\n'.join(text.strip().splitlines()[:lines])
+    return frozenset(word.lower() for word in HEADER_WORD_PATTERN.findall(head))
+
+
+def header_similarity(first, second):
+    """Semelhança de Jaccard entre dois conjuntos de palavras de cabeçalho (0 a 1)."""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def page_signals(page, text):
+    """Extrai de uma página os sinais usados por split_documents."""
+    fields = {name: match.value for name, match in extract_fields(text).items()
+              if match.confidence >= MIN_SIGNAL_CONFIDENCE}
+    marker = None
+    for match in PAGE_MARKER_PATTERN.finditer(text):
+        number, total = int(match.group(1)), int(match.group(2))
+        if 1 <= number <= total:
+            marker = (number, total)
+            break
+    head = '\n'.join(text.strip().splitlines()[:HEADER_LINES])
+    return PageSignals(
+        page=page,
+        chave=fields.get('chave_acesso'),
+        cnpj=fields.get('cnpj_emitente'),
+        numero=fields.get('numero_nota_fiscal'),
+        marker=marker,
+        header=header_words(text),
+        looks_like_start=bool(ISSUER_LABEL_PATTERN.search(head) or fields.get('cnpj_emitente')),
+    )
+
+
+class _Document:
+    """Estado da nota em formação: páginas e os identificadores já vistos nela."""
+
+    def __init__(self, signals):
+        self.pages = []
+        self.header = signals.header
+        self.chave = self.cnpj = self.numero = self.marker = None
+        self.add(signals)
+
+    def add(self, signals):
+        self.pages.append(signals.page)
+        self.chave = self.chave or signals.chave
+        self.cnpj = self.cnpj or signals.cnpj
+        self.numero = self.numero or signals.numero
+        self.marker = signals.marker or self.marker
+
+
+def starts_new_document(document, signals, min_header_similarity=0.5):
+    """Indica se a página descrita por 'signals' abre uma nova nota em vez de continuar 'document'."""
+    if signals.marker:
+        return signals.marker[0] == 1
+    if signals.chave and document.chave:
+        return signals.chave != document.chave
+    for name in ('numero', 'cnpj'):
+        value, current = getattr(signals, name), getattr(document, name)
+        if value and current and value != current:
+            return True
+    if signals.chave or signals.cnpj or signals.numero:
+        return False # Identificadores compatíveis com a nota atual
+    return (signals.looks_like_start
+            and header_similarity(document.header, signals.header) < min_header_similarity)
+
+
+def split_documents(page_texts, min_header_similarity=0.5):
+    """
+    Agrupa as páginas de um lote em notas. 'page_texts' é uma lista de (página, texto) na ordem do
+    PDF; o retorno é uma lista de notas, cada uma com a sua lista de (página, texto).
+    """
+    documents = []
+    texts = {}
+    current = None
+    for page, text in page_texts:
+        texts[page] = text
+        signals = page_signals(page, text or '')
+        if current is None or starts_new_document(current, signals, min_header_similarity):
+            current = _Document(signals)
+            documents.append(current)
+        else:
+            current.add(signals)
+    return [[(page, texts[page]) for page in document.pages] for document in documents]
@@ -0,0 +1,261 @@
+"""
+Extração determinística dos campos de formato rígido de uma nota fiscal a partir do texto do OCR.
+
+Os candidatos são localizados com expressões regulares pré-compiladas, corrigidos para as confusões
+mais comuns do OCR em contexto numérico (O->0, I/l->1, S->5, B->8, ...) e validados (dígitos
+verificadores do CNPJ e da chave de acesso, datas de calendário). Cada campo encontrado vem com
+uma confiança entre 0 e 1, usada pelo processador para decidir se a chamada ao modelo pode ser
+dispensada ou reduzida. Só valores conferidos por dígito verificador (ou pela chave de acesso)
+chegam a 0,9, o padrão de NF_RULES_MIN_CONFIDENCE; os achados apenas pela proximidade de um rótulo
+ficam abaixo disso, pois em layouts em colunas o rótulo e o valor podem estar desalinhados.
+"""
+import re
+from collections import namedtuple
+from datetime import date
+
+FieldMatch = namedtuple('FieldMatch', ['value', 'confidence', 'source'])
+
+# Confusões comuns do OCR quando o contexto é numérico
+OCR_DIGIT_TRANSLATION = str.maketrans({
+    'O': '0', 'o': '0', 'Q': '0', 'D': '0',
+    'I': '1', 'l': '1', 'i': '1', '|': '1', '!': '1',
+    'S': '5', 's': '5',
+    'B': '8',
+    'Z': '2', 'z': '2',
+    'G': '6',
+})
+_D = r'[0-9OoQDIli|!SsBZzG]' # Dígito ou caractere frequentemente confundido com dígito
+
+CNPJ_PATTERN = re.compile(
+    rf'(?<![0-9A-Za-z])({_D}{{2}}\s?[.,]?\s?{_D}{{3}}\s?[.,]?\s?{_D}{{3}}\s?/?\s?{_D}{{4}}\s?[-–]?\s?{_D}{{2}})(?![0-9A-Za-z])'
+)
+CHAVE_PATTERN = re.compile(rf'(?<![0-9])((?:{_D}{{4}}[\s.]?){{10}}{_D}{{4}})(?![0-9])')
+DATE_PATTERN = re.compile(rf'(?<![0-9])({_D}{{2}})\s?[/.-]\s?({_D}{{2}})\s?[/.-]\s?((?:19|20){_D}{{2}})(?![0-9])')
+AMOUNT_PATTERN = re.compile(r'(?<![\d.,])(\d{1,3}(?:\.\d{3})+,\d{2}|\d+,\d{2})(?![\d,])')
+
+EMISSION_LABEL_PATTERN = re.compile(r'emiss[aã]o|emitid[ao]\s+em|data\s+(?:e\s+hora\s+)?de\s+emiss', re.IGNORECASE)
+# Na NFS-e, a linha do RPS (recibo provisório) traz a própria data de emissão, anterior à da nota
+RPS_PATTERN = re.compile(r'\bRPS\b', re.IGNORECASE)
+TOTAL_LABEL_PATTERN = re.compile(
+    r'valor\s+total\s+da\s+(?:nota|nf(?:-?e|s-?e)?)|v\.?\s*total\s+da\s+nota|valor\s+l[ií]quido(?:\s+da\s+nota)?'
+    r'|valor\s+total\s+(?:do|dos)\s+servi[cç]os?|total\s+da\s+nota',
+    re.IGNORECASE,
+)
+GENERIC_TOTAL_LABEL_PATTERN = re.compile(r'valor\s+total', re.IGNORECASE)
+NUMBER_LABEL_PATTERN = re.compile(
+    r'(?:n[uú]mero\s+da\s+(?:nota|nfs?-?e)|n[º°o]\.?\s*da\s+nota|nfs?-?e\s+n[º°o]\.?|n[uú]mero)\s*[:.]?\s*(\d{1,15})',
+    re.IGNORECASE,
+)
+# Rótulos que só identificam o número da nota (sem o 'número' genérico, que aparece em endereços)
+SPECIFIC_NUMBER_LABEL_PATTERN = re.compile(
+    r'n[uú]mero\s+da\s+(?:nota|nfs?-?e)|n[º°o]\.?\s*da\s+nota|nfs?-?e\s+n[º°o]\.?', re.IGNORECASE,
+)
+STANDALONE_NUMBER_PATTERN = re.compile(r'^[ \t]*(\d{1,15})[ \t]*$', re.MULTILINE)
+ISSUER_LABEL_PATTERN = re.compile(r'emitente|prestador', re.IGNORECASE)
+RECIPIENT_LABEL_PATTERN = re.compile(r'destinat[aá]rio|tomador|transportador', re.IGNORECASE)
+# Rótulos típicos das partes úteis de uma nota (cabeçalho, itens e totais), usados em page_relevance
+RELEVANCE_LABEL_PATTERN = re.compile(
+    r'valor\s+total|total\s+(?:da\s+nota|geral|a\s+pagar)|chave\s+de\s+acesso|cnpj|emitente|prestador|'
+    r'descri[çc][ãa]o|quantidade|qtd|v(?:alor|l)?\.?\s*unit',
+    re.IGNORECASE,
+)
+
+# Códigos de UF do IBGE válidos nos dois primeiros dígitos da chave de acesso
+UF_CODES = {11, 12, 13, 14, 15, 16, 17, 21, 22, 23, 24, 25, 26, 27, 28, 29, 31, 32, 33, 35,
+            41, 42, 43, 50, 51, 52, 53}
+
+# Campos que as regras conseguem preencher
+RULE_FIELDS = ('numero_nota_fiscal', 'data_emissao', 'valor_total', 'cnpj_emitente', 'chave_acesso')
+
+
+def fix_ocr_digits(candidate):
+    """Corrige confusões do OCR e retorna apenas os dígitos do candidato."""
+    return re.sub(r'\D', '', candidate.translate(OCR_DIGIT_TRANSLATION))
+
+
+def cnpj_check_digits(base12):
+    """Calcula os dois dígitos verificadores (módulo 11) para os 12 primeiros dígitos do CNPJ."""
+    digits = [int(d) for d in base12]
+    for weights in ((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)):
+        remainder = sum(d * w for d, w in zip(digits, weights)) % 11
+        digits.append(0 if remainder < 2 else 11 - remainder)
+    return f"{digits[12]}{digits[13]}"
+
+
+def is_valid_cnpj(cnpj):
+    return (len(cnpj) == 14 and cnpj.isdigit() and len(set(cnpj)) > 1
+            and cnpj_check_digits(cnpj[:12]) == cnpj[12:])
+
+
+def chave_check_digit(base43):
+    """Dígito verificador da chave de acesso: módulo 11 com pesos 2 a 9 da direita para a esquerda."""
+    total = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(base43)))
+    remainder = total % 11
+    return '0' if remainder < 2 else str(11 - remainder)
+
+
+def is_valid_chave(chave):
+    if len(chave) != 44 or not chave.isdigit():
+        return False
+    if int(chave[:2]) not in UF_CODES or not 1 <= int(chave[4:6]) <= 12:
+        return False
+    return chave_check_digit(chave[:43]) == chave[43]
+
+
+def parse_brazilian_amount(text):
+    """Converte '1.234,56' em 1234.56."""
+    return float(text.replace('.', '').replace(',', '.'))
+
+
+def _label_before(pattern, text, position, window):
+    return pattern.search(text, max(0, position - window), position) is not None
+
+
+def _line_at(text, position):
+    """Linha do texto que contém a posição informada."""
+    start = text.rfind('\n', 0, position) + 1
+    end = text.find('\n', position)
+    return text[start:end if end != -1 else len(text)]
+
+
+def _amounts_after(label_pattern, text, window=120):
+    """Valores monetários que aparecem logo após cada ocorrência do rótulo."""
+    amounts = []
+    for label in label_pattern.finditer(text):
+        amount = AMOUNT_PATTERN.search(text, label.end(), label.end() + window)
+        if amount:
+            amounts.append(parse_brazilian_amount(amount.group(1)))
+    return amounts
+
+
+def find_chaves(text):
+    found = []
+    for match in CHAVE_PATTERN.finditer(text):
+        digits = fix_ocr_digits(match.group(1))
+        if is_valid_chave(digits) and digits not in found:
+            found.append(digits)
+    return found
+
+
+def find_cnpjs(text):
+    """Retorna [(cnpj, posição)] dos CNPJs com dígitos verificadores válidos, na ordem do texto."""
+    found = []
+    for match in CNPJ_PATTERN.finditer(text):
+        raw = match.group(1)
+        # Exige uma maioria de dígitos reais para não converter palavras em números
+        if sum(char.isdigit() for char in raw) < 10:
+            continue
+        digits = fix_ocr_digits(raw)
+        if is_valid_cnpj(digits):
+            found.append((digits, match.start()))
+    return found
+
+
+def find_dates(text):
+    """Retorna [(data, posição)] das datas DD/MM/AAAA válidas encontradas no texto."""
+    found = []
+    for match in DATE_PATTERN.finditer(text):
+        day, month, year = (int(fix_ocr_digits(part) or 0) for part in match.groups())
+        try:
+            found.append((date(year, month, day), match.start()))
+        except ValueError:
+            continue
+    return found
+
+
+def extract_fields(text):
+    """
+    Extrai os campos de formato rígido do texto. Retorna {campo: FieldMatch} apenas para os
+    campos encontrados, com valores já no formato do JSON final (CNPJ e chave só com dígitos,
+    data em 'DD/MM/AAAA', valor total como float).
+    """
+    fields = {}
+    if not text:
+        return fields
+
+    chaves = find_chaves(text)
+    chave = chaves[0] if chaves else None
+    if chave:
+        fields['chave_acesso'] = FieldMatch(chave, 0.99, 'chave de acesso (DV válido)')
+        # A chave contém o CNPJ do emitente e o número da nota (nNF)
+        if is_valid_cnpj(chave[6:20]):
+            fields['cnpj_emitente'] = FieldMatch(chave[6:20], 0.98, 'chave de acesso')
+        fields['numero_nota_fiscal'] = FieldMatch(str(int(chave[25:34])), 0.95, 'chave de acesso')
+
+    if 'cnpj_emitente' not in fields:
+        cnpjs = find_cnpjs(text)
+        if cnpjs:
+            # O emitente/prestador aparece no cabeçalho; CNPJs próximos de destinatário/tomador são descartados
+            issuer = [c for c in cnpjs if _label_before(ISSUER_LABEL_PATTERN, text, c[1], 200)
+                      and not _label_before(RECIPIENT_LABEL_PATTERN, text, c[1], 80)]
+            if issuer:
+                fields['cnpj_emitente'] = FieldMatch(issuer[0][0], 0.85, 'CNPJ próximo a emitente/prestador')
+            elif not _label_before(RECIPIENT_LABEL_PATTERN, text, cnpjs[0][1], 80):
+                confidence = 0.8 if len({c[0] for c in cnpjs}) == 1 else 0.6
+                fields['cnpj_emitente'] = FieldMatch(cnpjs[0][0], confidence, 'primeiro CNPJ válido')
+
+    dates = find_dates(text)
+    if dates:
+        emission = [d for d in dates if _label_before(EMISSION_LABEL_PATTERN, text, d[1], 60)
+                    and not RPS_PATTERN.search(_line_at(text, d[1]))]
+        if chave:
+            # Ano e mês de emissão estão na chave (AAMM)
+            year, month = 2000 + int(chave[2:4]), int(chave[4:6])
+            same_month = [d for d in (emission or dates) if d[0].year == year and d[0].month == month]
+            if same_month:
+                emission, confidence = same_month, 0.95
+            else:
+                confidence = 0.6 if emission else 0.4
+        else:
+            confidence = 0.85 if emission else (0.7 if len({d[0] for d in dates}) == 1 else 0.4)
+        chosen = (emission or dates)[0][0]
+        fields['data_emissao'] = FieldMatch(chosen.strftime('%d/%m/%Y'), confidence, 'data DD/MM/AAAA')
+
+    totals = _amounts_after(TOTAL_LABEL_PATTERN, text)
+    if totals:
+        # Nos quadros de totais do DANFE o valor da nota é a última coluna: o primeiro valor após o
+        # rótulo pode ser o de outra coluna (frete, IPI...), por isso nunca prevalece sobre o modelo
+        confidence = 0.8 if len(set(totals)) == 1 else 0.6
+        fields['valor_total'] = FieldMatch(totals[0], confidence, 'valor após rótulo de total da nota')
+    else:
+        # 'Valor total' sozinho também aparece nas colunas de itens, por isso vale menos
+        totals = _amounts_after(GENERIC_TOTAL_LABEL_PATTERN, text)
+        if totals:
+            fields['valor_total'] = FieldMatch(totals[0], 0.5, 'valor após rótulo genérico de total')
+
+    if 'numero_nota_fiscal' not in fields:
+        for match in NUMBER_LABEL_PATTERN.finditer(text):
+            # O número da nota nunca vem acompanhado de 'RPS' (na mesma linha do rótulo)
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            context = text[max(line_start, match.start() - 20):match.end()]
+            if 'rps' in context.lower():
+                continue
+            specific = SPECIFIC_NUMBER_LABEL_PATTERN.match(match.group(0)) is not None
+            fields['numero_nota_fiscal'] = FieldMatch(str(int(match.group(1))), 0.85 if specific else 0.7,
+                                                      'número após rótulo')
+            break
+        else:
+            # Layouts em colunas (NFS-e): o número fica sozinho em uma das linhas logo abaixo do rótulo
+            for label in SPECIFIC_NUMBER_LABEL_PATTERN.finditer(text):
+                # Resto da linha do rótulo e as 3 linhas seguintes
+                window = '\n'.join(text[label.end():].split('\n', 4)[:4])
+                number = STANDALONE_NUMBER_PATTERN.search(window)
+                if number:
+                    fields['numero_nota_fiscal'] = FieldMatch(str(int(number.group(1))), 0.8, 'número abaixo do rótulo')
+                    break
+
+    return fields
+
+
+def page_relevance(text):
+    """
+    Pontuação barata, de 0 a 1, de quanto o texto de uma página parece conter dados da nota:
+    densidade de texto (até 0,2), rótulos distintos de cabeçalho, itens e totais (até 0,4) e
+    valores monetários (até 0,4). Páginas de anexos, termos ou quase em branco ficam perto de 0.
+    """
+    if not text:
+        return 0.0
+    density = min(sum(char.isalnum() for char in text) / 400, 1.0)
+    labels = {match.group(0).lower() for match in RELEVANCE_LABEL_PATTERN.finditer(text)}
+    amounts = len(AMOUNT_PATTERN.findall(text))
+    return round(0.2 * density + 0.4 * min(len(labels) / 2, 1.0) + 0.4 * min(amounts / 3, 1.0), 3)
@@ -0,0 +1,127 @@
+"""
+Pré-processamento de imagens para OCR ("digitalização melhorada").
+
+Duas implementações equivalentes:
+    - preprocess_pil_chain: a cadeia original de passos do PIL (escala de cinza, redimensionamento,
+      contraste, nitidez e binarização), em que cada passo aloca uma página inteira nova;
+    - preprocess_fused: contraste, nitidez e binarização em uma única passada sobre arrays uint8
+      do NumPy, processada em faixas de linhas com tabela de consulta pré-calculada, de modo que
+      só existam a página em tons de cinza e a página binária de saída.
+
+As duas produzem a mesma imagem binária (exceto por diferenças pontuais de arredondamento).
+"""
+from PIL import Image, ImageEnhance
+
+try:
+    import numpy as np
+except ImportError: # NumPy é opcional; sem ele usamos a cadeia do PIL
+    np = None
+
+HAS_NUMPY = np is not None
+
+TARGET_WIDTH = 2000 # Largura mínima desejada, em pixels
+CONTRAST_FACTOR = 1.5 # Experimente valores como 1.2 a 2.0
+SHARPNESS_FACTOR = 1.7 # Experimente valores como 1.5 a 2.5
+THRESHOLD = 140 # Experimente valores entre 120 e 170
+
+# Linhas processadas por faixa na versão fundida (limita o tamanho dos buffers temporários)
+STRIP_ROWS = 256
+
+
+def to_grayscale_resized(image, target_width=TARGET_WIDTH):
+    """Converte para escala de cinza ('L') e amplia com Lanczos se a largura for menor que target_width."""
+    img = image if image.mode == 'L' else image.convert('L')
+    width, height = img.size
+    if width < target_width:
+        scale_factor = target_width / width
+        img = img.resize((int(width * scale_factor), int(height * scale_factor)), Image.Resampling.LANCZOS)
+    return img
+
+
+def preprocess_pil_chain(image, target_width=TARGET_WIDTH, contrast=CONTRAST_FACTOR,
+                         sharpness=SHARPNESS_FACTOR, threshold=THRESHOLD):
+    """Cadeia original de passos do PIL. Retorna uma imagem binária (modo '1')."""
+    img = to_grayscale_resized(image.copy(), target_width)
+    img = ImageEnhance.Contrast(img).enhance(contrast)
+    img = ImageEnhance.Sharpness(img).enhance(sharpness)
+    return img.point(lambda x: 0 if x < threshold else 255, '1')
+
+
+def contrast_lut(gray, factor=CONTRAST_FACTOR):
+    """
+    Tabela de consulta equivalente a ImageEnhance.Contrast: mistura cada valor com a média da
+    imagem (calculada pelo histograma, sem percorrer os pixels em Python) e trunca em [0, 255].
+    """
+    histogram = gray.histogram()
+    total = sum(histogram)
+    mean = int(sum(value * count for value, count in enumerate(histogram)) / total + 0.5)
+    values = mean + factor * (np.arange(256, dtype=np.float32) - mean)
+    return np.clip(np.floor(values), 0, 255).astype(np.uint8)
+
+
+def preprocess_fused(image, target_width=TARGET_WIDTH, contrast=CONTRAST_FACTOR,
+                     sharpness=SHARPNESS_FACTOR, threshold=THRESHOLD):
+    """
+    Versão fundida de contraste + nitidez + binarização. Retorna uma imagem binária (modo '1').
+
+    O realce de nitidez do PIL mistura a imagem com sua versão suavizada (kernel SMOOTH 3x3,
+    [1 1 1; 1 5 1; 1 1 1] / 13): saida = s + f * (c - s). Como a saída só é comparada ao limiar,
+    o pixel é branco quando s + f * (c - s) >= limiar, o que é avaliado diretamente em inteiros
+    sem materializar a imagem realçada. As bordas, que o filtro do PIL copia sem suavizar,
+    reduzem-se a c >= limiar.
+    """
+    if np is None:
+        return preprocess_pil_chain(image, target_width, contrast, sharpness, threshold)
+
+    gray = to_grayscale_resized(image, target_width)
+    lut = contrast_lut(gray, contrast)
+    # Contraste aplicado pela tabela de consulta em C (Image.point), já como array uint8
+    c = np.asarray(gray.point(lut.tolist()))
+    del gray
+    height, width = c.shape
+    out = np.empty((height, width), dtype=bool)
+
+    # Bordas: o filtro 3x3 do PIL mantém a primeira/última linha e coluna inalteradas
+    out[0] = c[0] >= threshold
+    out[-1] = c[-1] >= threshold
+    out[:, 0] = c[:, 0] >= threshold
+    out[:, -1] = c[:, -1] >= threshold
+    if height < 3 or width < 3:
+        return Image.fromarray(out)
+
+    # Fator de nitidez como fração inteira (ex.: 1.7 -> 17/10) para comparar sem ponto flutuante.
+    # Com uma casa decimal os valores intermediários cabem em int16, o que reduz o tráfego de memória.
+    scale = 10 if abs(sharpness * 10 - round(sharpness * 10)) < 1e-6 else 100
+    f_num = int(round(sharpness * scale))
+    limit = threshold * scale
+    dtype = np.int16 if (scale + abs(f_num)) * 255 < np.iinfo(np.int16).max else np.int32
+
+    for r0 in range(1, height - 1, STRIP_ROWS):
+        r1 = min(r0 + STRIP_ROWS, height - 1)
+        block = c[r0 - 1:r1 + 1].astype(dtype)
+        # Soma 3x3 separável: vertical e depois horizontal
+        vertical = block[:-2] + block[1:-1]
+        vertical += block[2:]
+        box = vertical[:, :-2] + vertical[:, 1:-1]
+        box += vertical[:, 2:]
+        center = block[1:-1, 1:-1]
+        # Suavização SMOOTH com arredondamento: (soma9 + 4c) / 13
+        box += 4 * center
+        box *= 2
+        box += 13
+        box //= 26
+        # s + f (c - s) >= limiar  <=>  scale * s + f_num * (c - s) >= threshold * scale
+        center = center - box
+        center *= f_num
+        box *= scale
+        box += center
+        out[r0:r1, 1:-1] = box >= limit
+
+    return Image.fromarray(out)
+
+
+def preprocess(image, engine='fused'):
+    """Aplica o pré-processamento com o motor indicado ('fused' ou 'pil')."""
+    if engine == 'pil':
+        return preprocess_pil_chain(image)
+    return preprocess_fused(image)
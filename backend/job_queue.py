@@ -0,0 +1,236 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from metrics import JOBS_IN_FLIGHT, JOBS_QUEUED, collect_timings
+from log_config import get_logger
+
+logger = get_logger('jobs')
+
+# Estados possíveis de um job
+STATUS_PENDING = 'pendente'
+STATUS_RUNNING = 'processando'
+STATUS_DONE = 'concluido'
+STATUS_FAILED = 'erro'
+
+# Ids de job são hexadecimais (uuid4); usado para validar nomes de arquivo no armazenamento compartilhado
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class QueueFullError(Exception):
+    """Levantada quando a fila de jobs atingiu o limite configurado."""
+
+
+class JobManager:
+    def __init__(self, worker_fn, max_workers=None, max_pending=None, ttl_seconds=None, store_dir=None):
+        """
+        Gerencia jobs de processamento executados em um pool limitado de workers.
+
+        Argumentos:
+            worker_fn (callable): Função chamada com os argumentos do job e job_id=<id>; seu retorno vira o resultado.
+            max_workers (int): Número de workers (padrão: OCR_JOB_WORKERS ou 2).
+            max_pending (int): Máximo de jobs aguardando ou em execução (padrão: OCR_JOB_MAX_PENDING ou 50).
+            ttl_seconds (int): Tempo que um job finalizado permanece consultável (padrão: OCR_JOB_TTL_SECONDS ou 900).
+            store_dir (str): Diretório opcional onde o estado dos jobs é espelhado em JSON (padrão: OCR_JOB_STORE_DIR).
+                Necessário quando vários processos atendem a mesma API, pois a consulta pode
+                chegar a um processo diferente daquele que executa o job.
+        """
+        self.worker_fn = worker_fn
+        self.max_workers = max_workers or int(os.getenv('OCR_JOB_WORKERS', '2'))
+        self.max_pending = max_pending or int(os.getenv('OCR_JOB_MAX_PENDING', '50'))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('OCR_JOB_TTL_SECONDS', '900'))
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ocr-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_disk_eviction = 0.0
+
+        self.store_dir = store_dir or os.getenv('OCR_JOB_STORE_DIR') or None
+        if self.store_dir:
+            os.makedirs(self.store_dir, exist_ok=True)
+        logger.info(f"Pool de jobs iniciado com {self.max_workers} worker(s), limite de {self.max_pending} job(s) pendente(s).")
+
+    def submit(self, *args, cleanup_path=None, **kwargs):
+        """
+        Enfileira um job e retorna seu id imediatamente.
+        Se 'cleanup_path' for informado, o arquivo é removido ao final do job.
+        """
+        self.evict_expired()
+        with self._lock:
+            if self._active >= self.max_pending:
+                raise QueueFullError(f"Limite de {self.max_pending} jobs pendentes atingido.")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': STATUS_PENDING,
+                'criado_em': time.time(),
+                'iniciado_em': None,
+                'finalizado_em': None,
+                'resultado': None,
+                'erro': None,
+                'tempos': None,
+            }
+            self._active += 1
+            snapshot = dict(self._jobs[job_id])
+
+        self._persist(snapshot)
+        JOBS_QUEUED.inc()
+        self._executor.submit(self._run, job_id, args, kwargs, cleanup_path)
+        return job_id
+
+    def add_completed(self, result):
+        """
+        Registra um job já concluído com o resultado informado (ex.: obtido do cache de resultados),
+        sem passar pelo pool. Retorna o id do job.
+        """
+        self.evict_expired()
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'status': STATUS_DONE,
+            'criado_em': now,
+            'iniciado_em': now,
+            'finalizado_em': now,
+            'resultado': result,
+            'erro': None,
+            'tempos': None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            snapshot = dict(job)
+        self._persist(snapshot)
+        return job_id
+
+    def _run(self, job_id, args, kwargs, cleanup_path):
+        self._update(job_id, status=STATUS_RUNNING, iniciado_em=time.time())
+        JOBS_QUEUED.dec()
+        JOBS_IN_FLIGHT.labels(mode='async').inc()
+        timings = None
+        try:
+            with collect_timings() as timings:
+                result = self.worker_fn(*args, job_id=job_id, **kwargs)
+            if result and 'erro' not in result:
+                fields = {'status': STATUS_DONE, 'resultado': result}
+            else:
+                erro = result.get('erro') if result else 'Não foi possível extrair os dados da nota fiscal'
+                fields = {'status': STATUS_FAILED, 'erro': erro}
+        except Exception as e:
+            logger.exception(f"Job {job_id} falhou: {str(e)}")
+            fields = {'status': STATUS_FAILED, 'erro': 'Erro interno no servidor'}
+        finally:
+            JOBS_IN_FLIGHT.labels(mode='async').dec()
+            if cleanup_path and os.path.exists(cleanup_path):
+                try:
+                    os.remove(cleanup_path)
+                except OSError as e:
+                    logger.warning(f"Não foi possível remover '{cleanup_path}': {e}")
+
+        if timings is not None:
+            # Duração de cada etapa em milissegundos, a mesma do cabeçalho Server-Timing
+            fields['tempos'] = {stage: round(seconds * 1000, 1) for stage, seconds in timings.durations.items()}
+        with self._lock:
+            self._active -= 1
+        self._update(job_id, finalizado_em=time.time(), **fields)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id not in self._jobs:
+                return
+            self._jobs[job_id].update(fields)
+            snapshot = dict(self._jobs[job_id])
+        self._persist(snapshot)
+
+    def _job_file(self, job_id):
+        return os.path.join(self.store_dir, f"{job_id}.json")
+
+    def _persist(self, job):
+        """Grava o estado do job no diretório compartilhado (escrita atômica)."""
+        if not self.store_dir:
+            return
+        path = self._job_file(job['id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o estado do job {job['id']}: {e}")
+
+    def _load(self, job_id):
+        """Lê o estado de um job gravado por outro processo."""
+        if not self.store_dir or not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._job_file(job_id), encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        finished = job.get('finalizado_em')
+        if finished is not None and finished < time.time() - self.ttl_seconds:
+            return None
+        return job
+
+    def get(self, job_id):
+        """Retorna uma cópia do estado do job, ou None se não existir ou já tiver expirado."""
+        self.evict_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        return self._load(job_id)
+
+    def evict_expired(self):
+        """Remove jobs finalizados há mais de 'ttl_seconds'."""
+        limit = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finalizado_em'] is not None and job['finalizado_em'] < limit]
+            for job_id in expired:
+                del self._jobs[job_id]
+        self._evict_expired_files(limit)
+        return len(expired)
+
+    def _evict_expired_files(self, limit):
+        """
+        Remove do diretório compartilhado os jobs finalizados antes de 'limit' (no máximo uma vez por
+        minuto). Jobs pendentes ou em execução são mantidos, mesmo que o arquivo seja antigo.
+        """
+        now = time.time()
+        if not self.store_dir or now - self._last_disk_eviction < 60:
+            return
+        self._last_disk_eviction = now
+        try:
+            with os.scandir(self.store_dir) as entries:
+                for entry in entries:
+                    # O arquivo é regravado ao finalizar o job: um arquivo mais novo que 'limit' não expirou
+                    if not entry.name.endswith('.json') or entry.stat().st_mtime >= limit:
+                        continue
+                    try:
+                        with open(entry.path, encoding='utf-8') as f:
+                            finished = json.load(f).get('finalizado_em')
+                    except ValueError: # Arquivo corrompido
+                        finished = 0
+                    except OSError:
+                        continue
+                    if finished is None or finished >= limit:
+                        continue
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        except OSError as e:
+            logger.warning(f"Falha ao limpar o diretório de jobs '{self.store_dir}': {e}")
+
+    def stats(self):
+        """Retorna contadores simples do pool."""
+        with self._lock:
+            return {'workers': self.max_workers, 'ativos': self._active, 'armazenados': len(self._jobs)}
+
+    def shutdown(self, wait=True):
+        """Encerra o pool, aguardando os jobs em andamento se 'wait' for True."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,181 @@
+"""
+Cliente da OpenAI de uso exclusivo do processador, com pool de conexões, prazos e novas tentativas.
+
+Substitui as chamadas ao módulo global 'openai' (que dependiam de openai.api_key) por uma instância
+de openai.OpenAI com um httpx.Client próprio: as conexões ficam abertas (keep-alive) entre as
+requisições, cada tentativa tem um tempo limite e a chamada inteira um prazo total. Erros
+transitórios (timeout, conexão, 408/409/429 e 5xx) são repetidos com espera exponencial e jitter,
+respeitando o cabeçalho Retry-After. Opcionalmente, uma segunda requisição idêntica é disparada
+quando a primeira passa do p95 das latências recentes (hedging), e vale a resposta que chegar antes.
+
+A mesma instância pode ser compartilhada por várias threads.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from log_config import get_logger
+from metrics import LLM_HEDGES, LLM_RETRIES
+
+logger = get_logger('llm')
+
+# Códigos HTTP que indicam falha temporária do servidor ou limite de requisições
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, str(default)))
+
+
+def is_transient_error(error):
+    """Indica se vale a pena repetir a requisição que falhou com 'error'."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError))
+
+
+def retry_after_seconds(error):
+    """Espera sugerida pelo servidor (cabeçalho Retry-After, em segundos), se houver."""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMClient:
+    def __init__(self, api_key=None, base_url=None, timeout=None, connect_timeout=None, deadline=None,
+                 max_retries=None, backoff_base=None, backoff_max=None, max_connections=None,
+                 hedge=None, hedge_min_samples=None, transport=None):
+        """
+        Argumentos (padrões nas variáveis de ambiente entre parênteses):
+            api_key (str): Chave da API (OPENAI_API_KEY).
+            base_url (str): URL alternativa da API (OPENAI_BASE_URL).
+            timeout (float): Tempo limite de cada tentativa, em segundos (OPENAI_TIMEOUT_SECONDS ou 60).
+            connect_timeout (float): Tempo limite para abrir a conexão (OPENAI_CONNECT_TIMEOUT_SECONDS ou 5).
+            deadline (float): Prazo total da chamada, somando tentativas e esperas (OPENAI_DEADLINE_SECONDS ou 150).
+            max_retries (int): Novas tentativas após erros transitórios (OPENAI_MAX_RETRIES ou 3).
+            backoff_base, backoff_max (float): Espera inicial e máxima entre tentativas
+                (OPENAI_BACKOFF_BASE_SECONDS ou 0.5; OPENAI_BACKOFF_MAX_SECONDS ou 8).
+            max_connections (int): Conexões simultâneas no pool (OPENAI_MAX_CONNECTIONS ou 20).
+            hedge (bool): Ativa o hedging descrito acima (OPENAI_HEDGE=1). Dobra o custo das
+                requisições lentas; a requisição perdedora não é cancelada, apenas descartada.
+            hedge_min_samples (int): Latências necessárias antes de estimar o p95 (OPENAI_HEDGE_MIN_SAMPLES ou 20).
+            transport (httpx.BaseTransport): Transporte HTTP alternativo (ex.: httpx.MockTransport nos testes).
+        """
+        self.timeout = timeout or _env_float('OPENAI_TIMEOUT_SECONDS', 60)
+        self.deadline = deadline or _env_float('OPENAI_DEADLINE_SECONDS', 150)
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('OPENAI_MAX_RETRIES', '3'))
+        self.backoff_base = backoff_base or _env_float('OPENAI_BACKOFF_BASE_SECONDS', 0.5)
+        self.backoff_max = backoff_max or _env_float('OPENAI_BACKOFF_MAX_SECONDS', 8)
+        self.hedge = hedge if hedge is not None else os.getenv('OPENAI_HEDGE', '0') == '1'
+        self.hedge_min_samples = hedge_min_samples or int(os.getenv('OPENAI_HEDGE_MIN_SAMPLES', '20'))
+        self.max_connections = max_connections = max_connections or int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+
+        self._http_client = httpx.Client(
+            timeout=httpx.Timeout(self.timeout, connect=connect_timeout or _env_float('OPENAI_CONNECT_TIMEOUT_SECONDS', 5)),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        # As novas tentativas são feitas aqui, com prazo total e jitter, e não pela biblioteca
+        self._client = openai.OpenAI(
+            api_key=api_key or os.getenv('OPENAI_API_KEY'),
+            base_url=base_url or os.getenv('OPENAI_BASE_URL') or None,
+            http_client=self._http_client,
+            max_retries=0,
+        )
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._hedge_executor = None
+
+        # Mesma interface de openai.chat.completions.create, usada pelo processador
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_chat_completion))
+
+    def create_chat_completion(self, **kwargs):
+        """Executa chat.completions.create com novas tentativas, prazo total e hedging opcional."""
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                return self._attempt(kwargs, min(self.timeout, max(remaining, 0.1)))
+            except Exception as e:
+                if not is_transient_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)) # Full jitter
+                delay = min(delay, self.backoff_max)
+                if time.monotonic() + delay >= deadline:
+                    logger.warning(f"Prazo total de {self.deadline:.0f} s esgotado; desistindo após {attempt + 1} tentativa(s): {e}")
+                    raise
+                attempt += 1
+                LLM_RETRIES.labels(reason=type(e).__name__).inc()
+                logger.warning(f"Erro transitório na API da OpenAI ({type(e).__name__}: {e}); "
+                               f"tentativa {attempt + 1} em {delay:.2f} s.")
+                time.sleep(delay)
+
+    def _attempt(self, kwargs, timeout):
+        hedge_after = self._hedge_delay()
+        if hedge_after is None or hedge_after >= timeout:
+            return self._timed_call(kwargs, timeout)
+
+        executor = self._get_hedge_executor()
+        primary = executor.submit(self._timed_call, kwargs, timeout)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        LLM_HEDGES.labels(outcome='launched').inc()
+        logger.info(f"Requisição à OpenAI passou do p95 ({hedge_after:.2f} s); disparando requisição paralela.")
+        backup = executor.submit(self._timed_call, kwargs, max(timeout - hedge_after, 0.1))
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        LLM_HEDGES.labels(outcome='won').inc()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _timed_call(self, kwargs, timeout):
+        start = time.monotonic()
+        response = self._client.chat.completions.create(timeout=timeout, **kwargs)
+        with self._lock:
+            self._latencies.append(time.monotonic() - start)
+        return response
+
+    def _hedge_delay(self):
+        """p95 das latências recentes, ou None se o hedging estiver desativado ou sem amostras suficientes."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def _get_hedge_executor(self):
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=2 * self.max_connections, thread_name_prefix='llm-hedge')
+            return self._hedge_executor
+
+    def close(self):
+        """Fecha as conexões do pool."""
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self._http_client.close()
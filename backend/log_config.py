@@ -0,0 +1,148 @@
+"""
+Configuração de logging do backend.
+
+Todos os módulos registram mensagens em loggers 'nf.<etapa>' (nf.app, nf.jobs, nf.processor,
+nf.pdf, nf.preprocess, nf.ocr, nf.rules, nf.llm, nf.cache, nf.debug, nf.serve). As mensagens são
+entregues a uma fila (QueueHandler) e escritas por uma thread separada (QueueListener), de modo
+que a escrita no console não bloqueia o processamento.
+
+Variáveis de ambiente:
+    OCR_LOG_LEVEL                 Nível padrão (INFO).
+    OCR_LOG_LEVELS                Níveis por etapa, ex.: 'ocr=DEBUG,llm=WARNING'.
+    OCR_LOG_FORMAT                'text' (padrão) ou 'json' (uma linha JSON por mensagem).
+    OCR_LOG_PAYLOAD_SAMPLE_RATE   Fração dos textos completos (OCR, resposta do modelo) registrados
+                                  em DEBUG (padrão 1).
+    OCR_LOG_PAYLOAD_MAX_CHARS     Limite de caracteres de cada texto registrado (padrão 0, sem limite).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+ROOT_LOGGER = 'nf'
+
+# Atributos padrão de um LogRecord; o que vier além disso (extra=...) é tratado como campo estruturado
+_RECORD_ATTRIBUTES = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+def get_logger(stage):
+    """Logger da etapa informada (ex.: 'ocr' -> 'nf.ocr')."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{stage}")
+
+
+def _extra_fields(record):
+    return {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formata cada registro como uma linha JSON, incluindo os campos passados em 'extra'."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legível para desenvolvimento; campos de 'extra' são acrescentados como chave=valor."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def parse_stage_levels(spec):
+    """Interpreta 'ocr=DEBUG,llm=WARNING' em {'nf.ocr': 'DEBUG', 'nf.llm': 'WARNING'}."""
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        stage, level = (part.strip() for part in item.split('=', 1))
+        if stage and level:
+            levels[f"{ROOT_LOGGER}.{stage}"] = level.upper()
+    return levels
+
+
+def _start_listener():
+    """Cria a fila e a thread que escreve os registros no console."""
+    global _listener
+    log_queue = queue.Queue(-1)
+    _queue_handler.queue = log_queue
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if os.getenv('OCR_LOG_FORMAT', 'text').lower() == 'json' else TextFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # A thread de escrita não sobrevive ao fork; o processo filho recebe uma fila e uma thread novas
+    if _queue_handler is not None:
+        _start_listener()
+
+
+def configure_logging():
+    """Configura os loggers 'nf.*' (idempotente). Chamado na inicialização da aplicação."""
+    global _queue_handler
+    with _lock:
+        if _queue_handler is not None:
+            return
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(os.getenv('OCR_LOG_LEVEL', 'INFO').upper())
+        root.propagate = False
+        for name, level in parse_stage_levels(os.getenv('OCR_LOG_LEVELS')).items():
+            logging.getLogger(name).setLevel(level)
+
+        _queue_handler = logging.handlers.QueueHandler(queue.Queue(-1))
+        root.addHandler(_queue_handler)
+        _start_listener()
+        atexit.register(shutdown_logging)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown_logging():
+    """Escreve os registros pendentes e encerra a thread de escrita."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def log_payload(logger, label, text, **fields):
+    """
+    Registra um texto grande (OCR, resposta do modelo) em DEBUG, com amostragem e limite de tamanho.
+    Fora do nível DEBUG não há custo além da verificação do nível.
+    """
+    if not logger.isEnabledFor(logging.DEBUG) or text is None:
+        return
+    sample_rate = float(os.getenv('OCR_LOG_PAYLOAD_SAMPLE_RATE', '1'))
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return
+    max_chars = int(os.getenv('OCR_LOG_PAYLOAD_MAX_CHARS', '0'))
+    length = len(text)
+    if max_chars and length > max_chars:
+        text = text[:max_chars] + f"... [truncado, {length - max_chars} caractere(s) omitido(s)]"
+    logger.debug("%s:\n%s", label, text, extra={'chars': length, **fields})
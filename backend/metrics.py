@@ -0,0 +1,140 @@
+"""
+Métricas de desempenho do processamento (Prometheus) e tempos por etapa de cada requisição.
+
+Cada etapa de process_document é medida com stage_timer('<etapa>'), que alimenta o histograma
+nf_stage_duration_seconds e, quando há uma coleta ativa (ver collect_timings), acumula a duração
+para o cabeçalho Server-Timing da resposta.
+
+Com vários processos (servidor pre-fork), defina PROMETHEUS_MULTIPROC_DIR antes de iniciar: cada
+worker grava suas métricas nesse diretório e /metrics agrega todos eles (o serve.py já faz isso).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+# Etapas medidas no processamento de um documento
+STAGES = ('text_layer', 'rasterize', 'preprocess', 'ocr', 'clean', 'split', 'rules', 'compress', 'llm', 'json_parse')
+
+# De 5 ms a 2 min: cobre desde a limpeza do texto até chamadas lentas à OpenAI
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+STAGE_DURATION = Histogram(
+    'nf_stage_duration_seconds', 'Duração de cada etapa do processamento de um documento.',
+    ['stage'], buckets=STAGE_BUCKETS,
+)
+DOCUMENT_DURATION = Histogram(
+    'nf_document_duration_seconds', 'Duração total do processamento de um documento.',
+    buckets=STAGE_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    'nf_cache_lookups_total', 'Consultas aos caches, por cache e resultado (hit/miss).',
+    ['cache', 'result'],
+)
+ERRORS = Counter('nf_errors_total', 'Erros no processamento, por etapa.', ['stage'])
+LLM_RETRIES = Counter('nf_llm_retries_total', 'Novas tentativas de chamadas à OpenAI, por tipo de erro.', ['reason'])
+LLM_HEDGES = Counter(
+    'nf_llm_hedges_total', 'Requisições paralelas (hedging) à OpenAI: disparadas (launched) e vencedoras (won).',
+    ['outcome'],
+)
+LLM_INPUT_TOKENS = Counter(
+    'nf_llm_input_tokens_total',
+    'Tokens do texto da nota antes (original) e depois (sent) da compressão para o modelo.', ['kind'],
+)
+PDF_PAGE_IMAGES = Counter(
+    'nf_pdf_page_images_total',
+    'Páginas de PDF enviadas ao OCR, por origem da imagem (embedded: extraída; rendered: renderizada).', ['source'],
+)
+JOBS_QUEUED = Gauge(
+    'nf_jobs_queued', 'Jobs assíncronos aguardando um worker livre.', multiprocess_mode='livesum',
+)
+JOBS_IN_FLIGHT = Gauge(
+    'nf_jobs_in_flight', 'Documentos em processamento, por modo (sync/async).', ['mode'],
+    multiprocess_mode='livesum',
+)
+
+
+class StageTimings:
+    """Soma das durações por etapa de uma requisição (pode receber medições de várias threads)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        """Valor do cabeçalho Server-Timing, com as durações em milissegundos."""
+        with self._lock:
+            return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.durations.items())
+
+
+_current_timings = ContextVar('nf_stage_timings', default=None)
+
+
+@contextmanager
+def collect_timings():
+    """Ativa a coleta dos tempos por etapa no contexto atual e entrega o StageTimings."""
+    timings = StageTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def start_collecting():
+    """Versão sem 'with' de collect_timings, para ganchos de requisição. Retorna (timings, token)."""
+    timings = StageTimings()
+    return timings, _current_timings.set(timings)
+
+
+def stop_collecting(token):
+    _current_timings.reset(token)
+
+
+@contextmanager
+def stage_timer(stage):
+    """Mede a duração de uma etapa; exceções que escapam da etapa contam como erro dela."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.labels(stage=stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.labels(stage=stage).observe(elapsed)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def record_error(stage):
+    ERRORS.labels(stage=stage).inc()
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+
+def render_metrics():
+    """Retorna (corpo, content-type) no formato de exposição do Prometheus."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Remove as métricas 'ao vivo' (gauges) de um worker que saiu (modo multiprocesso)."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
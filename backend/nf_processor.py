@@ -1,21 +1,175 @@
 import os
 import json
+import contextvars
+import threading
+import hashlib
 import re
+import sys
+import tempfile
+import unicodedata
 from dotenv import load_dotenv
-from PIL import Image, ImageEnhance, ImageFilter # Adicionadas ImageEnhance e ImageFilter
-from pdf2image import convert_from_path
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pytesseract
 import openai
 import traceback # Adicionado para melhor log de erros
+from pdf_tools import (extract_page_image, extract_text_layer, is_text_layer_usable, list_page_images, page_geometry,
+                       single_page_image)
+from image_preprocessing import HAS_NUMPY, TARGET_WIDTH, preprocess
+from debug_artifacts import DebugArtifactWriter
+from ocr_engines import OCRResult, create_ocr_engine
+from concurrent.futures import ThreadPoolExecutor
+from field_rules import extract_fields, page_relevance
+from document_splitter import split_documents
+from page_stream import MemoryBudget, stream_map
+from metrics import DOCUMENT_DURATION, LLM_INPUT_TOKENS, PDF_PAGE_IMAGES, record_error, stage_timer
+from log_config import configure_logging, get_logger, log_payload
+from llm_client import LLMClient
+from result_cache import ResultCache, make_cache_key
+from text_compressor import TextCompressor
+from structured_output import (STRUCTURED_OUTPUT_MODES, find_json_object, is_structured_output_error, next_structured_output_mode,
+                               reply_text, request_options, structured_output_mode)
 
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
 
+# Loggers por etapa; os níveis de cada um podem ser ajustados em OCR_LOG_LEVELS (ver log_config)
+logger = get_logger('processor')
+pdf_logger = get_logger('pdf')
+preprocess_logger = get_logger('preprocess')
+ocr_logger = get_logger('ocr')
+rules_logger = get_logger('rules')
+llm_logger = get_logger('llm')
+
+# Campos do JSON retornado para cada nota fiscal (ver SYSTEM_PROMPT)
+INVOICE_FIELDS = (
+    'numero_nota_fiscal', 'data_emissao', 'valor_total', 'cnpj_emitente',
+    'nome_razao_social_emitente', 'endereco_emitente', 'chave_acesso', 'itens',
+)
+
+# Instruções enviadas ao modelo; qualquer alteração muda PROMPT_VERSION e invalida o cache de resultados
+SYSTEM_PROMPT = (
+    "Você é um assistente altamente especializado em extrair informações detalhadas de textos de notas fiscais brasileiras (NF-e ou NFS-e).\n"
+    "Analise o texto fornecido e responda SOMENTE com um objeto JSON válido.\n"
+    "O JSON deve conter os seguintes campos:\n"
+    "- 'numero_nota_fiscal': (string) O número da nota fiscal.\n"
+    "- 'data_emissao': (string) A data de emissão no formato 'DD/MM/AAAA'.\n"
+    "- 'valor_total': (float) O valor total da nota. Use ponto como separador decimal. Se não encontrar, use null.\n"
+    "- 'cnpj_emitente': (string) O CNPJ do emitente, contendo apenas números (remova pontos, barras e traços).\n"
+    "- 'nome_razao_social_emitente': (string) O nome ou razão social do emitente.\n"
+    "- 'endereco_emitente': (string) O endereço completo do emitente.\n"
+    "- 'chave_acesso': (string) A chave de acesso da NF-e (44 dígitos numéricos). Se não for uma NF-e ou não encontrar, use null.\n"
+    "- 'itens': (lista de objetos) Uma lista de itens da nota. Cada item deve ser um objeto com os campos:\n"
+    "  - 'descricao': (string) Descrição do item/serviço.\n"
+    "  - 'quantidade': (float) Quantidade do item. Use ponto como separador decimal.\n"
+    "  - 'valor_unitario': (float) Valor unitário do item. Use ponto como separador decimal.\n"
+    "  - 'valor_total_item': (float) Valor total do item (quantidade * valor_unitario). Use ponto como separador decimal.\n"
+    "O número da nota NUNCA virá acompanhado de 'RPS'.\n"
+    "O número da NFS geralmente vem próximo de frases como 'Número da NF-E' ou 'Numero da nota' ou frases semelhantes.\n"
+    "Sempre utilize ponto como separador decimal e não utilize separador de milhar.\n"
+    "Ao colocar o emitente da nota fiscal, esse deve estar próximo a frases como 'prestador de serviço' ou 'emitente' vinculado a uma razão social.\n"
+    "Se um campo específico não puder ser encontrado no texto, seu valor no JSON deve ser null.\n"
+    "Se partes de um campo estiverem fragmentadas no texto (por exemplo, endereço quebrado em várias linhas), una essas partes logicamente para preencher o campo completo.\n"
+    "Campos numéricos (quantidade, valor_unitario, valor_total, etc.) devem ser representados como números reais (sem aspas). Verifique a coerência entre valor_total_item = quantidade × valor_unitario.\n"
+    "Se o CNPJ ou a chave de acesso estiverem incompletos, com menos dígitos ou em formato inválido, retorne null.\n"
+    "Se houver múltiplos valores possíveis para um campo (por exemplo, mais de uma data ou valor), escolha o que estiver mais fortemente associado ao contexto da emissão da nota fiscal.\n"
+    "O texto de entrada pode conter erros de OCR. Tente interpretar e corrigir erros comuns (ex: '1' por 'I', '0' por 'O', letras trocadas, caracteres faltando ou sobrando) ao preencher os campos, baseando-se no contexto de uma nota fiscal brasileira e na estrutura esperada para cada campo.\n"
+    "Se o texto fornecido não parecer ser de uma nota fiscal ou se a extração falhar significativamente, responda com: {\"erro\": \"Não foi possível extrair dados da nota fiscal a partir do texto fornecido.\"}"
+)
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:12]
+
+# Versão do pipeline de extração; incrementar quando uma mudança alterar os resultados
+PROCESSOR_VERSION = '1'
+
+# Temperatura da chamada de extração (também faz parte da chave do cache de respostas do modelo)
+LLM_TEMPERATURE = 0.1
+
+# Aumento mínimo da DPI ao renderizar de novo uma página com OCR ruim (ver escalated_dpi)
+DPI_ESCALATION_FACTOR = 1.5
+
+# Cópias de uma página em tons de cinza que existem ao mesmo tempo entre a renderização, o
+# pré-processamento e o OCR (usado na estimativa de memória do modo streaming)
+PAGE_MEMORY_FACTOR = 4
+
+# Maior número de página aceito em uma seleção (ver parse_page_spec); intervalos vindos do cliente
+# são validados antes de expandidos, para que '1-20000000' não aloque milhões de páginas
+MAX_PAGE_NUMBER = 10000
+
+def normalize_llm_text(text):
+    """
+    Forma normalizada do texto enviado ao modelo, usada na chave do cache de respostas:
+    Unicode NFKC e espaços em branco colapsados, para que novas digitalizações do mesmo
+    documento que só diferem nesses detalhes reaproveitem a resposta.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+# Caracteres removidos do texto do OCR ('|' e outros comuns em ruído de bordas e tabelas)
+OCR_REMOVED_CHARS = "|\"$%*&()[]{}\\`~<>^"
+
+# Classe de caracteres de OCR_REMOVED_CHARS: remove todos em uma única passada
+# (str.translate seria o caminho natural, mas é várias vezes mais lento com texto não ASCII)
+REMOVED_CHARS_PATTERN = re.compile(f"[{re.escape(OCR_REMOVED_CHARS)}]+")
+
+def normalize_ocr_text(text, preserve_layout=True):
+    """
+    Remove OCR_REMOVED_CHARS e colapsa os espaços do texto. Com 'preserve_layout', mantém uma
+    linha por linha do documento (quebras de página viram quebras de linha e linhas vazias são
+    descartadas); sem ele, une tudo em uma só linha.
+    """
+    text = REMOVED_CHARS_PATTERN.sub('', text)
+    if preserve_layout:
+        lines = (' '.join(line.split()) for line in text.splitlines())
+        return '\n'.join(line for line in lines if line)
+    return ' '.join(text.split())
+
+def parse_page_spec(spec):
+    """
+    Interpreta a seleção de páginas de um PDF.
+    Aceita None (sem seleção: vale OCR_DEFAULT_PAGES, todas por padrão), 'all'/'todas', um
+    inteiro, uma lista de inteiros ou uma string como '1-3,5'. Retorna 'all', None ou uma lista
+    ordenada de páginas (base 1). Levanta ValueError para especificações inválidas ou com páginas
+    acima de MAX_PAGE_NUMBER.
+    """
+    if spec is None or spec == '':
+        return None
+    if isinstance(spec, str):
+        spec = spec.strip().lower()
+        if spec in ('all', 'todas'):
+            return 'all'
+        pages = set()
+        for part in spec.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start, end = int(start), int(end)
+                if start > end:
+                    raise ValueError(f"Intervalo de páginas inválido: '{part}'")
+                if end > MAX_PAGE_NUMBER:
+                    raise ValueError(f"Páginas acima de {MAX_PAGE_NUMBER} não são aceitas: '{part}'")
+                pages.update(range(start, end + 1))
+            else:
+                pages.add(int(part))
+    elif isinstance(spec, int):
+        pages = {spec}
+    else:
+        pages = {int(page) for page in spec}
+
+    if not pages or min(pages) < 1:
+        raise ValueError("As páginas devem ser números inteiros a partir de 1.")
+    if max(pages) > MAX_PAGE_NUMBER:
+        raise ValueError(f"Páginas acima de {MAX_PAGE_NUMBER} não são aceitas.")
+    return sorted(pages)
+
 class NotaFiscalProcessor:
-    def __init__(self):
+    def __init__(self, llm_client=None):
         """
         Inicializa o processador de notas fiscais.
         Configura o caminho do Tesseract OCR e as credenciais da API OpenAI.
+        'llm_client' substitui o cliente da OpenAI por outro objeto com a mesma interface
+        (chat.completions.create), como o modelo local determinístico dos benchmarks; nesse
+        caso a chave da API não é exigida.
         """
         # Configura o Tesseract OCR
         tesseract_path_env = os.getenv('TESSERACT_CMD_PATH') # Tente carregar do .env primeiro
@@ -26,328 +180,839 @@ class NotaFiscalProcessor:
         elif os.path.exists(default_tesseract_path):
             tesseract_path_to_use = default_tesseract_path
         else:
-            print("Aviso: Caminho do Tesseract não configurado explicitamente nem encontrado no local padrão. Tentando usar a instalação global.")
+            logger.warning("Caminho do Tesseract não configurado explicitamente nem encontrado no local padrão. Tentando usar a instalação global.")
             tesseract_path_to_use = 'tesseract' # Padrão se não especificado e não encontrado
 
-        try:
-            pytesseract.pytesseract.tesseract_cmd = tesseract_path_to_use
-            version = pytesseract.get_tesseract_version() # Verifica se o Tesseract está acessível
-            print(f"Tesseract OCR versão {version} encontrado e configurado em: {pytesseract.pytesseract.tesseract_cmd}")
-            self.pytesseract = pytesseract
-        except Exception as e:
-            print(f"Erro ao configurar o Tesseract: {e}")
-            print("Verifique se o Tesseract está instalado e se o caminho está correto no código ou na variável de ambiente TESSERACT_CMD_PATH.")
-            raise RuntimeError(f"Tesseract não pôde ser configurado. Detalhes: {e}")
+        pytesseract.pytesseract.tesseract_cmd = tesseract_path_to_use
+        self.pytesseract = pytesseract
+
+        # --- EXPERIMENTE DIFERENTES MODOS PSM ---
+        # psm_mode = 6  # Assume um único bloco uniforme de texto.
+        psm_mode = 4  # Assume uma única coluna de texto de tamanhos variáveis. (Bom para documentos)
+        # psm_mode = 7  # Trata a imagem como uma única linha de texto.
+        # psm_mode = 11 # Texto esparso.
+        # psm_mode = 3  # Segmentação de página totalmente automática. (Padrão do Tesseract)
+
+        # Motor de OCR: pool persistente do tesserocr quando disponível, pytesseract caso contrário.
+        # Em instalações locais (Windows), os modelos ficam em 'tessdata' ao lado do executável.
+        tessdata_path = os.getenv('TESSDATA_PATH')
+        if not tessdata_path and os.path.isabs(tesseract_path_to_use):
+            candidate = os.path.join(os.path.dirname(tesseract_path_to_use), 'tessdata')
+            tessdata_path = candidate if os.path.isdir(candidate) else None
+        self.ocr_engine = create_ocr_engine(lang='por', psm=psm_mode, oem=3, tessdata_path=tessdata_path)
+
+        if self.ocr_engine.name == 'pytesseract':
+            try:
+                version = pytesseract.get_tesseract_version() # Verifica se o Tesseract está acessível
+                ocr_logger.info(f"Tesseract OCR versão {version} encontrado e configurado em: {pytesseract.pytesseract.tesseract_cmd}")
+            except Exception as e:
+                ocr_logger.error(f"Erro ao configurar o Tesseract: {e}. Verifique se o Tesseract está instalado e se o caminho está correto no código ou na variável de ambiente TESSERACT_CMD_PATH.")
+                raise RuntimeError(f"Tesseract não pôde ser configurado. Detalhes: {e}")
+        ocr_logger.info(f"Motor de OCR: {self.ocr_engine.describe()}")
 
         # Configura API Key e modelo da OpenAI
         self.api_key = os.getenv('OPENAI_API_KEY')
-        self.model = os.getenv('OPENAI_MODEL')
+        self.model = os.getenv('OPENAI_MODEL') or getattr(llm_client, 'model', None)
 
-        if not self.api_key:
+        if not self.api_key and llm_client is None:
             raise ValueError("Chave da API OpenAI (OPENAI_API_KEY) não encontrada no arquivo .env")
         if not self.model:
             raise ValueError("Modelo OpenAI (OPENAI_MODEL) não especificado no arquivo .env")
 
-        openai.api_key = self.api_key
-        print(f"Modelo OpenAI configurado: {self.model}")
+        # Cliente próprio (pool de conexões, prazos e novas tentativas; ver llm_client), sem
+        # alterar a configuração global do módulo openai
+        self.llm_client = llm_client or LLMClient(api_key=self.api_key)
+        llm_logger.info(f"Modelo OpenAI configurado: {self.model}")
 
-    def convert_pdf_to_images(self, pdf_path):
+        # Saída estruturada: 'json_schema' (padrão), 'tools' ou 'off' (ver structured_output).
+        # Se a API recusar o modo, as chamadas passam para o seguinte e o mantêm dali em diante
+        # (active_structured_output); o modo configurado, que entra nas chaves de cache, não muda.
+        self.structured_output = structured_output_mode(os.getenv('OPENAI_STRUCTURED_OUTPUT'))
+        self.active_structured_output = self.structured_output
+        self._structured_output_lock = threading.Lock()
+
+        # Remoção de avisos legais e linhas repetidas e orçamento de tokens do texto enviado ao
+        # modelo (OCR_COMPRESS_TEXT e OPENAI_INPUT_TOKEN_BUDGET; ver text_compressor)
+        self.text_compressor = TextCompressor(model=self.model)
+
+        # Respostas do modelo já obtidas, indexadas pelo texto normalizado (configurável por
+        # OCR_LLM_CACHE_*; ver result_cache). Só respostas sem erro são guardadas. Por padrão o
+        # cache fica em disco, no diretório temporário, e as entradas valem 7 dias.
+        self.llm_cache = ResultCache(name='llm', env_prefix='OCR_LLM_CACHE', default_ttl=7 * 24 * 3600,
+                                     default_directory=os.path.join(tempfile.gettempdir(), 'nf_reader_llm'))
+
+        # Resolve o caminho do Poppler uma única vez
+        self.poppler_path = self._resolve_poppler_path()
+
+        # Triagem de PDFs digitais: usa a camada de texto embutida quando ela é confiável
+        self.use_text_layer = os.getenv('OCR_USE_PDF_TEXT_LAYER', '1') != '0'
+        self.text_layer_min_chars = int(os.getenv('OCR_TEXT_LAYER_MIN_CHARS', '200'))
+
+        # PDFs digitalizados: páginas que são uma única imagem têm a imagem extraída na resolução
+        # original (pdfimages) em vez de renderizadas a 300 DPI; abaixo da resolução mínima, renderiza
+        self.use_embedded_images = os.getenv('OCR_EMBEDDED_IMAGES', '1') != '0'
+        self.embedded_image_min_dpi = float(os.getenv('OCR_EMBEDDED_IMAGE_MIN_DPI', '150'))
+
+        # Renderização em tons de cinza com DPI adaptativa: a DPI inicial leva o menor lado da página
+        # a TARGET_WIDTH pixels, dentro de [OCR_RENDER_DPI_MIN, OCR_RENDER_DPI_MAX]; se o OCR sair com
+        # confiança baixa ou palavras pequenas demais, a página é renderizada de novo em DPI maior
+        self.render_dpi_min = int(os.getenv('OCR_RENDER_DPI_MIN', '150'))
+        self.render_dpi_max = int(os.getenv('OCR_RENDER_DPI_MAX', '400'))
+        self.escalate_min_confidence = float(os.getenv('OCR_ESCALATE_MIN_CONFIDENCE', '70'))
+        self.escalate_min_word_height = float(os.getenv('OCR_ESCALATE_MIN_WORD_HEIGHT', '20'))
+
+        # Modo streaming para PDFs grandes (a partir de OCR_STREAM_MIN_PAGES páginas digitalizadas):
+        # páginas renderizadas em um diretório temporário (tmpfs, se houver) e entregues ao OCR por
+        # uma fila limitada, com no máximo OCR_JOB_MEMORY_BUDGET_MB de páginas em memória por job
+        self.stream_min_pages = int(os.getenv('OCR_STREAM_MIN_PAGES', '10'))
+        self.stream_queue_size = int(os.getenv('OCR_STREAM_QUEUE_SIZE', '2'))
+        self.job_memory_budget = int(float(os.getenv('OCR_JOB_MEMORY_BUDGET_MB', '512')) * 1024 * 1024)
+        self.scratch_dir = os.getenv('OCR_SCRATCH_DIR') or ('/dev/shm' if os.access('/dev/shm', os.W_OK) else None)
+
+        # PDFs com várias páginas: seleção padrão (OCR_DEFAULT_PAGES, todas as páginas), limite de
+        # páginas lidas, páginas processadas em paralelo e relevância mínima para uma página além
+        # da primeira entrar no texto enviado ao modelo (anexos quase vazios ou sem dados da nota)
+        self.default_pages = parse_page_spec(os.getenv('OCR_DEFAULT_PAGES', 'all'))
+        self.max_pages = int(os.getenv('OCR_MAX_PAGES', '20'))
+        self.page_workers = int(os.getenv('OCR_PAGE_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self.page_min_relevance = float(os.getenv('OCR_PAGE_MIN_RELEVANCE', '0.25'))
+        # Lotes com várias notas (ver process_batch): máximo de páginas lidas, semelhança mínima de
+        # cabeçalho entre páginas da mesma nota e notas extraídas em paralelo
+        self.split_max_pages = int(os.getenv('OCR_SPLIT_MAX_PAGES', '500'))
+        self.split_header_similarity = float(os.getenv('OCR_SPLIT_HEADER_SIMILARITY', '0.5'))
+        self.split_workers = int(os.getenv('OCR_SPLIT_WORKERS', '4'))
+        self._executors = {}
+        self._executors_lock = threading.Lock()
+
+        # Texto limpo com uma linha por linha do documento (OCR_PRESERVE_LAYOUT=0 une tudo em uma linha)
+        self.preserve_layout = os.getenv('OCR_PRESERVE_LAYOUT', '1') != '0'
+
+        # Motor de pré-processamento: 'fused' (NumPy, padrão) ou 'pil' (cadeia original do PIL)
+        self.preprocess_engine = os.getenv('OCR_PREPROCESS_ENGINE', 'fused' if HAS_NUMPY else 'pil')
+
+        # Extração por regras: confiança mínima para aceitar um campo e campos que, se todos
+        # validados, dispensam a chamada à OpenAI (vazio = sempre chamar o modelo)
+        self.rules_min_confidence = float(os.getenv('NF_RULES_MIN_CONFIDENCE', '0.9'))
+        self.rules_required_fields = [name.strip() for name in os.getenv('NF_RULES_REQUIRED_FIELDS', '').split(',') if name.strip()]
+
+        # Imagens de depuração: desativadas por padrão (ver OCR_DEBUG_* em debug_artifacts)
+        self.debug_artifacts = DebugArtifactWriter()
+
+    def cache_namespace(self):
         """
-        Converte um arquivo PDF em uma lista de objetos de imagem PIL.
+        Identifica a configuração que influencia o resultado (versões do pipeline e do prompt,
+        modelo, motores e regras). Entra na chave do cache de resultados, de modo que mudar
+        qualquer um desses itens invalida as entradas antigas.
         """
-        try:
-            poppler_path_env = os.getenv('POPPLER_PATH')
-            default_poppler_path = r'C:\Users\enzo.bettini\Desktop\Library\poppler-23.11.0\Library\bin'
-            path_to_use = poppler_path_env if poppler_path_env and os.path.exists(poppler_path_env) else default_poppler_path
+        return '|'.join([
+            PROCESSOR_VERSION, PROMPT_VERSION, self.model, self.structured_output, self.text_compressor.describe(),
+            self.ocr_engine.name, self.preprocess_engine, str(self.preserve_layout),
+            str(self.default_pages), str(self.max_pages), str(self.page_min_relevance),
+            str(self.split_max_pages), str(self.split_header_similarity),
+            str(self.use_text_layer), str(self.text_layer_min_chars),
+            str(self.use_embedded_images), str(self.embedded_image_min_dpi),
+            str(self.render_dpi_min), str(self.render_dpi_max),
+            str(self.escalate_min_confidence), str(self.escalate_min_word_height),
+            str(self.rules_min_confidence), ','.join(self.rules_required_fields),
+        ])
 
-            if not os.path.exists(path_to_use):
-                 print(f"Aviso: Caminho do Poppler não configurado em POPPLER_PATH nem encontrado no local padrão ('{default_poppler_path}'). A conversão de PDF pode falhar se o Poppler não estiver no PATH do sistema.")
-                 path_to_use_param = None # Usa o Poppler do PATH do sistema
-            else:
-                 path_to_use_param = path_to_use
+    def _resolve_poppler_path(self):
+        """
+        Retorna o diretório do Poppler a ser usado, ou None para usar o Poppler do PATH do sistema.
+        """
+        poppler_path_env = os.getenv('POPPLER_PATH')
+        default_poppler_path = r'C:\Users\enzo.bettini\Desktop\Library\poppler-23.11.0\Library\bin'
+        path_to_use = poppler_path_env if poppler_path_env and os.path.exists(poppler_path_env) else default_poppler_path
+
+        if not os.path.exists(path_to_use):
+            pdf_logger.warning(f"Caminho do Poppler não configurado em POPPLER_PATH nem encontrado no local padrão ('{default_poppler_path}'). A conversão de PDF pode falhar se o Poppler não estiver no PATH do sistema.")
+            return None # Usa o Poppler do PATH do sistema
+        return path_to_use
+
+    def get_pdf_page_count(self, pdf_path):
+        """Retorna o número de páginas do PDF (via pdfinfo do Poppler)."""
+        return int(pdfinfo_from_path(pdf_path, poppler_path=self.poppler_path)['Pages'])
+
+    def resolve_pdf_pages(self, pdf_path, pages=None, max_pages=None):
+        """
+        Converte a seleção de páginas (ver parse_page_spec) na lista de páginas existentes no PDF.
+        Sem seleção explícita vale OCR_DEFAULT_PAGES (todas as páginas, por padrão). 'all' é
+        limitado às primeiras 'max_pages' páginas (padrão: OCR_MAX_PAGES; 0 = sem limite).
+        """
+        max_pages = self.max_pages if max_pages is None else max_pages
+        pages = parse_page_spec(pages)
+        if pages is None:
+            pages = self.default_pages
+        if pages is None:
+            return [1]
+        page_count = self.get_pdf_page_count(pdf_path)
+        if pages == 'all':
+            if max_pages and page_count > max_pages:
+                pdf_logger.warning(f"PDF com {page_count} páginas; apenas as {max_pages} primeiras serão lidas.")
+                page_count = max_pages
+            return list(range(1, page_count + 1))
+        return [page for page in pages if page <= page_count]
+
+    def render_pdf_page(self, pdf_path, page, dpi=300, scratch_dir=None):
+        """
+        Rasteriza uma única página do PDF direto em tons de cinza ('L', como o pré-processamento
+        espera) e retorna a imagem PIL (ou None se a página não existir). Com 'scratch_dir', o
+        Poppler grava a página em um subdiretório próprio dentro dele, lido e apagado em seguida,
+        em vez de passá-la pelo pipe (que mantém em memória os bytes do PGM além da imagem
+        decodificada).
+        """
+        with stage_timer('rasterize'):
+            if scratch_dir is None:
+                images = convert_from_path(pdf_path, dpi=dpi, first_page=page, last_page=page,
+                                           grayscale=True, poppler_path=self.poppler_path)
+                return images[0] if images else None
+            # Um subdiretório por renderização: o pdf2image reconhece os arquivos gerados pelo prefixo,
+            # e outra página renderizada ao mesmo tempo no mesmo diretório poderia ser confundida
+            with tempfile.TemporaryDirectory(prefix=f'p{page}_', dir=scratch_dir) as directory:
+                paths = convert_from_path(pdf_path, dpi=dpi, first_page=page, last_page=page, grayscale=True,
+                                          output_folder=directory, paths_only=True, poppler_path=self.poppler_path)
+                if not paths:
+                    return None
+                image = Image.open(paths[0])
+                image.load() # Lê os pixels antes de o subdiretório ser removido
+            return image
 
-            print(f"Convertendo PDF para imagens usando Poppler em: {path_to_use if path_to_use_param else 'PATH do sistema'}")
-            images = convert_from_path(pdf_path, dpi=300, poppler_path=path_to_use_param)
-            print(f"PDF convertido em {len(images)} imagem(ns).")
-            return images
+    def render_dpi(self, page_size=None):
+        """
+        DPI inicial de uma página de tamanho 'page_size' ((largura, altura, ...) em pontos; ver
+        read_page_geometry): a que leva o menor lado da página a TARGET_WIDTH pixels, a largura que
+        o pré-processamento alcançaria ampliando a imagem, limitada a [OCR_RENDER_DPI_MIN,
+        OCR_RENDER_DPI_MAX]. Sem o tamanho, 300 DPI.
+        """
+        dpi = 300
+        if page_size and min(page_size[0], page_size[1]) > 0:
+            dpi = TARGET_WIDTH / (min(page_size[0], page_size[1]) / 72)
+        return int(min(max(dpi, self.render_dpi_min), self.render_dpi_max))
+
+    def escalated_dpi(self, dpi, ocr_result):
+        """
+        Nova DPI para uma página cujo OCR a 'dpi' saiu ruim: confiança média abaixo de
+        OCR_ESCALATE_MIN_CONFIDENCE ou altura mediana das palavras abaixo de
+        OCR_ESCALATE_MIN_WORD_HEIGHT pixels. A DPI cresce ao menos DPI_ESCALATION_FACTOR vezes, ou o
+        necessário para as palavras alcançarem a altura mínima, até OCR_RENDER_DPI_MAX. Retorna None
+        se não há o que melhorar (OCR bom, página sem palavras ou DPI já no máximo).
+        """
+        confidence = ocr_result.mean_confidence()
+        height = ocr_result.median_word_height()
+        if confidence is None or dpi >= self.render_dpi_max:
+            return None
+        factor = 1.0
+        if confidence < self.escalate_min_confidence:
+            factor = DPI_ESCALATION_FACTOR
+        if height and height < self.escalate_min_word_height:
+            factor = max(DPI_ESCALATION_FACTOR, self.escalate_min_word_height / height)
+        if factor == 1.0:
+            return None
+        return min(int(dpi * factor), self.render_dpi_max)
+
+    def read_page_geometry(self, pdf_path, page_numbers):
+        """
+        Tamanho e rotação das páginas informadas com uma única chamada ao pdfinfo. Retorna um
+        dicionário {página: (largura, altura, rotação)}; vazio se a leitura falhar.
+        """
+        if not page_numbers:
+            return {}
+        try:
+            with stage_timer('rasterize'):
+                return page_geometry(pdf_path, min(page_numbers), max(page_numbers), poppler_path=self.poppler_path)
+        except Exception as e:
+            pdf_logger.warning(f"Não foi possível ler o tamanho das páginas do PDF ({e}).")
+            return {}
+
+    def find_embedded_scans(self, pdf_path, page_numbers, geometry):
+        """
+        Identifica, entre as páginas informadas, as que são apenas uma imagem digitalizada (ver
+        pdf_tools.single_page_image), com uma chamada ao pdfimages; 'geometry' vem de
+        read_page_geometry. Retorna um dicionário {página: PdfImage}; vazio se o recurso estiver
+        desativado ou a listagem falhar.
+        """
+        if not self.use_embedded_images or not page_numbers or not geometry:
+            return {}
+        try:
+            with stage_timer('rasterize'):
+                images = list_page_images(pdf_path, min(page_numbers), max(page_numbers), poppler_path=self.poppler_path)
         except Exception as e:
-            print(f"Erro ao converter PDF para imagens: {str(e)}")
-            print("Verifique se o Poppler está instalado e se o caminho (POPPLER_PATH) está configurado corretamente.")
+            pdf_logger.warning(f"Não foi possível listar as imagens do PDF ({e}). Renderizando as páginas.")
+            return {}
+        scans = {}
+        for page in page_numbers:
+            image = single_page_image(images.get(page), geometry.get(page), min_dpi=self.embedded_image_min_dpi)
+            if image is not None:
+                scans[page] = image
+        if scans:
+            pdf_logger.debug(f"Páginas com a digitalização extraída sem renderizar: {sorted(scans)}")
+        return scans
+
+    def load_pdf_page_image(self, pdf_path, page, page_size=None, embedded=None, scratch_dir=None):
+        """
+        Imagem de uma página para o OCR: a imagem embutida na resolução original quando a página
+        é uma digitalização simples ('embedded'; ver find_embedded_scans) ou a página renderizada
+        pelo Poppler na DPI de render_dpi, também usada se a extração falhar. 'page_size' vem de
+        read_page_geometry. Retorna (imagem, dpi), com dpi None para a imagem embutida e imagem
+        None se a página não existir.
+        """
+        if embedded is not None:
+            rotation = page_size[2] if page_size else 0
+            try:
+                with stage_timer('rasterize'):
+                    image = extract_page_image(pdf_path, page, rotation=rotation, poppler_path=self.poppler_path)
+                if image is not None:
+                    PDF_PAGE_IMAGES.labels(source='embedded').inc()
+                    return image, None
+            except Exception as e:
+                pdf_logger.warning(f"Falha ao extrair a imagem da página {page} ({e}). Renderizando a página.")
+        dpi = self.render_dpi(page_size)
+        image = self.render_pdf_page(pdf_path, page, dpi=dpi, scratch_dir=scratch_dir)
+        if image is not None:
+            PDF_PAGE_IMAGES.labels(source='rendered').inc()
+        return image, dpi
+
+    def recognize_pdf_page(self, pdf_path, page, page_size=None, embedded=None, debug=None):
+        """
+        OCR de uma página digitalizada (ver load_pdf_page_image e recognize_loaded_page).
+        Retorna o OCRResult ou None se a página não puder ser carregada.
+        """
+        image, dpi = self.load_pdf_page_image(pdf_path, page, page_size, embedded)
+        if image is None:
             return None
+        return self.recognize_loaded_page(pdf_path, page, image, dpi, debug=debug)
 
-    def preprocess_image(self, image):
+    def recognize_loaded_page(self, pdf_path, page, image, dpi, debug=None, scratch_dir=None):
+        """
+        OCR da imagem já carregada de uma página, que é fechada logo em seguida. Páginas
+        renderizadas (com 'dpi') começam na DPI de render_dpi e, se o resultado for ruim (ver
+        escalated_dpi), são renderizadas de novo em DPI maior, ficando o OCR de maior confiança média.
+        """
+        try:
+            ocr_result = self.try_recognize_image(image, debug=debug)
+        finally:
+            image.close() # Libera a página assim que o OCR termina
+
+        higher_dpi = self.escalated_dpi(dpi, ocr_result) if dpi else None
+        if higher_dpi is None:
+            return ocr_result
+        pdf_logger.info(f"Página {page}: OCR a {dpi} DPI com confiança {ocr_result.mean_confidence():.0f} e altura "
+                        f"mediana {ocr_result.median_word_height()} px; renderizando de novo a {higher_dpi} DPI.")
+        image = self.render_pdf_page(pdf_path, page, dpi=higher_dpi, scratch_dir=scratch_dir)
+        if image is None:
+            return ocr_result
+        PDF_PAGE_IMAGES.labels(source='escalated').inc()
+        try:
+            retry = self.try_recognize_image(image, debug=debug)
+        finally:
+            image.close()
+        return retry if (retry.mean_confidence() or 0) >= ocr_result.mean_confidence() else ocr_result
+
+    def page_memory_estimate(self, page_size=None, embedded=None):
+        """
+        Memória (bytes) de uma página no pior caso: a imagem embutida ou a página em tons de cinza
+        na maior DPI possível (OCR_RENDER_DPI_MAX, alcançada ao renderizar de novo), no mínimo na
+        largura do pré-processamento, vezes PAGE_MEMORY_FACTOR. Sem o tamanho, considera uma A4.
+        """
+        if embedded is not None:
+            pixels = embedded.width * embedded.height * (1 if embedded.color == 'gray' else 3)
+        else:
+            width, height = (page_size[0], page_size[1]) if page_size else (595, 842)
+            scale = self.render_dpi_max / 72
+            pixels = width * scale * height * scale
+            pixels = max(pixels, TARGET_WIDTH * TARGET_WIDTH * height / max(width, 1))
+        return int(pixels * PAGE_MEMORY_FACTOR)
+
+    def stream_ocr_pages(self, pdf_path, page_numbers, geometry, scans, debug=None):
+        """
+        OCR de muitas páginas com memória limitada (ver page_stream.stream_map): uma thread
+        renderiza (ou extrai) as páginas em ordem em um diretório temporário (OCR_SCRATCH_DIR;
+        tmpfs em /dev/shm por padrão) e as entrega por uma fila de OCR_STREAM_QUEUE_SIZE posições
+        a até OCR_PAGE_WORKERS threads de OCR. Antes de carregar uma página, reserva em um
+        MemoryBudget de OCR_JOB_MEMORY_BUDGET_MB o pior caso dela (page_memory_estimate), corrigido
+        para o tamanho real da imagem depois de carregada se este for maior; a reserva é devolvida
+        quando o texto da página é produzido e a imagem, fechada. Retorna {página: texto}, sem as
+        páginas que não puderam ser carregadas.
+        """
+        budget = MemoryBudget(self.job_memory_budget)
+        pdf_logger.info(f"Modo streaming: {len(page_numbers)} página(s), até {self.job_memory_budget / 1048576:.0f} MB "
+                        f"de páginas em memória e {self.page_workers} thread(s) de OCR.")
+
+        def cost(page):
+            return self.page_memory_estimate(geometry.get(page), scans.get(page))
+
+        def loaded_cost(loaded):
+            image = loaded[0]
+            if image is None:
+                return 0
+            return image.width * image.height * len(image.getbands()) * PAGE_MEMORY_FACTOR
+
+        with tempfile.TemporaryDirectory(prefix='nf_pages_', dir=self.scratch_dir) as scratch_dir:
+            def load(page):
+                return self.load_pdf_page_image(pdf_path, page, geometry.get(page), scans.get(page),
+                                                scratch_dir=scratch_dir)
+
+            def process(page, loaded):
+                image, dpi = loaded
+                if image is None:
+                    return None
+                ocr_result = self.recognize_loaded_page(pdf_path, page, image, dpi, debug=debug, scratch_dir=scratch_dir)
+                return self.ocr_result_text(ocr_result)
+
+            def release(loaded):
+                if loaded[0] is not None:
+                    loaded[0].close()
+
+            texts = stream_map(page_numbers, load, process, workers=self.page_workers,
+                               queue_size=self.stream_queue_size, budget=budget, cost=cost,
+                               loaded_cost=loaded_cost, release=release, name='nf-stream')
+        if budget.peak > self.job_memory_budget:
+            pdf_logger.warning(f"As páginas em memória chegaram a {budget.peak / 1048576:.0f} MB, acima de "
+                               "OCR_JOB_MEMORY_BUDGET_MB (página maior que o próprio limite ou que a estimativa).")
+        return {page: text for page, text in zip(page_numbers, texts) if text is not None}
+
+    def read_pdf_text_layer(self, pdf_path, page_numbers):
+        """
+        Lê a camada de texto embutida das páginas informadas com uma única chamada ao pdftotext.
+        Retorna um dicionário {página: texto}; vazio se a triagem estiver desativada ou falhar.
+        """
+        if not self.use_text_layer or not page_numbers:
+            return {}
+        first_page, last_page = min(page_numbers), max(page_numbers)
+        try:
+            with stage_timer('text_layer'):
+                texts = extract_text_layer(pdf_path, first_page, last_page, poppler_path=self.poppler_path)
+        except Exception as e:
+            pdf_logger.warning(f"Não foi possível ler a camada de texto do PDF ({e}). Usando OCR.")
+            return {}
+        return {page: texts[page - first_page] for page in page_numbers}
+
+    def extract_text_from_pdf(self, pdf_path, pages=None, debug=None):
+        """
+        Extrai o texto das páginas selecionadas de um PDF, retornando uma lista de textos: com uma
+        única página, o texto dela; com mais, um texto por página lida, prefixado com o marcador da
+        página (ver merge_page_texts). Páginas que não puderam ser lidas, vazias ou descartadas por
+        baixa relevância não entram na lista.
+        Páginas com camada de texto utilizável não passam por rasterização nem OCR; as demais
+        (digitalizadas) são renderizadas e enviadas ao Tesseract (ver read_pdf_pages). Com mais
+        de uma página, os textos são combinados por merge_page_texts; quando todas as páginas
+        são lidas (sem seleção explícita ou com 'all'), as pouco relevantes são descartadas.
+        """
+        page_numbers = self.resolve_pdf_pages(pdf_path, pages)
+        page_texts = self.read_pdf_pages(pdf_path, page_numbers, debug=debug)
+        if len(page_numbers) == 1:
+            return [text for _, text in page_texts]
+        return self.merge_page_texts(page_texts, skip_irrelevant=parse_page_spec(pages) in (None, 'all'))
+
+    def read_pdf_pages(self, pdf_path, page_numbers, debug=None):
+        """
+        Lê o texto de cada página, até OCR_PAGE_WORKERS páginas ao mesmo tempo. Retorna uma lista
+        de (página, texto) na ordem das páginas, sem as páginas que não puderam ser renderizadas.
+        A partir de OCR_STREAM_MIN_PAGES páginas digitalizadas, o OCR usa stream_ocr_pages.
+        """
+        text_layers = self.read_pdf_text_layer(pdf_path, page_numbers)
+        usable_layers = {page for page, text in text_layers.items()
+                         if text and is_text_layer_usable(text, min_chars=self.text_layer_min_chars)}
+        ocr_pages = [page for page in page_numbers if page not in usable_layers]
+        geometry = self.read_page_geometry(pdf_path, ocr_pages)
+        scans = self.find_embedded_scans(pdf_path, ocr_pages, geometry)
+
+        def read_page(page):
+            if page in usable_layers:
+                pdf_logger.debug(f"Página {page}: usando a camada de texto embutida (sem OCR).")
+                return self.clean_ocr_text(text_layers[page])
+
+            pdf_logger.debug(f"Página {page}: sem camada de texto utilizável, aplicando OCR.")
+            ocr_result = self.recognize_pdf_page(pdf_path, page, geometry.get(page), scans.get(page), debug=debug)
+            return self.ocr_result_text(ocr_result) if ocr_result is not None else None
+
+        if self.stream_min_pages and len(ocr_pages) >= self.stream_min_pages:
+            ocr_texts = self.stream_ocr_pages(pdf_path, ocr_pages, geometry, scans, debug=debug)
+            texts = [read_page(page) if page in usable_layers else ocr_texts.get(page) for page in page_numbers]
+        else:
+            texts = self._map_in_context('ocr-page', self.page_workers, read_page, page_numbers)
+        return [(page, text) for page, text in zip(page_numbers, texts) if text is not None]
+
+    def merge_page_texts(self, page_texts, skip_irrelevant=True):
+        """
+        Prefixa o texto de cada página com o marcador '--- Página N ---', mantendo a ordem. Com
+        'skip_irrelevant', as páginas além da primeira com relevância abaixo de
+        OCR_PAGE_MIN_RELEVANCE (ver page_relevance) são descartadas. Páginas vazias são omitidas.
+        """
+        merged = []
+        for index, (page, text) in enumerate(page_texts):
+            if not text:
+                continue
+            if skip_irrelevant and index > 0:
+                relevance = page_relevance(text)
+                if relevance < self.page_min_relevance:
+                    pdf_logger.info(f"Página {page} descartada por baixa relevância ({relevance:.2f}).")
+                    continue
+            merged.append(f"--- Página {page} ---\n{text}")
+        return merged
+
+    def _map_in_context(self, name, workers, function, items):
+        """
+        Aplica 'function' a cada item em um pool de 'workers' threads (criado uma vez por nome),
+        retornando os resultados na ordem dos itens. Cada chamada roda em uma cópia do contexto
+        atual, para que os tempos por etapa continuem sendo somados na requisição (ver
+        metrics.collect_timings). Com um único item ou worker, roda na própria thread.
+        """
+        if len(items) < 2 or workers < 2:
+            return [function(item) for item in items]
+        with self._executors_lock:
+            executor = self._executors.get(name)
+            if executor is None:
+                executor = self._executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        futures = [executor.submit(contextvars.copy_context().run, function, item) for item in items]
+        return [future.result() for future in futures]
+
+    def preprocess_image(self, image, debug=None):
         """
         Aplica técnicas de pré-processamento em um objeto de imagem PIL para
         melhorar a qualidade (simulando uma "digitalização melhorada") para OCR.
         Argumentos:
             image (PIL.Image.Image): A imagem a ser pré-processada.
+            debug (DebugSession): Se informado, a imagem resultante é salva para depuração visual.
         Retorna:
             PIL.Image.Image: A imagem pré-processada.
         """
-        print("Iniciando pré-processamento para 'digitalização melhorada'...")
-        img = image.copy() # Trabalhar com uma cópia
-
-        # 1. Converter para escala de cinza ('L')
-        img = img.convert('L')
-        print(f"- Convertida para escala de cinza. Modo: {img.mode}")
-
-        # 2. Redimensionamento (Scaling) - Aumentar se a imagem for pequena
-        original_width, original_height = img.size
-        # Defina uma largura mínima desejada, por exemplo, para que o texto não seja muito pequeno.
-        # Ajuste 'target_width' conforme necessário após testes.
-        target_width = 2000 # pixels (exemplo)
-        if original_width < target_width:
-            scale_factor = target_width / original_width
-            new_width = int(original_width * scale_factor)
-            new_height = int(original_height * scale_factor)
-            print(f"- Redimensionando de ({original_width}x{original_height}) para ({new_width}x{new_height}) com Lanczos.")
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            print(f"- Imagem redimensionada. Modo: {img.mode}")
-
-        # 3. Ajuste de Contraste
-        enhancer_contrast = ImageEnhance.Contrast(img)
-        img = enhancer_contrast.enhance(1.5) # Experimente valores como 1.2 a 2.0
-        print(f"- Contraste aumentado. Modo: {img.mode}")
-
-        # 4. Remoção de Ruído (Opcional, aplicar com cuidado)
-        # Descomente e teste se suas imagens tiverem muito ruído.
-        # img = img.filter(ImageFilter.MedianFilter(size=3))
-        # print(f"- Aplicado filtro de mediana (se descomentado). Modo: {img.mode}")
-
-        # img = img.filter(ImageFilter.SMOOTH) # Alternativa mais suave
-        # print(f"- Aplicado filtro SMOOTH (se descomentado). Modo: {img.mode}")
-
-        # 5. Aumento da Nitidez (Sharpening)
-        enhancer_sharpness = ImageEnhance.Sharpness(img)
-        img = enhancer_sharpness.enhance(1.7) # Experimente valores como 1.5 a 2.5
-        print(f"- Nitidez aumentada. Modo: {img.mode}")
-
-        # 6. Binarização (Thresholding) - Crucial para o Tesseract
-        threshold_value = 140  # Experimente valores entre 120 e 170.
-        img = img.point(lambda x: 0 if x < threshold_value else 255, '1')
-        print(f"- Aplicada binarização com limiar {threshold_value}. Modo: {img.mode}")
-
-        # 7. GARANTIR MODO CORRETO PARA TESSERACT:
-        # Se o Tesseract tiver problemas com o modo '1' diretamente (raro se a binarização for boa),
-        # você pode converter de volta para 'L'. O Tesseract fará sua própria binarização interna.
-        # if img.mode == '1':
-        #     print(f"- Imagem está em modo '1'. Convertendo para 'L' para Tesseract.")
-        #     img = img.convert('L')
-
-        # Salve a imagem para depuração visual
-        try:
-            debug_image_path = "debug_preprocessed_scan_effect.png"
-            img.save(debug_image_path)
-            print(f"- Imagem de depuração ('scan effect') salva como: {debug_image_path}")
-        except Exception as e:
-            print(f"- Erro ao salvar imagem de depuração: {e}")
+        preprocess_logger.debug(f"Iniciando pré-processamento para 'digitalização melhorada' (motor: {self.preprocess_engine})...")
+        # Escala de cinza, redimensionamento (Lanczos), contraste, nitidez e binarização;
+        # ver image_preprocessing para os parâmetros de cada passo.
+        with stage_timer('preprocess'):
+            img = preprocess(image, engine=self.preprocess_engine)
+
+        # Imagem para depuração visual (gravada em segundo plano, só quando solicitada)
+        if debug is not None:
+            debug.save_image(img, 'preprocessed')
 
-        print(f"Pré-processamento 'scan effect' concluído. Modo final para Tesseract: {img.mode}")
+        preprocess_logger.debug(f"Pré-processamento 'scan effect' concluído. Modo final para Tesseract: {img.mode}")
         return img
 
     def clean_ocr_text(self, text: str) -> str:
         """
         Limpa o texto extraído pelo OCR, removendo caracteres indesejados.
+        Com OCR_PRESERVE_LAYOUT ativo (padrão), mantém uma linha de texto por linha do documento,
+        colapsando apenas os espaços dentro de cada linha, para que o modelo consiga associar
+        descrição, quantidade e valores de cada item; caso contrário, une tudo em uma só linha.
         """
         if not text:
             return ""
 
-        # Caracteres a serem removidos. Você pode expandir esta string.
-        # O caractere pipe '|' está incluído aqui, assim como outros comuns.
-        chars_to_remove = "|\"$%*&()[]{}\\`~<>^" # Adicione outros conforme necessário
-
-        cleaned_text = text
-        for char in chars_to_remove:
-            cleaned_text = cleaned_text.replace(char, "")
+        with stage_timer('clean'):
+            return normalize_ocr_text(text, preserve_layout=self.preserve_layout)
 
-        # Opcional: Substituir múltiplos espaços por um único espaço e remover espaços nas extremidades
-        cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
+    def recognize_image(self, image, debug=None):
+        """
+        Pré-processa a imagem e executa o OCR uma única vez, retornando o OCRResult com o texto
+        bruto e as palavras (caixas, confianças, blocos, parágrafos e linhas; ver ocr_engines).
+        """
+        processed_image = self.preprocess_image(image, debug=debug)
 
-        # Não vamos printar aqui para manter o log mais limpo, já temos o print do texto bruto.
-        return cleaned_text
+        ocr_logger.debug(f"Extraindo texto com {self.ocr_engine.describe()}")
+        with stage_timer('ocr'):
+            ocr_result = self.ocr_engine.image_to_words(processed_image)
+        if len(ocr_result):
+            ocr_logger.debug("Palavras reconhecidas", extra={
+                'palavras': len(ocr_result), 'confianca_media': round(ocr_result.mean_confidence(), 1),
+                'altura_mediana': ocr_result.median_word_height(),
+            })
+        return ocr_result
 
-    def extract_text_from_image(self, image):
+    def try_recognize_image(self, image, debug=None):
         """
-        Executa OCR em um objeto de imagem PIL (após pré-processamento) e retorna o texto extraído.
+        Como recognize_image, mas um erro do OCR é registrado e resulta em um OCRResult vazio.
+        Só a falta do executável do Tesseract interrompe o processamento.
         """
         try:
-            processed_image = self.preprocess_image(image)
-
-            # --- EXPERIMENTE DIFERENTES MODOS PSM ---
-            # psm_mode = 6  # Assume um único bloco uniforme de texto.
-            psm_mode = 4  # Assume uma única coluna de texto de tamanhos variáveis. (Bom para documentos)
-            # psm_mode = 7  # Trata a imagem como uma única linha de texto.
-            # psm_mode = 11 # Texto esparso.
-            # psm_mode = 3  # Segmentação de página totalmente automática. (Padrão do Tesseract)
-
-            custom_config = f'-l por --oem 3 --psm {psm_mode}'
-            print(f"Extraindo texto com Tesseract usando config: '{custom_config}'")
-
-            raw_text = self.pytesseract.image_to_string(processed_image, config=custom_config)
-
-            if not raw_text.strip():
-                print("Aviso: OCR não retornou texto. A imagem pode estar em branco ou o texto não é legível.")
-                return ""
-            else:
-                print("\nTexto BRUTO extraído pelo OCR (antes da limpeza):\n", raw_text)
-
-            cleaned_text = self.clean_ocr_text(raw_text)
-            print("\nTexto LIMPO extraído pelo OCR (após remoção de caracteres indesejados):\n", cleaned_text)
-            return cleaned_text # Retorna o texto já limpo
-
+            return self.recognize_image(image, debug=debug)
         except self.pytesseract.TesseractNotFoundError:
-            print("Erro Crítico: Executável do Tesseract não encontrado. Verifique a instalação e a configuração do caminho.")
+            ocr_logger.critical("Executável do Tesseract não encontrado. Verifique a instalação e a configuração do caminho.")
             raise
         except Exception as e:
-            print(f"Erro durante a execução do OCR: {str(e)}")
-            print(traceback.format_exc()) # Imprime o traceback completo do erro
+            ocr_logger.exception(f"Erro durante a execução do OCR: {str(e)}")
+            return OCRResult('')
+
+    def ocr_result_text(self, ocr_result):
+        """Texto limpo de um OCRResult (vazio se o OCR não reconheceu nada)."""
+        raw_text = ocr_result.text
+        if not raw_text.strip():
+            ocr_logger.warning("OCR não retornou texto. A imagem pode estar em branco ou o texto não é legível.")
             return ""
+        log_payload(ocr_logger, "Texto BRUTO extraído pelo OCR (antes da limpeza)", raw_text)
+
+        cleaned_text = self.clean_ocr_text(raw_text)
+        log_payload(ocr_logger, "Texto LIMPO extraído pelo OCR (após remoção de caracteres indesejados)", cleaned_text)
+        return cleaned_text # Retorna o texto já limpo
+
+    def extract_text_from_image(self, image, debug=None):
+        """
+        Executa OCR em um objeto de imagem PIL (após pré-processamento) e retorna o texto extraído.
+        """
+        return self.ocr_result_text(self.try_recognize_image(image, debug=debug))
 
     def extract_json_block(self, text):
         """
-        Extrai o primeiro bloco JSON válido de uma string de texto.
+        Extrai o primeiro objeto JSON válido de uma string de texto (ver find_json_object).
         """
-        if not text:
-            return None
-        match = re.search(r'```json\s*({.*?})\s*```|({.*?})', text, re.DOTALL)
-        if match:
-            json_str = match.group(1) or match.group(2)
-            if json_str:
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError as e:
-                    print(f"Erro ao decodificar JSON: {e}")
-                    print(f"String JSON problemática (primeiros 500 chars): {json_str[:500]}")
-                    return None
-            else:
-                print("Regex encontrou um padrão, mas o grupo de captura JSON estava vazio.")
-                return None
-        print("Nenhum bloco JSON encontrado na resposta com a regex.")
-        return None
+        extracted = find_json_object(text)
+        if extracted is None and text:
+            llm_logger.warning("Nenhum objeto JSON válido encontrado na resposta.")
+            log_payload(llm_logger, "Resposta sem JSON válido", text)
+        return extracted
 
     def extract_invoice_data(self, text):
         """
-        Envia o texto extraído para o modelo da OpenAI para extrair dados estruturados.
+        Extrai os dados estruturados da nota fiscal a partir do texto.
+        Os campos de formato rígido (CNPJ, chave de acesso, datas e valor total) são primeiro
+        procurados por regras determinísticas; a chamada à OpenAI é dispensada quando as regras
+        preenchem todos os campos de NF_RULES_REQUIRED_FIELDS e, caso contrário, recebe os valores
+        já validados para que o modelo se concentre nos demais campos.
         """
         if not text or not text.strip():
-            print("Texto de entrada para OpenAI está vazio. Retornando erro.")
+            logger.warning("Texto de entrada para OpenAI está vazio. Retornando erro.")
             return {"erro": "Nenhum texto legível foi extraído da imagem para enviar à OpenAI."}
 
-        system_prompt = (
-            "Você é um assistente altamente especializado em extrair informações detalhadas de textos de notas fiscais brasileiras (NF-e ou NFS-e).\n"
-            "Analise o texto fornecido e responda SOMENTE com um objeto JSON válido.\n"
-            "O JSON deve conter os seguintes campos:\n"
-            "- 'numero_nota_fiscal': (string) O número da nota fiscal.\n"
-            "- 'data_emissao': (string) A data de emissão no formato 'DD/MM/AAAA'.\n"
-            "- 'valor_total': (float) O valor total da nota. Use ponto como separador decimal. Se não encontrar, use null.\n"
-            "- 'cnpj_emitente': (string) O CNPJ do emitente, contendo apenas números (remova pontos, barras e traços).\n"
-            "- 'nome_razao_social_emitente': (string) O nome ou razão social do emitente.\n"
-            "- 'endereco_emitente': (string) O endereço completo do emitente.\n"
-            "- 'chave_acesso': (string) A chave de acesso da NF-e (44 dígitos numéricos). Se não for uma NF-e ou não encontrar, use null.\n"
-            "- 'itens': (lista de objetos) Uma lista de itens da nota. Cada item deve ser um objeto com os campos:\n"
-            "  - 'descricao': (string) Descrição do item/serviço.\n"
-            "  - 'quantidade': (float) Quantidade do item. Use ponto como separador decimal.\n"
-            "  - 'valor_unitario': (float) Valor unitário do item. Use ponto como separador decimal.\n"
-            "  - 'valor_total_item': (float) Valor total do item (quantidade * valor_unitario). Use ponto como separador decimal.\n"
-            "O número da nota NUNCA virá acompanhado de 'RPS'.\n"
-            "O número da NFS geralmente vem próximo de frases como 'Número da NF-E' ou 'Numero da nota' ou frases semelhantes.\n"
-            "Sempre utilize ponto como separador decimal e não utilize separador de milhar.\n"
-            "Ao colocar o emitente da nota fiscal, esse deve estar próximo a frases como 'prestador de serviço' ou 'emitente' vinculado a uma razão social.\n"
-            "Se um campo específico não puder ser encontrado no texto, seu valor no JSON deve ser null.\n"
-            "Se partes de um campo estiverem fragmentadas no texto (por exemplo, endereço quebrado em várias linhas), una essas partes logicamente para preencher o campo completo.\n"
-            "Campos numéricos (quantidade, valor_unitario, valor_total, etc.) devem ser representados como números reais (sem aspas). Verifique a coerência entre valor_total_item = quantidade × valor_unitario.\n"
-            "Se o CNPJ ou a chave de acesso estiverem incompletos, com menos dígitos ou em formato inválido, retorne null.\n"
-            "Se houver múltiplos valores possíveis para um campo (por exemplo, mais de uma data ou valor), escolha o que estiver mais fortemente associado ao contexto da emissão da nota fiscal.\n"
-            "O texto de entrada pode conter erros de OCR. Tente interpretar e corrigir erros comuns (ex: '1' por 'I', '0' por 'O', letras trocadas, caracteres faltando ou sobrando) ao preencher os campos, baseando-se no contexto de uma nota fiscal brasileira e na estrutura esperada para cada campo.\n"
-            "Se o texto fornecido não parecer ser de uma nota fiscal ou se a extração falhar significativamente, responda com: {\"erro\": \"Não foi possível extrair dados da nota fiscal a partir do texto fornecido.\"}"
+        with stage_timer('rules'):
+            rule_fields = extract_fields(text)
+        validated = {name: match.value for name, match in rule_fields.items()
+                     if match.confidence >= self.rules_min_confidence}
+        confidences = {name: rule_fields[name].confidence for name in validated}
+        if validated:
+            rules_logger.info("Campos validados por regras", extra={'campos': confidences})
+
+        if self.rules_required_fields and all(name in validated for name in self.rules_required_fields):
+            rules_logger.info("Regras preencheram todos os campos obrigatórios; chamada à OpenAI dispensada.")
+            result = {name: None for name in INVOICE_FIELDS}
+            result.update(validated)
+            result['campos_validados'] = confidences
+            return result
+
+        with stage_timer('compress'):
+            compressed = self.text_compressor.compress(text)
+
+        cache_key = self.llm_cache_key(compressed.text, validated)
+        extracted_json = self.llm_cache.get(cache_key)
+        if extracted_json is not None:
+            llm_logger.info("Resposta do modelo reaproveitada do cache (texto já enviado antes).")
+        else:
+            LLM_INPUT_TOKENS.labels(kind='original').inc(compressed.original_tokens)
+            LLM_INPUT_TOKENS.labels(kind='sent').inc(compressed.tokens)
+            llm_logger.info("Texto comprimido para o modelo", extra={
+                'tokens_originais': compressed.original_tokens, 'tokens_enviados': compressed.tokens,
+                'tokens_economizados': compressed.original_tokens - compressed.tokens,
+                'cortado': compressed.truncated, 'contagem': self.text_compressor.counter.name,
+            })
+            extracted_json = self.extract_invoice_data_with_llm(compressed.text, validated)
+            if isinstance(extracted_json, dict) and "erro" not in extracted_json:
+                self.llm_cache.put(cache_key, extracted_json)
+        if validated and isinstance(extracted_json, dict) and "erro" not in extracted_json:
+            # Valores com dígitos verificadores conferidos prevalecem sobre a leitura do modelo
+            extracted_json.update(validated)
+            extracted_json['campos_validados'] = confidences
+        return extracted_json
+
+    def llm_cache_key(self, text, validated=None):
+        """Chave do cache de respostas: texto normalizado, campos validados, modelo, prompt e temperatura."""
+        return make_cache_key(
+            normalize_llm_text(text), json.dumps(validated or {}, sort_keys=True),
+            self.model, PROMPT_VERSION, LLM_TEMPERATURE, self.structured_output,
         )
+
+    def extract_invoice_data_with_llm(self, text, validated=None):
+        """
+        Envia o texto extraído para o modelo da OpenAI para extrair dados estruturados.
+        'validated' traz campos já extraídos por regras, informados ao modelo no prompt.
+        """
         user_prompt = f"Por favor, extraia os dados da seguinte nota fiscal, conforme as instruções:\n\n```text\n{text}\n```"
+        if validated:
+            user_prompt += (
+                "\n\nOs campos a seguir já foram extraídos e validados (dígitos verificadores conferidos). "
+                f"Use exatamente estes valores e concentre-se nos demais campos: {json.dumps(validated, ensure_ascii=False)}"
+            )
 
-        print("Enviando texto para o modelo OpenAI...")
+        llm_logger.debug("Enviando texto para o modelo OpenAI...", extra={'chars': len(text)})
         try:
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,
-            )
-            reply_content = response.choices[0].message.content
-            print("\nResposta bruta do modelo OpenAI:\n", reply_content)
-            extracted_json = self.extract_json_block(reply_content)
-
-            if extracted_json:
-                if "erro" in extracted_json and extracted_json["erro"] == "Não foi possível extrair dados da nota fiscal a partir do texto fornecido.":
-                    print(f"Modelo OpenAI indicou erro na extração: {extracted_json['erro']}")
-                return extracted_json
+            response = self._create_completion([
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt}
+            ])
+            reply_content = reply_text(response.choices[0].message)
+            log_payload(llm_logger, "Resposta bruta do modelo OpenAI", reply_content)
+            with stage_timer('json_parse'):
+                extracted_json = self.extract_json_block(reply_content)
+
+            if extracted_json is None:
+                return {"erro": "Resposta do modelo OpenAI não é um JSON válido ou não foi possível extrair o bloco JSON."}
+            if extracted_json.get("erro") is None:
+                extracted_json.pop("erro", None) # No modo estrito o campo sempre vem, nulo quando não há erro
             else:
-                print("Não foi possível parsear um bloco JSON da resposta do modelo OpenAI usando a regex.")
-                try:
-                    direct_parsed_json = json.loads(reply_content)
-                    print("Conteúdo da resposta foi parseado diretamente como JSON.")
-                    return direct_parsed_json
-                except json.JSONDecodeError:
-                    print("A resposta completa do modelo também não é um JSON válido.")
-                    return {"erro": "Resposta do modelo OpenAI não é um JSON válido ou não foi possível extrair o bloco JSON."}
+                llm_logger.warning(f"Modelo OpenAI indicou erro na extração: {extracted_json['erro']}")
+            return extracted_json
         except openai.APIError as e:
-            print(f"Erro na API do OpenAI: {str(e)}")
+            llm_logger.error(f"Erro na API do OpenAI: {str(e)}")
             return {"erro": f"Erro na comunicação com a API OpenAI: {str(e)}"}
         except Exception as e:
-            print(f"Erro inesperado ao chamar a API OpenAI: {str(e)}")
-            print(traceback.format_exc())
+            llm_logger.exception(f"Erro inesperado ao chamar a API OpenAI: {str(e)}")
             return {"erro": f"Erro inesperado ao processar resposta da OpenAI: {str(e)}"}
 
-    def process_document(self, file_path):
+    def _create_completion(self, messages):
+        """
+        Chama o modelo no modo de saída estruturada ativo. Se a API recusar o modo (erro 400 sobre
+        response_format/json_schema/tools, como em modelos ou servidores compatíveis sem suporte a
+        json_schema), passa para o seguinte (json_schema -> tools -> off), repete a chamada e
+        registra o recuo para as chamadas seguintes. Outros erros 400 (contexto longo demais,
+        filtro de conteúdo) são levantados sem alterar o modo.
+        """
+        mode = self.active_structured_output
+        while True:
+            try:
+                with stage_timer('llm'):
+                    return self.llm_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=LLM_TEMPERATURE,
+                        **request_options(mode),
+                    )
+            except openai.BadRequestError as e:
+                if mode == 'off' or not is_structured_output_error(e):
+                    raise
+                fallback = next_structured_output_mode(mode)
+                llm_logger.warning(f"API recusou a saída estruturada '{mode}' ({e}); usando '{fallback}'.")
+                with self._structured_output_lock:
+                    # Outra thread pode já ter recuado além deste modo
+                    if STRUCTURED_OUTPUT_MODES.index(fallback) > STRUCTURED_OUTPUT_MODES.index(self.active_structured_output):
+                        self.active_structured_output = fallback
+                mode = fallback
+
+    def process_document(self, file_path, pages=None, debug=None, job_id=None):
         """
         Processa um arquivo (PDF ou imagem) para extrair dados da nota fiscal.
+        Para PDFs, 'pages' seleciona as páginas lidas (ver parse_page_spec); por padrão, OCR_DEFAULT_PAGES.
+        'debug' força (True) ou impede (False) a gravação de imagens de depuração; com None vale a
+        configuração OCR_DEBUG_*. 'job_id' identifica os arquivos de depuração gerados.
+        A duração total e as falhas alimentam as métricas (ver metrics).
+        """
+        with DOCUMENT_DURATION.time():
+            result = self._process_document(file_path, pages=pages, debug=debug, job_id=job_id)
+        if not result or "erro" in result:
+            record_error('document')
+        return result
+
+    def process_batch(self, file_path, pages=None, debug=None, job_id=None):
         """
-        print(f"\n--- Iniciando processamento do documento: {file_path} ---")
+        Processa um PDF com várias notas fiscais digitalizadas em sequência (lote). Todas as
+        páginas (ou as de 'pages'), até OCR_SPLIT_MAX_PAGES, são lidas em paralelo, agrupadas em
+        notas por split_documents e cada nota é extraída de forma independente, até
+        OCR_SPLIT_WORKERS ao mesmo tempo. Retorna {'total_documentos': N, 'documentos': [...]},
+        com as páginas e o resultado (ou o erro) de cada nota. Imagens são processadas como uma
+        única nota, no mesmo formato.
+        """
+        if os.path.splitext(file_path)[1].lower() != '.pdf':
+            result = self.process_document(file_path, pages=pages, debug=debug, job_id=job_id)
+            return {'total_documentos': 1, 'documentos': [{'paginas': [1], 'resultado': result}]}
+
+        logger.info("Iniciando processamento de lote", extra={'arquivo': file_path, 'job_id': job_id})
+        debug_session = self.debug_artifacts.start(job_id, force=debug)
+        try:
+            page_numbers = self.resolve_pdf_pages(file_path, pages if pages is not None else 'all',
+                                                  max_pages=self.split_max_pages)
+            page_texts = self.read_pdf_pages(file_path, page_numbers, debug=debug_session)
+        except ValueError as e:
+            logger.warning(f"Seleção de páginas inválida: {e}")
+            return {"erro": f"Seleção de páginas inválida: {e}"}
+        except self.pytesseract.TesseractNotFoundError:
+            raise
+        except Exception as e:
+            pdf_logger.error(f"Erro ao ler as páginas do lote: {str(e)}. Verifique se o Poppler está instalado e se o caminho (POPPLER_PATH) está configurado corretamente.")
+            return {"erro": f"Falha ao converter PDF '{file_path}' para imagem."}
+        if not page_texts:
+            return {"erro": "Nenhuma das páginas solicitadas existe no PDF."}
+
+        with stage_timer('split'):
+            documents = split_documents(page_texts, min_header_similarity=self.split_header_similarity)
+        logger.info(f"Lote com {len(page_texts)} página(s) separado em {len(documents)} nota(s).",
+                    extra={'job_id': job_id, 'notas': [[page for page, _ in document] for document in documents]})
+
+        def extract(document):
+            text = "\n".join(self.merge_page_texts(document))
+            if not text.strip():
+                return {"erro": "Nenhum texto legível foi extraído do documento."}
+            try:
+                with DOCUMENT_DURATION.time():
+                    result = self.extract_invoice_data(text)
+            except Exception as e:
+                logger.exception(f"Erro inesperado ao extrair a nota das páginas {[page for page, _ in document]}: {str(e)}")
+                result = {"erro": f"Erro inesperado durante o processamento do documento: {str(e)}"}
+            if not result or "erro" in result:
+                record_error('document')
+            return result
+
+        results = self._map_in_context('nf-split', self.split_workers, extract, documents)
+        return {
+            'total_documentos': len(documents),
+            'documentos': [{'paginas': [page for page, _ in document], 'resultado': result}
+                           for document, result in zip(documents, results)],
+        }
+
+    def _process_document(self, file_path, pages=None, debug=None, job_id=None):
+        logger.info("Iniciando processamento do documento", extra={'arquivo': file_path, 'job_id': job_id})
+        debug_session = self.debug_artifacts.start(job_id, force=debug)
         try:
             text = ""
             file_extension = os.path.splitext(file_path)[1].lower()
 
             if file_extension == '.pdf':
-                images = self.convert_pdf_to_images(file_path)
-                if not images:
-                    print(f"Falha ao converter PDF '{file_path}' para imagem.")
+                try:
+                    page_texts = self.extract_text_from_pdf(file_path, pages, debug=debug_session)
+                except ValueError as e:
+                    logger.warning(f"Seleção de páginas inválida: {e}")
+                    return {"erro": f"Seleção de páginas inválida: {e}"}
+                except self.pytesseract.TesseractNotFoundError:
+                    raise
+                except Exception as e:
+                    pdf_logger.error(f"Erro ao converter PDF para imagens: {str(e)}. Verifique se o Poppler está instalado e se o caminho (POPPLER_PATH) está configurado corretamente.")
                     return {"erro": f"Falha ao converter PDF '{file_path}' para imagem."}
-                if images:
-                    print("Processando a primeira página do PDF.")
-                    text = self.extract_text_from_image(images[0])
+                if not page_texts:
+                    logger.warning(f"Nenhuma das páginas solicitadas existe no PDF '{file_path}'.")
+                    return {"erro": "Nenhuma das páginas solicitadas existe no PDF."}
+                text = "\n".join(page_text for page_text in page_texts if page_text)
             elif file_extension in ['.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif']:
-                print(f"Abrindo arquivo de imagem: {file_path}")
+                logger.debug(f"Abrindo arquivo de imagem: {file_path}")
                 image = Image.open(file_path)
-                text = self.extract_text_from_image(image)
+                text = self.extract_text_from_image(image, debug=debug_session)
             else:
-                print(f"Formato de arquivo não suportado: {file_path}")
+                logger.warning(f"Formato de arquivo não suportado: {file_path}")
                 return {"erro": f"Formato de arquivo não suportado: {file_extension}. Use PDF, PNG, JPG, JPEG, TIFF, BMP ou GIF."}
 
             if not text or not text.strip():
-                print("Nenhum texto foi extraído do documento após OCR e limpeza.")
+                logger.warning("Nenhum texto foi extraído do documento após OCR e limpeza.")
                 return {"erro": "Nenhum texto legível foi extraído do documento."}
 
             extracted_data = self.extract_invoice_data(text)
-            print(f"--- Processamento do documento {file_path} concluído. ---")
+            logger.info("Processamento do documento concluído", extra={'arquivo': file_path, 'job_id': job_id})
             return extracted_data
         except Exception as e:
-            print(f"\nErro inesperado durante o processamento do documento '{file_path}': {str(e)}")
-            print(traceback.format_exc())
+            logger.exception(f"Erro inesperado durante o processamento do documento '{file_path}': {str(e)}")
             return {"erro": f"Erro inesperado durante o processamento do documento: {str(e)}"}
 
 # --- Exemplo de Uso ---
 if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python nf_processor.py <arquivo da nota (PDF ou imagem)>")
+        print("Para gerar notas sintéticas com gabarito, execute 'python bench/corpus.py'.")
+        sys.exit(2)
+    configure_logging()
     print("--- Iniciando Demonstração do Processador de Notas Fiscais ---")
     try:
         processor = NotaFiscalProcessor()
 
-        # Substitua pelo caminho do seu arquivo de nota fiscal (PDF ou imagem)
-        file_to_process = "documento_exemplo.jpg" #  <--- COLOQUE SEU ARQUIVO DE TESTE AQUI (PDF ou imagem)
+        # Caminho pela linha de comando (ex.: um documento gerado por 'python bench/corpus.py')
+        file_to_process = sys.argv[1]
 
         if not os.path.exists(file_to_process):
-            print(f"\nATENÇÃO: Arquivo de exemplo '{file_to_process}' não encontrado.")
-            print("Por favor, crie um arquivo PDF ou de imagem com este nome no diretório do script,")
-            print("ou altere a variável 'file_to_process' no código para apontar para seu arquivo de teste.")
+            print(f"\nATENÇÃO: Arquivo '{file_to_process}' não encontrado.")
         else:
             print(f"\nProcessando o arquivo: {file_to_process}")
             dados_nota = processor.process_document(file_to_process)
@@ -0,0 +1,254 @@
+import os
+import queue
+import statistics
+import threading
+from array import array
+from contextlib import contextmanager
+import pytesseract
+from log_config import get_logger
+
+try:
+    import tesserocr # Acesso direto à API C do Tesseract (opcional)
+except ImportError:
+    tesserocr = None
+
+logger = get_logger('ocr')
+
+
+class OCRResult:
+    """
+    Resultado de uma única passada do OCR: o texto e, para cada palavra, caixa (left, top, width,
+    height, em pixels da imagem), confiança (0 a 100) e posição na estrutura da página (bloco,
+    parágrafo e linha, numerados como no image_to_data do Tesseract).
+
+    Os dados das palavras ficam em colunas (array.array), e não em um dict de listas ou em um
+    objeto por palavra: uma página densa tem milhares de palavras e cada coluna ocupa só 4 bytes
+    por palavra. words[i] e as colunas na posição i descrevem a mesma palavra.
+    """
+    __slots__ = ('words', 'left', 'top', 'width', 'height', 'confidence', 'block', 'paragraph', 'line', '_text')
+
+    def __init__(self, text=None):
+        self.words = []
+        self.left = array('i')
+        self.top = array('i')
+        self.width = array('i')
+        self.height = array('i')
+        self.confidence = array('f')
+        self.block = array('i')
+        self.paragraph = array('i')
+        self.line = array('i')
+        self._text = text
+
+    def add_word(self, word, left, top, width, height, confidence, block, paragraph, line):
+        self.words.append(word)
+        self.left.append(left)
+        self.top.append(top)
+        self.width.append(width)
+        self.height.append(height)
+        self.confidence.append(confidence)
+        self.block.append(block)
+        self.paragraph.append(paragraph)
+        self.line.append(line)
+
+    def __len__(self):
+        return len(self.words)
+
+    @property
+    def text(self):
+        """
+        Texto reconhecido. Quando o motor não o fornece, é montado a partir das palavras: uma
+        linha de texto por linha da página e uma linha em branco entre parágrafos.
+        """
+        if self._text is None:
+            parts = []
+            previous = None
+            for index, word in enumerate(self.words):
+                position = (self.block[index], self.paragraph[index], self.line[index])
+                if previous is not None and position != previous:
+                    parts.append('\n\n' if position[:2] != previous[:2] else '\n')
+                elif previous is not None:
+                    parts.append(' ')
+                parts.append(word)
+                previous = position
+            self._text = ''.join(parts) + ('\n' if parts else '')
+        return self._text
+
+    def mean_confidence(self):
+        """Confiança média das palavras, ponderada pelo número de caracteres (None sem palavras)."""
+        total_chars = sum(len(word) for word in self.words)
+        if not total_chars:
+            return None
+        return sum(len(word) * confidence for word, confidence in zip(self.words, self.confidence)) / total_chars
+
+    def median_word_height(self):
+        """Altura mediana das palavras em pixels (None sem palavras)."""
+        return statistics.median(self.height) if self.height else None
+
+    def to_dict(self):
+        """Representação em JSON (colunas como listas), para depuração ou envio pela API."""
+        return {
+            'texto': self.text,
+            'palavras': list(self.words),
+            'caixas': [list(box) for box in zip(self.left, self.top, self.width, self.height)],
+            'confianca': [round(value, 1) for value in self.confidence],
+            'bloco': list(self.block),
+            'paragrafo': list(self.paragraph),
+            'linha': list(self.line),
+        }
+
+
+class PytesseractEngine:
+    """
+    OCR via pytesseract: cada chamada grava a imagem em um arquivo temporário e executa o
+    binário do Tesseract, que recarrega o modelo do idioma. Usado como alternativa quando
+    o tesserocr não está disponível.
+    """
+    name = 'pytesseract'
+
+    def __init__(self, lang='por', psm=4, oem=3):
+        self.lang = lang
+        self.psm = psm
+        self.oem = oem
+        self.config = f'-l {lang} --oem {oem} --psm {psm}'
+
+    def describe(self):
+        return f"pytesseract (config: '{self.config}')"
+
+    def image_to_words(self, image):
+        """Texto, caixas e confianças das palavras em uma única execução do Tesseract (image_to_data)."""
+        data = pytesseract.image_to_data(image, config=self.config, output_type=pytesseract.Output.DICT)
+        result = OCRResult()
+        for index, word in enumerate(data['text']):
+            confidence = float(data['conf'][index])
+            if confidence < 0 or not word.strip(): # Linhas de estrutura (páginas, blocos, linhas) ou vazias
+                continue
+            result.add_word(
+                word.strip(), data['left'][index], data['top'][index], data['width'][index], data['height'][index],
+                confidence, data['block_num'][index], data['par_num'][index], data['line_num'][index],
+            )
+        return result
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """
+    OCR via tesserocr com um pool de instâncias persistentes da API do Tesseract.
+
+    Cada instância carrega o modelo do idioma uma única vez e é reaproveitada entre páginas e
+    requisições. Uma instância não pode ser usada por duas threads ao mesmo tempo, por isso o
+    pool entrega cada uma a um único chamador por vez; novas instâncias são criadas sob demanda
+    até 'pool_size'.
+    """
+    name = 'tesserocr'
+
+    def __init__(self, lang='por', psm=4, oem=3, pool_size=None, tessdata_path=None):
+        if tesserocr is None:
+            raise RuntimeError("Pacote tesserocr não instalado.")
+        self.lang = lang
+        self.psm = psm
+        self.oem = oem
+        self.tessdata_path = tessdata_path
+        self.pool_size = pool_size or int(os.getenv('OCR_ENGINE_POOL_SIZE', str(os.cpu_count() or 1)))
+
+        self._idle = queue.LifoQueue() # LIFO: reaproveita a instância "mais quente"
+        self._lock = threading.Lock()
+        self._handles = []
+
+        # Cria a primeira instância já na inicialização para validar idioma e tessdata
+        self._created = 1
+        self._idle.put(self._create_handle())
+
+    def describe(self):
+        return f"tesserocr (lang={self.lang}, oem={self.oem}, psm={self.psm}, pool até {self.pool_size} instância(s))"
+
+    def _create_handle(self):
+        kwargs = {'lang': self.lang, 'psm': self.psm, 'oem': self.oem}
+        if self.tessdata_path:
+            kwargs['path'] = self.tessdata_path
+        handle = tesserocr.PyTessBaseAPI(**kwargs)
+        with self._lock:
+            self._handles.append(handle)
+        return handle
+
+    @contextmanager
+    def acquire(self):
+        """Empresta uma instância do pool (criando uma nova se houver espaço)."""
+        try:
+            handle = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.pool_size
+                if can_create:
+                    self._created += 1 # Reserva a vaga antes de criar fora do lock
+            if can_create:
+                try:
+                    handle = self._create_handle()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                handle = self._idle.get()
+        try:
+            yield handle
+        finally:
+            handle.Clear() # Libera a imagem e os resultados, mantendo o modelo carregado
+            self._idle.put(handle)
+
+    def image_to_words(self, image):
+        """
+        Texto, caixas e confianças das palavras de um único reconhecimento: depois de Recognize(),
+        tanto GetUTF8Text quanto o ResultIterator leem os resultados já calculados.
+        """
+        RIL = tesserocr.RIL
+        with self.acquire() as api:
+            api.SetImage(image)
+            api.Recognize()
+            result = OCRResult(text=api.GetUTF8Text())
+            iterator = api.GetIterator()
+            if iterator is None: # Página sem texto
+                return result
+            block = paragraph = line = 0
+            for word_iterator in tesserocr.iterate_level(iterator, RIL.WORD):
+                if word_iterator.IsAtBeginningOf(RIL.BLOCK):
+                    block, paragraph, line = block + 1, 0, 0
+                if word_iterator.IsAtBeginningOf(RIL.PARA):
+                    paragraph, line = paragraph + 1, 0
+                if word_iterator.IsAtBeginningOf(RIL.TEXTLINE):
+                    line += 1
+                try:
+                    word = word_iterator.GetUTF8Text(RIL.WORD)
+                except RuntimeError: # Palavra sem texto reconhecido
+                    continue
+                box = word_iterator.BoundingBox(RIL.WORD)
+                if not word or not word.strip() or box is None:
+                    continue
+                left, top, right, bottom = box
+                result.add_word(word.strip(), left, top, right - left, bottom - top,
+                                word_iterator.Confidence(RIL.WORD), block, paragraph, line)
+            return result
+
+    def close(self):
+        with self._lock:
+            handles, self._handles = self._handles, []
+        for handle in handles:
+            handle.End()
+
+
+def create_ocr_engine(kind=None, lang='por', psm=4, oem=3, tessdata_path=None):
+    """
+    Cria o motor de OCR configurado em OCR_ENGINE: 'tesserocr', 'pytesseract' ou 'auto' (padrão),
+    que usa o tesserocr quando disponível e o pytesseract caso contrário.
+    """
+    kind = (kind or os.getenv('OCR_ENGINE', 'auto')).lower()
+    if kind in ('auto', 'tesserocr'):
+        try:
+            return TesserocrEngine(lang=lang, psm=psm, oem=oem, tessdata_path=tessdata_path)
+        except Exception as e:
+            if kind == 'tesserocr':
+                raise RuntimeError(f"Motor tesserocr não pôde ser inicializado. Detalhes: {e}")
+            if tesserocr is not None:
+                logger.warning(f"tesserocr disponível mas não inicializou ({e}). Usando pytesseract.")
+    return PytesseractEngine(lang=lang, psm=psm, oem=oem)
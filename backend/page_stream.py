@@ -0,0 +1,145 @@
+"""
+Processamento de páginas em fluxo (streaming), com um limite de memória para as páginas carregadas.
+
+stream_map carrega os itens (páginas) em ordem em uma thread produtora e os entrega, por uma fila
+limitada, a threads consumidoras que os processam (pré-processamento e OCR). Antes de carregar um
+item, a produtora reserva o custo dele em um MemoryBudget e só segue quando a reserva cabe no
+limite; a reserva é devolvida depois que a consumidora processa e libera o item. Assim o pico de
+memória depende do limite e não da quantidade de páginas do documento.
+
+Só a produtora espera por memória: as consumidoras apenas devolvem reservas, de modo que o fluxo
+sempre avança (não há espera circular).
+"""
+import contextvars
+import queue
+import threading
+
+from log_config import get_logger
+
+logger = get_logger('pdf')
+
+_DONE = object() # Marca o fim da fila para as consumidoras
+
+
+class MemoryBudget:
+    """
+    Semáforo ponderado: acquire(n) espera até que n unidades (bytes, por exemplo) caibam no limite.
+    Um item maior que o limite inteiro é aceito quando nada mais está reservado, para que o fluxo
+    não pare; nesse caso ele é processado sozinho.
+    """
+
+    def __init__(self, limit):
+        self.limit = max(1, int(limit))
+        self.used = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, amount):
+        with self._condition:
+            while self.used and self.used + amount > self.limit:
+                self._condition.wait()
+            self._add(amount)
+
+    def charge(self, amount):
+        """Reserva 'amount' sem esperar (o item já está em memória e custou mais que o previsto)."""
+        with self._condition:
+            self._add(amount)
+
+    def release(self, amount):
+        with self._condition:
+            self.used -= amount
+            self._condition.notify_all()
+
+    def _add(self, amount):
+        self.used += amount
+        self.peak = max(self.peak, self.used)
+
+
+def stream_map(items, load, process, workers=1, queue_size=2, max_in_flight=None, budget=None, cost=None,
+               loaded_cost=None, release=None, name='nf-stream'):
+    """
+    Aplica process(item, load(item)) a cada item e retorna os resultados na ordem dos itens.
+
+    Argumentos:
+        load: Carrega o item (ex.: renderiza a página); roda em uma única thread, na ordem.
+        process: Processa o item carregado; roda em 'workers' threads.
+        queue_size: Itens carregados aguardando uma consumidora livre.
+        max_in_flight: Sem 'budget', máximo de itens carregados ao mesmo tempo (padrão:
+            workers + queue_size + 1).
+        budget: MemoryBudget que limita a soma dos custos dos itens carregados.
+        cost: Custo reservado antes de carregar o item (padrão: 1 por item).
+        loaded_cost: Custo real do item carregado; se passar da reserva, a diferença é cobrada.
+        release: Chamado com o item carregado depois do processamento (ex.: fechar a imagem),
+            também quando o processamento é interrompido por um erro.
+    A primeira exceção de load ou process interrompe o fluxo e é levantada de novo ao final.
+    Todas as threads rodam em cópias do contexto atual (ver metrics.collect_timings).
+    """
+    items = list(items)
+    workers = max(1, workers)
+    results = [None] * len(items)
+    if budget is None:
+        budget = MemoryBudget(max_in_flight or workers + queue_size + 1)
+        cost = None
+    pending = queue.Queue(maxsize=max(1, queue_size))
+    errors = []
+    stop = threading.Event()
+
+    def fail(error):
+        errors.append(error)
+        stop.set()
+
+    def produce():
+        try:
+            for index, item in enumerate(items):
+                if stop.is_set():
+                    break
+                reserved = cost(item) if cost is not None else 1
+                budget.acquire(reserved)
+                try:
+                    loaded = load(item)
+                    if loaded_cost is not None:
+                        actual = loaded_cost(loaded)
+                        if actual > reserved:
+                            budget.charge(actual - reserved)
+                            reserved = actual
+                except Exception:
+                    budget.release(reserved)
+                    raise
+                pending.put((index, item, loaded, reserved))
+        except Exception as e:
+            fail(e)
+        finally:
+            for _ in range(workers):
+                pending.put(_DONE)
+
+    def consume():
+        while True:
+            entry = pending.get()
+            if entry is _DONE:
+                return
+            index, item, loaded, reserved = entry
+            try:
+                if not stop.is_set():
+                    results[index] = process(item, loaded)
+            except Exception as e:
+                fail(e)
+            finally:
+                if release is not None:
+                    try:
+                        release(loaded)
+                    except Exception as e:
+                        logger.warning(f"Falha ao liberar o item {item}: {e}")
+                budget.release(reserved) # Devolve a reserva só depois que o item foi liberado
+
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(produce,), name=f"{name}-load", daemon=True)]
+    threads += [
+        threading.Thread(target=contextvars.copy_context().run, args=(consume,), name=f"{name}-{index}", daemon=True)
+        for index in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,182 @@
+import glob
+import os
+import re
+import subprocess
+import tempfile
+import unicodedata
+from collections import namedtuple
+
+from PIL import Image
+
+# Caracteres considerados válidos em texto de nota fiscal além de letras e dígitos
+COMMON_PUNCTUATION = set(" \t\n\r.,;:-/\\()[]{}%$#@&*+=_'\"ºª°|<>!?§")
+
+# Linha de 'pdfinfo -f N -l M': "Page    1 size: 595.28 x 841.89 pts (A4)" e "Page    1 rot:  90"
+PAGE_INFO_PATTERN = re.compile(r'^Page\s+(\d+)\s+(size|rot):\s+(.+)$', re.MULTILINE)
+PAGE_SIZE_PATTERN = re.compile(r'([\d.]+)\s+x\s+([\d.]+)')
+
+# Espaços de cor que o PIL abre sem conversão; CMYK, Lab e separações são renderizados pelo Poppler
+EMBEDDED_IMAGE_COLORS = ('gray', 'rgb', 'icc', 'index')
+
+# Fração mínima da área da página coberta pela imagem para considerá-la a digitalização da página
+MIN_PAGE_COVERAGE = 0.85
+
+# Imagem de 'pdfimages -list' (resolução efetiva na página em x_ppi/y_ppi)
+PdfImage = namedtuple('PdfImage', ['page', 'type', 'width', 'height', 'color', 'bpc', 'encoding', 'x_ppi', 'y_ppi'])
+
+
+def poppler_command(name, poppler_path=None):
+    """Retorna o caminho do executável do Poppler (ex.: 'pdftotext'), usando o PATH do sistema se poppler_path for None."""
+    return os.path.join(poppler_path, name) if poppler_path else name
+
+
+def extract_text_layer(pdf_path, first_page, last_page, poppler_path=None, timeout=60):
+    """
+    Extrai a camada de texto embutida das páginas [first_page, last_page] com 'pdftotext -layout',
+    preservando o layout de linhas e colunas. Retorna uma lista com o texto de cada página.
+    """
+    command = [
+        poppler_command('pdftotext', poppler_path),
+        '-layout', '-enc', 'UTF-8',
+        '-f', str(first_page), '-l', str(last_page),
+        pdf_path, '-',
+    ]
+    completed = subprocess.run(command, capture_output=True, timeout=timeout, check=True)
+    text = completed.stdout.decode('utf-8', errors='replace')
+    # O pdftotext separa as páginas com form feed
+    pages = text.split('\f')
+    expected = last_page - first_page + 1
+    return (pages + [''] * expected)[:expected]
+
+
+def is_text_layer_usable(text, min_chars=200, min_valid_ratio=0.9, min_alnum_ratio=0.5):
+    """
+    Avalia se o texto embutido de uma página é confiável o suficiente para dispensar o OCR.
+
+    Critérios:
+        - ao menos 'min_chars' caracteres visíveis (páginas digitalizadas costumam ter zero ou
+          apenas um carimbo/cabeçalho em texto);
+        - ao menos 'min_valid_ratio' dos caracteres visíveis são letras, dígitos ou pontuação comum
+          (fontes sem mapeamento Unicode geram lixo, '�' ou marcadores '(cid:NN)');
+        - ao menos 'min_alnum_ratio' dos caracteres visíveis são letras ou dígitos.
+    """
+    if not text:
+        return False
+    if '(cid:' in text:
+        return False
+
+    visible = [char for char in text if not char.isspace()]
+    if len(visible) < min_chars:
+        return False
+
+    valid = alnum = 0
+    for char in visible:
+        if char.isalnum():
+            alnum += 1
+            # Letras fora dos alfabetos latinos usuais indicam fonte sem mapeamento correto
+            if char.isascii() or unicodedata.name(char, '').startswith('LATIN'):
+                valid += 1
+        elif char in COMMON_PUNCTUATION:
+            valid += 1
+
+    return valid / len(visible) >= min_valid_ratio and alnum / len(visible) >= min_alnum_ratio
+
+
+def list_page_images(pdf_path, first_page, last_page, poppler_path=None, timeout=60):
+    """
+    Lista as imagens desenhadas nas páginas [first_page, last_page] com 'pdfimages -list'.
+    Retorna um dicionário {página: [PdfImage, ...]} (páginas sem imagens ficam de fora).
+    """
+    command = [
+        poppler_command('pdfimages', poppler_path),
+        '-list', '-f', str(first_page), '-l', str(last_page), pdf_path,
+    ]
+    completed = subprocess.run(command, capture_output=True, timeout=timeout, check=True)
+    images = {}
+    # Colunas: page num type width height color comp bpc enc interp object ID x-ppi y-ppi size ratio
+    for line in completed.stdout.decode('utf-8', errors='replace').splitlines()[2:]:
+        fields = line.split()
+        if len(fields) < 14 or not fields[0].isdigit():
+            continue
+        try:
+            image = PdfImage(
+                page=int(fields[0]), type=fields[2], width=int(fields[3]), height=int(fields[4]),
+                color=fields[5], bpc=int(fields[7]), encoding=fields[8],
+                x_ppi=float(fields[12]), y_ppi=float(fields[13]),
+            )
+        except ValueError:
+            continue
+        images.setdefault(image.page, []).append(image)
+    return images
+
+
+def page_geometry(pdf_path, first_page, last_page, poppler_path=None, timeout=60):
+    """
+    Tamanho (em pontos) e rotação das páginas [first_page, last_page], via 'pdfinfo -f -l'.
+    Retorna um dicionário {página: (largura, altura, rotação)}.
+    """
+    command = [
+        poppler_command('pdfinfo', poppler_path),
+        '-f', str(first_page), '-l', str(last_page), pdf_path,
+    ]
+    completed = subprocess.run(command, capture_output=True, timeout=timeout, check=True)
+    sizes, rotations = {}, {}
+    for match in PAGE_INFO_PATTERN.finditer(completed.stdout.decode('utf-8', errors='replace')):
+        page = int(match.group(1))
+        if match.group(2) == 'size':
+            size = PAGE_SIZE_PATTERN.match(match.group(3))
+            if size:
+                sizes[page] = (float(size.group(1)), float(size.group(2)))
+        else:
+            rotations[page] = int(match.group(3).split()[0]) % 360
+    return {page: (width, height, rotations.get(page, 0)) for page, (width, height) in sizes.items()}
+
+
+def single_page_image(images, page_size, min_dpi=150):
+    """
+    Retorna a PdfImage se a página for uma digitalização simples: uma única imagem (sem máscaras),
+    em um espaço de cor suportado, com resolução de ao menos 'min_dpi' e cobrindo a página inteira
+    na mesma orientação. Caso contrário (página composta), retorna None.
+    """
+    if not images or len(images) != 1 or page_size is None:
+        return None
+    image = images[0]
+    if image.type != 'image' or image.color not in EMBEDDED_IMAGE_COLORS:
+        return None
+    if min(image.x_ppi, image.y_ppi) < min_dpi:
+        return None
+    page_width, page_height = page_size[0], page_size[1]
+    # Imagem desenhada girada na página: o sentido do giro não aparece no 'pdfimages -list'
+    if (image.width >= image.height) != (page_width >= page_height):
+        return None
+    covered = (image.width / image.x_ppi) * (image.height / image.y_ppi)
+    page_area = (page_width / 72) * (page_height / 72)
+    if page_area <= 0 or covered / page_area < MIN_PAGE_COVERAGE:
+        return None
+    return image
+
+
+def extract_page_image(pdf_path, page, rotation=0, poppler_path=None, timeout=60):
+    """
+    Extrai a imagem embutida de uma página na resolução original com 'pdfimages -j -png' (JPEG
+    como está; CCITT, JBIG2, Flate etc. decodificados para PNG) e aplica a rotação da página.
+    Retorna a imagem PIL ou None se nada for extraído.
+    """
+    with tempfile.TemporaryDirectory(prefix='nf_pdfimages_') as directory:
+        command = [
+            poppler_command('pdfimages', poppler_path),
+            '-f', str(page), '-l', str(page), '-j', '-png',
+            pdf_path, os.path.join(directory, 'img'),
+        ]
+        subprocess.run(command, capture_output=True, timeout=timeout, check=True)
+        files = sorted(glob.glob(os.path.join(directory, 'img-*')))
+        if not files:
+            return None
+        image = Image.open(files[0])
+        image.load() # Lê os pixels antes de o diretório temporário ser removido
+    if rotation:
+        # /Rotate gira a página no sentido horário; o PIL gira no anti-horário
+        rotated = image.rotate(-rotation, expand=True)
+        image.close()
+        image = rotated
+    return image
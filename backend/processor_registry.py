@@ -0,0 +1,69 @@
+import threading
+import time
+from nf_processor import NotaFiscalProcessor
+from log_config import get_logger
+
+logger = get_logger('processor')
+
+
+class ProcessorRegistry:
+    def __init__(self, factory=NotaFiscalProcessor):
+        """
+        Mantém uma instância de NotaFiscalProcessor aquecida e compartilhada pelo processo.
+
+        A configuração (Tesseract, Poppler e OpenAI) é validada uma única vez em 'initialize'.
+        Depois disso o processador não altera seu próprio estado, então a mesma instância
+        pode ser usada simultaneamente por várias threads.
+        """
+        self.factory = factory
+        self._processor = None
+        self._error = None
+        self._initialized_at = None
+        self._lock = threading.Lock()
+
+    def initialize(self):
+        """
+        Cria e valida o processador. Retorna True se ficou pronto.
+        Chamadas repetidas depois de um sucesso não fazem nada.
+        """
+        with self._lock:
+            if self._processor is not None:
+                return True
+            try:
+                start = time.perf_counter()
+                self._processor = self.factory()
+                self._initialized_at = time.time()
+                self._error = None
+                logger.info(f"Processador inicializado em {(time.perf_counter() - start) * 1000:.0f} ms.")
+                return True
+            except Exception as e:
+                self._error = str(e)
+                logger.error(f"Falha ao inicializar o processador: {self._error}")
+                return False
+
+    def get(self):
+        """
+        Retorna o processador compartilhado, inicializando-o se necessário.
+        Levanta RuntimeError se a configuração for inválida.
+        """
+        processor = self._processor
+        if processor is not None:
+            return processor
+        if not self.initialize():
+            raise RuntimeError(f"Processador indisponível: {self._error}")
+        return self._processor
+
+    def is_ready(self):
+        return self._processor is not None
+
+    def status(self):
+        """Retorna o estado de prontidão para o endpoint de readiness."""
+        return {
+            'pronto': self.is_ready(),
+            'inicializado_em': self._initialized_at,
+            'erro': self._error,
+        }
+
+
+# Registro padrão do processo (cada worker de produção possui o seu)
+registry = ProcessorRegistry()
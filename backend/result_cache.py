@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from metrics import record_cache_lookup
+from log_config import get_logger
+
+logger = get_logger('cache')
+
+
+def make_cache_key(*parts):
+    """Combina as partes (hash do conteúdo, versões, parâmetros) em uma chave SHA-256."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries=None, directory=None, max_disk_entries=None, name='resultados',
+                 ttl=None, max_disk_bytes=None, env_prefix='OCR_RESULT_CACHE', default_directory=None,
+                 default_ttl=0):
+        """
+        Cache de resultados com LRU em memória e persistência opcional em disco.
+
+        Os padrões vêm das variáveis de ambiente <env_prefix>_* (OCR_RESULT_CACHE_* por padrão).
+
+        Argumentos:
+            max_entries (int): Entradas mantidas em memória (padrão: <env_prefix>_SIZE ou 256; 0 desativa o cache).
+            directory (str): Diretório para persistir os resultados em JSON (padrão: <env_prefix>_DIR
+                ou 'default_directory'; sem nenhum, ou com <env_prefix>_DIR vazio, o cache fica só
+                em memória). Em disco o cache sobrevive a reinícios e é compartilhado entre os
+                workers do servidor de produção.
+            max_disk_entries (int): Arquivos mantidos em disco (padrão: <env_prefix>_DISK_MAX ou 5000).
+            name (str): Nome do cache nas métricas de acertos e falhas.
+            ttl (float): Validade de uma entrada em segundos, contada da gravação
+                (padrão: <env_prefix>_TTL_SECONDS ou 'default_ttl'; 0 é sem expiração).
+            max_disk_bytes (int): Tamanho máximo dos arquivos em disco
+                (padrão: <env_prefix>_DISK_MAX_MB em megabytes ou 0, sem limite).
+        """
+        self.name = name
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv(f'{env_prefix}_SIZE', '256'))
+        self.directory = directory or os.getenv(f'{env_prefix}_DIR', default_directory) or None
+        self.max_disk_entries = max_disk_entries or int(os.getenv(f'{env_prefix}_DISK_MAX', '5000'))
+        self.ttl = ttl if ttl is not None else float(os.getenv(f'{env_prefix}_TTL_SECONDS', str(default_ttl)))
+        self.max_disk_bytes = (max_disk_bytes if max_disk_bytes is not None
+                               else int(float(os.getenv(f'{env_prefix}_DISK_MAX_MB', '0')) * 1024 * 1024))
+
+        # Em memória: chave -> (JSON serializado, instante da gravação)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.hits = 0
+        self.misses = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Retorna o resultado armazenado para a chave, ou None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                entry = None
+            serialized = entry[0] if entry is not None else None
+            if serialized is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if serialized is None:
+            serialized, stored_at = self._load(key)
+            with self._lock:
+                if serialized is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._remember(key, serialized, stored_at)
+        record_cache_lookup(self.name, serialized is not None)
+        if serialized is None:
+            return None
+        # Cada chamador recebe uma cópia própria, que pode ser alterada sem afetar o cache
+        return json.loads(serialized)
+
+    def put(self, key, value):
+        """Armazena o resultado em memória e, se configurado, em disco."""
+        if not self.enabled:
+            return
+        serialized = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, serialized, time.time())
+        self._store(key, serialized)
+
+    def _expired(self, stored_at, now=None):
+        return self.ttl > 0 and (now or time.time()) - stored_at > self.ttl
+
+    def _remember(self, key, serialized, stored_at):
+        self._entries[key] = (serialized, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key):
+        """Lê a entrada do disco: (JSON serializado, instante da gravação) ou (None, None)."""
+        if not self.directory:
+            return None, None
+        path = self._path(key)
+        try:
+            stored_at = os.stat(path).st_mtime
+            if self._expired(stored_at):
+                os.remove(path)
+                return None, None
+            with open(path, encoding='utf-8') as f:
+                serialized = f.read()
+            json.loads(serialized) # Descarta arquivos corrompidos
+        except (OSError, ValueError):
+            return None, None
+        try:
+            # O acesso marca o uso (atime) para a remoção dos menos usados; o mtime continua
+            # sendo o instante da gravação, usado pela validade (ttl)
+            os.utime(path, (time.time(), stored_at))
+        except OSError:
+            pass
+        return serialized, stored_at
+
+    def _store(self, key, serialized):
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(serialized)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o cache em '{path}': {e}")
+            return
+
+        with self._lock:
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= 100
+            if should_prune:
+                self._writes_since_prune = 0
+        if should_prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """
+        Remove os arquivos expirados e, enquanto o disco passar de max_disk_entries ou de
+        max_disk_bytes, os usados há mais tempo.
+        """
+        now = time.time()
+        try:
+            with os.scandir(self.directory) as entries:
+                files = []
+                for entry in entries:
+                    if entry.name.endswith('.json'):
+                        info = entry.stat()
+                        files.append((info.st_atime, info.st_mtime, info.st_size, entry.path))
+        except OSError:
+            return
+        files.sort()
+        total_bytes = sum(size for _, _, size, _ in files)
+        remaining = len(files)
+        for _, stored_at, size, path in files:
+            over_limit = remaining > self.max_disk_entries or (self.max_disk_bytes and total_bytes > self.max_disk_bytes)
+            if not over_limit and not self._expired(stored_at, now):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            remaining -= 1
+            total_bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {'entradas': len(self._entries), 'acertos': self.hits, 'falhas': self.misses}
@@ -0,0 +1,246 @@
+"""
+Servidor de produção com workers pré-criados (pre-fork).
+
+Cada worker é um processo com o seu próprio NotaFiscalProcessor já inicializado e
+atende requisições no mesmo socket aberto pelo processo mestre. Workers são
+reciclados após um número máximo de jobs ou quando a memória residente passa do
+limite configurado, e SIGTERM encerra tudo de forma ordenada: os workers param de
+aceitar conexões, terminam as requisições e jobs em andamento e só então saem.
+
+Uso (a partir da raiz do projeto ou do diretório backend):
+    python -m backend.serve --workers 4
+    python serve.py --workers 4
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+# Permite executar tanto como 'python -m backend.serve' quanto como 'python serve.py'
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from log_config import configure_logging, get_logger, shutdown_logging  # noqa: E402
+
+logger = get_logger('serve')
+
+# Rotas que disparam processamento e contam para a reciclagem do worker
+PROCESSING_PATHS = ('/api/process-invoice', '/api/jobs')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Servidor de produção do processador de notas fiscais.")
+    parser.add_argument('--host', default=os.getenv('OCR_SERVE_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('OCR_SERVE_PORT', '5000')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('OCR_SERVE_WORKERS', str(os.cpu_count() or 1))),
+                        help="Número de processos worker.")
+    parser.add_argument('--max-jobs', type=int, default=int(os.getenv('OCR_WORKER_MAX_JOBS', '500')),
+                        help="Recicla o worker após este número de processamentos (0 desativa).")
+    parser.add_argument('--max-rss-mb', type=int, default=int(os.getenv('OCR_WORKER_MAX_RSS_MB', '1024')),
+                        help="Recicla o worker quando a memória residente passa deste valor em MB (0 desativa).")
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.getenv('OCR_WORKER_GRACEFUL_TIMEOUT', '60')),
+                        help="Segundos aguardados no encerramento antes de forçar a saída dos workers.")
+    return parser.parse_args()
+
+
+def current_rss_mb():
+    """Retorna a memória residente atual do processo em MB (0 se não for possível medir)."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # Fora do Linux só há o pico (ru_maxrss, em bytes no macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except (ImportError, OSError):
+        return 0
+
+
+class JobCounter:
+    """Middleware WSGI que conta as requisições de processamento atendidas pelo worker."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.count = 0
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'POST' and environ.get('PATH_INFO') in PROCESSING_PATHS:
+            self.count += 1
+        return self.wsgi_app(environ, start_response)
+
+
+def run_worker(listen_socket, args):
+    """Loop principal de um worker. Retorna quando deve ser reciclado ou encerrado."""
+    from werkzeug.serving import make_server
+    from app import app, job_manager
+    from processor_registry import registry
+
+    stopping = False
+
+    def handle_term(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, handle_term)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    pid = os.getpid()
+    if not registry.initialize():
+        logger.error(f"Worker {pid}: processador não inicializado; atendendo com /api/ready em 503.")
+
+    counter = JobCounter(app)
+    server = make_server(args.host, args.port, counter, threaded=False, fd=listen_socket.fileno())
+    server.timeout = 1.0
+
+    # O socket é compartilhado entre os workers e está em modo não bloqueante; a conexão
+    # aceita precisa voltar ao modo bloqueante para ser atendida normalmente.
+    accept = server.socket.accept
+
+    def get_request():
+        conn, addr = accept()
+        conn.setblocking(True)
+        return conn, addr
+
+    server.get_request = get_request
+
+    logger.info(f"Worker {pid} pronto em {args.host}:{args.port}.")
+    reason = None
+    while not stopping:
+        server.handle_request()
+        if args.max_jobs and counter.count >= args.max_jobs:
+            reason = f"atingiu {counter.count} processamentos"
+            break
+        rss = current_rss_mb()
+        if args.max_rss_mb and rss > args.max_rss_mb:
+            reason = f"memória residente de {rss:.0f} MB acima do limite"
+            break
+
+    logger.info(f"Worker {pid} encerrando ({reason or 'sinal de término'}); aguardando jobs em andamento...")
+    server.server_close()
+    job_manager.shutdown(wait=True)
+    logger.info(f"Worker {pid} finalizado.")
+
+
+def spawn_worker(listen_socket, args):
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            run_worker(listen_socket, args)
+        except Exception as e:
+            logger.exception(f"Worker {os.getpid()} falhou: {e}")
+            exit_code = 1
+        finally:
+            shutdown_logging() # os._exit não executa o atexit; escreve os registros pendentes antes de sair
+            os._exit(exit_code)
+    return pid
+
+
+def serve_single_process(args):
+    """Alternativa para plataformas sem os.fork (Windows): um processo com threads."""
+    from werkzeug.serving import make_server
+    from app import app
+    from processor_registry import registry
+
+    logger.warning("Pre-fork não suportado nesta plataforma; usando um único processo com threads.")
+    registry.initialize()
+    server = make_server(args.host, args.port, app, threaded=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    args = parse_args()
+    configure_logging()
+    if not hasattr(os, 'fork'):
+        serve_single_process(args)
+        return
+
+    # Consultas de job podem chegar a qualquer worker, então o estado dos jobs é compartilhado em disco
+    os.environ.setdefault('OCR_JOB_STORE_DIR', os.path.join(tempfile.gettempdir(), 'nf_reader_jobs'))
+    # O mesmo vale para o cache de resultados: um arquivo processado por um worker serve a todos
+    os.environ.setdefault('OCR_RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'nf_reader_results'))
+    # Métricas do Prometheus agregadas entre os workers; precisa estar definido antes de importar
+    # o prometheus_client, e o conteúdo de execuções anteriores é descartado
+    metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'nf_reader_metrics'))
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind((args.host, args.port))
+    listen_socket.listen(128)
+    listen_socket.setblocking(False)
+    listen_socket.set_inheritable(True)
+
+    # Carrega a aplicação antes do fork para compartilhar o código entre os workers
+    import app  # noqa: F401
+    from metrics import mark_process_dead
+
+    stopping = False
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    workers = set()
+    logger.info(f"Mestre {os.getpid()} iniciando {args.workers} worker(s) em {args.host}:{args.port}.")
+    for _ in range(args.workers):
+        workers.add(spawn_worker(listen_socket, args))
+
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid in workers:
+            workers.discard(pid)
+            mark_process_dead(pid)
+            if not stopping:
+                logger.info(f"Worker {pid} saiu (status {status}); iniciando substituto.")
+                workers.add(spawn_worker(listen_socket, args))
+            continue
+        time.sleep(0.5)
+
+    logger.info(f"Encerrando {len(workers)} worker(s)...")
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    deadline = time.time() + args.graceful_timeout
+    while workers and time.time() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            workers.discard(pid)
+        else:
+            time.sleep(0.2)
+
+    for pid in workers:
+        logger.warning(f"Worker {pid} não encerrou a tempo; forçando saída.")
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    listen_socket.close()
+    logger.info("Servidor encerrado.")
+
+
+if __name__ == '__main__':
+    main()
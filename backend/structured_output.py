@@ -0,0 +1,171 @@
+"""
+Saída estruturada da extração com a OpenAI: esquema JSON da nota fiscal e leitura da resposta.
+
+Com OPENAI_STRUCTURED_OUTPUT=json_schema (padrão), a resposta do modelo é restrita ao esquema
+INVOICE_JSON_SCHEMA (response_format do tipo json_schema, modo estrito); com 'tools', o mesmo
+esquema é enviado como parâmetros de uma função de chamada obrigatória; com 'off', o modelo
+responde em texto livre. Em todos os modos a resposta passa por find_json_object, que localiza o
+primeiro objeto JSON completo em uma única passada, contando chaves fora de strings, de modo que
+objetos aninhados (como os de 'itens') não são cortados.
+"""
+import json
+import re
+
+STRUCTURED_OUTPUT_MODES = ('json_schema', 'tools', 'off')
+
+# Parâmetros da requisição e termos das mensagens de erro da API ligados à saída estruturada
+STRUCTURED_OUTPUT_PARAMS = ('response_format', 'tools', 'tool_choice')
+STRUCTURED_OUTPUT_ERROR_TERMS = ('response_format', 'json_schema', 'tools', 'tool_choice', 'structured output')
+
+# Nome do esquema e da função enviados à API
+INVOICE_SCHEMA_NAME = 'nota_fiscal'
+
+_NULLABLE_STRING = {'type': ['string', 'null']}
+_NULLABLE_NUMBER = {'type': ['number', 'null']}
+
+# No modo estrito todos os campos são obrigatórios; ausência é representada por null.
+# 'erro' só é preenchido quando o texto não parece ser de uma nota fiscal.
+INVOICE_JSON_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'numero_nota_fiscal': _NULLABLE_STRING,
+        'data_emissao': _NULLABLE_STRING,
+        'valor_total': _NULLABLE_NUMBER,
+        'cnpj_emitente': _NULLABLE_STRING,
+        'nome_razao_social_emitente': _NULLABLE_STRING,
+        'endereco_emitente': _NULLABLE_STRING,
+        'chave_acesso': _NULLABLE_STRING,
+        'itens': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'descricao': _NULLABLE_STRING,
+                    'quantidade': _NULLABLE_NUMBER,
+                    'valor_unitario': _NULLABLE_NUMBER,
+                    'valor_total_item': _NULLABLE_NUMBER,
+                },
+                'required': ['descricao', 'quantidade', 'valor_unitario', 'valor_total_item'],
+                'additionalProperties': False,
+            },
+        },
+        'erro': _NULLABLE_STRING,
+    },
+    'required': [
+        'numero_nota_fiscal', 'data_emissao', 'valor_total', 'cnpj_emitente', 'nome_razao_social_emitente',
+        'endereco_emitente', 'chave_acesso', 'itens', 'erro',
+    ],
+    'additionalProperties': False,
+}
+
+
+def structured_output_mode(value=None):
+    """Normaliza o modo de saída estruturada (padrão: json_schema). Levanta ValueError se for inválido."""
+    mode = (value or 'json_schema').strip().lower()
+    if mode in ('0', 'none', 'text'):
+        mode = 'off'
+    if mode not in STRUCTURED_OUTPUT_MODES:
+        raise ValueError(f"OPENAI_STRUCTURED_OUTPUT inválido: '{value}' (use {', '.join(STRUCTURED_OUTPUT_MODES)})")
+    return mode
+
+
+def next_structured_output_mode(mode):
+    """Modo a usar quando a API recusa 'mode': json_schema -> tools -> off."""
+    index = STRUCTURED_OUTPUT_MODES.index(mode)
+    return STRUCTURED_OUTPUT_MODES[min(index + 1, len(STRUCTURED_OUTPUT_MODES) - 1)]
+
+
+def is_structured_output_error(error):
+    """
+    Indica se um erro 400 da API se deve ao modo de saída estruturada (response_format, json_schema
+    ou tools sem suporte), e não a outra causa, como contexto longo demais ou filtro de conteúdo.
+    """
+    if getattr(error, 'param', None) in STRUCTURED_OUTPUT_PARAMS:
+        return True
+    message = str(getattr(error, 'message', None) or error).lower()
+    return any(term in message for term in STRUCTURED_OUTPUT_ERROR_TERMS)
+
+
+def request_options(mode):
+    """Argumentos extras de chat.completions.create para o modo de saída estruturada."""
+    if mode == 'json_schema':
+        return {'response_format': {
+            'type': 'json_schema',
+            'json_schema': {'name': INVOICE_SCHEMA_NAME, 'schema': INVOICE_JSON_SCHEMA, 'strict': True},
+        }}
+    if mode == 'tools':
+        return {
+            'tools': [{'type': 'function', 'function': {
+                'name': INVOICE_SCHEMA_NAME,
+                'description': 'Registra os dados extraídos da nota fiscal.',
+                'parameters': INVOICE_JSON_SCHEMA,
+                'strict': True,
+            }}],
+            'tool_choice': {'type': 'function', 'function': {'name': INVOICE_SCHEMA_NAME}},
+        }
+    return {}
+
+
+def reply_text(message):
+    """Texto com o JSON da resposta: argumentos da chamada de função, se houver, ou o conteúdo."""
+    tool_calls = getattr(message, 'tool_calls', None)
+    if tool_calls:
+        return tool_calls[0].function.arguments
+    return message.content
+
+
+# Caracteres que importam ao delimitar objetos JSON no texto; os demais são pulados pela busca
+_JSON_TOKEN_PATTERN = re.compile(r'[{}"\\]')
+
+
+def _first_object(text, spans):
+    """Primeiro trecho (início, fim), na ordem do texto, que decodifica como um objeto JSON."""
+    for start, end in sorted(spans):
+        try:
+            value = json.loads(text[start:end])
+        except (ValueError, RecursionError):
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def find_json_object(text):
+    """
+    Retorna o primeiro objeto JSON válido contido em 'text' (dict) ou None.
+
+    Percorre o texto uma única vez, só pelas chaves, aspas e barras invertidas, guardando os
+    trechos entre cada '{' e a '}' que a fecha (chaves dentro de strings e escapes são
+    respeitados). Quando um objeto de primeiro nível se fecha, os trechos dele são decodificados
+    do mais externo para os internos; uma chave solta que nunca se fecha (ex.: no texto antes do
+    JSON) não impede que os objetos seguintes sejam considerados ao final. Cercas de código
+    (```json) e texto ao redor são ignorados naturalmente.
+    """
+    if not text:
+        return None
+    opened = [] # Posições das '{' ainda abertas
+    spans = [] # (início, fim) dos objetos fechados desde o último objeto de primeiro nível
+    in_string = False
+    escaped_index = -1
+    for match in _JSON_TOKEN_PATTERN.finditer(text):
+        index = match.start()
+        if index == escaped_index:
+            continue
+        char = match.group()
+        if in_string:
+            if char == '\\':
+                escaped_index = index + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = bool(opened) # Aspas fora de um objeto são texto comum
+        elif char == '{':
+            opened.append(index)
+        elif char == '}' and opened:
+            spans.append((opened.pop(), index + 1))
+            if not opened:
+                value = _first_object(text, spans)
+                if value is not None:
+                    return value
+                spans = []
+    return _first_object(text, spans)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos do backend são importados pelo nome (ex.: 'import field_rules'), como no app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
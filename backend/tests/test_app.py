@@ -0,0 +1,106 @@
+import io
+import time
+
+import pytest
+
+import app as app_module
+from job_queue import JobManager, QueueFullError, STATUS_DONE
+from result_cache import ResultCache
+
+
+class FakeProcessor:
+    def __init__(self, error=None):
+        self.error = error
+
+    def cache_namespace(self):
+        return 'teste'
+
+    def process_document(self, filepath, pages=None, debug=None, job_id=None):
+        if self.error is not None:
+            raise self.error
+        return {'numero_nota_fiscal': '1'}
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'result_cache', ResultCache(max_entries=4))
+    manager = JobManager(app_module.run_processing_job, max_workers=1)
+    monkeypatch.setattr(app_module, 'job_manager', manager)
+    yield tmp_path
+    manager.shutdown()
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def use_processor(monkeypatch, processor):
+    monkeypatch.setattr(app_module.registry, '_processor', processor)
+
+
+def post(client, url):
+    return client.post(url, data={'file': (io.BytesIO(b'%PDF-1.4 conteudo'), 'nota.pdf')})
+
+
+def wait_finished(job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = app_module.job_manager.get(job_id)
+        if job['status'] == STATUS_DONE:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} não terminou")
+
+
+@pytest.mark.parametrize('error, status', [(None, 200), (RuntimeError('falhou'), 500)])
+def test_process_invoice_removes_upload(monkeypatch, uploads, client, error, status):
+    use_processor(monkeypatch, FakeProcessor(error))
+    assert post(client, '/api/process-invoice').status_code == status
+    assert list(uploads.iterdir()) == []
+
+
+def test_process_invoice_cache_hit_removes_upload(monkeypatch, uploads, client):
+    use_processor(monkeypatch, FakeProcessor())
+    post(client, '/api/process-invoice')
+    response = post(client, '/api/process-invoice')
+    assert response.get_json() == {'numero_nota_fiscal': '1'}
+    assert list(uploads.iterdir()) == []
+
+
+def test_create_job_removes_upload_when_cache_fails(monkeypatch, uploads, client):
+    use_processor(monkeypatch, FakeProcessor())
+
+    def broken_get(key):
+        raise OSError('disco indisponível')
+
+    monkeypatch.setattr(app_module.result_cache, 'get', broken_get)
+    assert post(client, '/api/jobs').status_code == 500
+    assert list(uploads.iterdir()) == []
+
+
+@pytest.mark.parametrize('error, status', [(QueueFullError('cheia'), 503), (RuntimeError('falhou'), 500)])
+def test_create_job_removes_upload_when_submit_fails(monkeypatch, uploads, client, error, status):
+    use_processor(monkeypatch, FakeProcessor())
+
+    def failing_submit(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(app_module.job_manager, 'submit', failing_submit)
+    assert post(client, '/api/jobs').status_code == status
+    assert list(uploads.iterdir()) == []
+
+
+def test_submitted_job_removes_its_upload(monkeypatch, uploads, client):
+    use_processor(monkeypatch, FakeProcessor())
+    response = post(client, '/api/jobs')
+    assert response.status_code == 202
+    job = wait_finished(response.get_json()['job_id'])
+    assert job['resultado'] == {'numero_nota_fiscal': '1'}
+    assert list(uploads.iterdir()) == []
+
+    # Segundo envio do mesmo arquivo: resultado do cache, sem deixar o upload para trás
+    response = post(client, '/api/jobs')
+    assert app_module.job_manager.get(response.get_json()['job_id'])['status'] == STATUS_DONE
+    assert list(uploads.iterdir()) == []
@@ -0,0 +1,85 @@
+import pytest
+
+from document_splitter import header_similarity, header_words, page_signals, split_documents
+from field_rules import chave_check_digit
+
+ISSUER_CNPJ = '81.056.775/0001-80'
+
+
+def nfse_page(number, inline=True, total='1.250,00'):
+    """Página de NFS-e de um emitente fixo, com o número na mesma linha do rótulo ou abaixo dele."""
+    number_lines = [f"Número da NFS-e: {number}"] if inline else ["Número da NFS-e", "PREFEITURA MUNICIPAL", str(number)]
+    return '\n'.join(number_lines + [
+        "NOTA FISCAL DE SERVIÇOS ELETRÔNICA - NFS-e",
+        "Data e Hora de Emissão 23/09/2023 14:40:55",
+        "PRESTADOR DE SERVIÇOS",
+        f"Distribuidora Serra Azul Ltda EPP {ISSUER_CNPJ}",
+        "TOMADOR DE SERVIÇOS",
+        "Serviços Bandeirantes Ltda 62.979.298/0001-80",
+        "Manutenção preventiva de equipamentos 1.250,00",
+        f"VALOR TOTAL DA NOTA R$ {total}",
+    ])
+
+
+def make_chave(number, cnpj='81056775000180'):
+    base = f"35{'2309'}{cnpj}55001{number:09d}1{12345678:08d}"
+    return base + chave_check_digit(base)
+
+
+def danfe_page(chave, extra=''):
+    return '\n'.join([
+        "DANFE",
+        "IDENTIFICAÇÃO DO EMITENTE",
+        f"Distribuidora Serra Azul Ltda EPP CNPJ {ISSUER_CNPJ}",
+        "CHAVE DE ACESSO",
+        ' '.join(chave[i:i + 4] for i in range(0, 44, 4)),
+        extra,
+    ])
+
+
+def pages_of(documents):
+    return [[page for page, _ in document] for document in documents]
+
+
+@pytest.mark.parametrize('inline', [True, False])
+def test_same_issuer_invoices_split_by_number(inline):
+    # Regressão: duas NFS-e seguidas do mesmo prestador só diferem no número da nota
+    texts = [nfse_page(2023000101, inline), nfse_page(2023000102, inline), nfse_page(2023000103, inline)]
+    documents = split_documents(list(enumerate(texts, start=1)))
+    assert pages_of(documents) == [[1], [2], [3]]
+
+
+def test_page_markers_decide_boundaries():
+    texts = [
+        "Folha 1/2\n" + nfse_page(10), "Folha 2/2\nDISCRIMINAÇÃO (continuação)\nItem 3 100,00",
+        "Página 1 de 1\n" + nfse_page(11),
+    ]
+    assert pages_of(split_documents(list(enumerate(texts, start=1)))) == [[1, 2], [3]]
+
+
+def test_access_key_splits_and_continues():
+    first, second = make_chave(1001), make_chave(1002)
+    texts = [danfe_page(first), danfe_page(first, 'Continuação dos itens'), danfe_page(second)]
+    assert pages_of(split_documents(list(enumerate(texts, start=1)))) == [[1, 2], [3]]
+
+
+def test_page_without_signals_continues_current_document():
+    texts = [nfse_page(20), "Item 4 - Suporte técnico 300,00\nItem 5 - Treinamento 200,00"]
+    assert pages_of(split_documents(list(enumerate(texts, start=1)))) == [[1, 2]]
+
+
+def test_split_keeps_page_texts():
+    texts = [nfse_page(30), nfse_page(31)]
+    documents = split_documents(list(enumerate(texts, start=1)))
+    assert documents == [[(1, texts[0])], [(2, texts[1])]]
+
+
+def test_signals_and_header_similarity():
+    signals = page_signals(1, "Página 2 de 3\n" + nfse_page(40))
+    assert signals.marker == (2, 3)
+    assert signals.cnpj == '81056775000180'
+    assert signals.numero == '40'
+    assert signals.looks_like_start
+    same = header_words(nfse_page(41))
+    assert header_similarity(same, header_words(nfse_page(42))) == 1.0
+    assert header_similarity(same, frozenset()) == 0.0
@@ -0,0 +1,151 @@
+from datetime import date
+
+import pytest
+
+from field_rules import (chave_check_digit, cnpj_check_digits, extract_fields, find_chaves, find_cnpjs, find_dates,
+                         fix_ocr_digits, is_valid_chave, is_valid_cnpj, page_relevance, parse_brazilian_amount)
+
+
+def make_chave(number, cnpj='11222333000181', uf='35', aamm='2403'):
+    base = f"{uf}{aamm}{cnpj}55001{number:09d}1{12345678:08d}"
+    return base + chave_check_digit(base)
+
+
+@pytest.mark.parametrize('cnpj, valid', [
+    ('11222333000181', True),
+    ('11222333000182', False), # Dígito verificador errado
+    ('11111111111111', False), # Dígitos repetidos passam no módulo 11, mas não são válidos
+    ('1122233300018', False),
+    ('1122233300018a', False),
+])
+def test_is_valid_cnpj(cnpj, valid):
+    assert is_valid_cnpj(cnpj) is valid
+
+
+def test_cnpj_check_digits():
+    assert cnpj_check_digits('112223330001') == '81'
+
+
+def test_chave_check_digit():
+    chave = make_chave(123)
+    assert is_valid_chave(chave)
+    wrong = chave[:43] + str((int(chave[43]) + 1) % 10)
+    assert not is_valid_chave(wrong)
+
+
+@pytest.mark.parametrize('chave', [
+    make_chave(1, uf='99'), # UF inexistente
+    make_chave(1, aamm='2413'), # Mês inválido
+])
+def test_chave_with_invalid_uf_or_month(chave):
+    assert not is_valid_chave(chave)
+
+
+@pytest.mark.parametrize('candidate, digits', [
+    ('11.222.333/OOO1-8l', '11222333000181'),
+    ('S.B|Z', '5812'),
+    ('Q1/D2/2O24', '01022024'),
+])
+def test_fix_ocr_digits(candidate, digits):
+    assert fix_ocr_digits(candidate) == digits
+
+
+def test_find_cnpjs_fixes_ocr_digits():
+    assert find_cnpjs("CNPJ: 11.222.333/OOO1-8l") == [('11222333000181', 6)]
+
+
+def test_find_cnpjs_skips_words():
+    # Poucos dígitos reais: não é convertido em número
+    assert find_cnpjs("OBSOLIDOSIIOOZSSBB") == []
+
+
+def test_find_chaves_with_spaces_and_ocr_digits():
+    chave = make_chave(987)
+    spaced = ' '.join(chave[i:i + 4] for i in range(0, 44, 4)).replace('0', 'O', 2)
+    assert find_chaves(f"CHAVE DE ACESSO\n{spaced}") == [chave]
+
+
+def test_find_dates_skips_invalid_dates():
+    assert find_dates("31/02/2024 e 29/O2/2024") == [(date(2024, 2, 29), 13)]
+
+
+def test_parse_brazilian_amount():
+    assert parse_brazilian_amount('1.234,56') == 1234.56
+
+
+def test_extract_fields_from_danfe():
+    chave = make_chave(4567)
+    text = '\n'.join([
+        "IDENTIFICAÇÃO DO EMITENTE",
+        "DESTINATÁRIO CNPJ 62.979.298/0001-80",
+        "DATA DE EMISSÃO 05/03/2024",
+        "CHAVE DE ACESSO",
+        chave,
+        "VALOR TOTAL DA NOTA 1.250,00",
+    ])
+    fields = extract_fields(text)
+    assert fields['chave_acesso'].value == chave
+    assert fields['cnpj_emitente'].value == '11222333000181' # Vem da chave, não do destinatário
+    assert fields['numero_nota_fiscal'].value == '4567'
+    assert fields['data_emissao'] == ('05/03/2024', 0.95, 'data DD/MM/AAAA')
+    assert fields['valor_total'].value == 1250.0
+
+
+def test_extract_fields_without_chave():
+    text = '\n'.join([
+        "PRESTADOR DE SERVIÇOS CNPJ 11.222.333/0001-81",
+        "Número do RPS: 12",
+        "Número da NFS-e: 0042",
+        "TOMADOR DE SERVIÇOS CNPJ 62.979.298/0001-80",
+        "VALOR TOTAL DA NOTA R$ 99,90",
+    ])
+    fields = extract_fields(text)
+    assert fields['cnpj_emitente'].value == '11222333000181'
+    assert fields['numero_nota_fiscal'] == ('42', 0.85, 'número após rótulo')
+    assert fields['valor_total'].value == 99.9
+    assert 'chave_acesso' not in fields
+
+
+@pytest.mark.parametrize('text', [
+    "Número do RPS: 55 Emitido em 28/02/2024\nData e Hora de Emissão: 01/03/2024 10:00",
+    "Data e Hora de Emissão\n01/03/2024 10:00\nRPS Nº 55 Série A, emitido em 28/02/2024",
+])
+def test_emission_date_ignores_rps_line(text):
+    field = extract_fields(text)['data_emissao']
+    assert field.value == '01/03/2024'
+    assert field.confidence == 0.85
+
+
+def test_extract_fields_empty_text():
+    assert extract_fields('') == {}
+
+
+def test_page_relevance():
+    invoice = "CNPJ 11.222.333/0001-81\nDESCRIÇÃO QTD VALOR TOTAL\nItem 10,00\nItem 20,00\nTotal 30,00"
+    assert page_relevance(invoice) > 0.8
+    assert page_relevance("Termos e condições gerais de uso do serviço.") < 0.2
+    assert page_relevance('') == 0.0
+
+
+def test_number_label_after_rps_line():
+    text = "Número do RPS: 12\nNúmero da NFS-e: 0042\nNúmero RPS: 7 Número da NFS-e: 43"
+    assert extract_fields(text)['numero_nota_fiscal'] == ('42', 0.85, 'número após rótulo')
+
+
+def test_total_in_danfe_columns_is_not_validated():
+    # O primeiro valor após o rótulo é o de outra coluna; não pode prevalecer sobre o modelo
+    text = '\n'.join([
+        "CÁLCULO DO IMPOSTO",
+        "VALOR DO FRETE VALOR DO SEGURO DESCONTO OUTRAS DESPESAS VALOR DO IPI V. TOTAL DA NOTA",
+        "0,00 0,00 0,00 0,00 0,00 1.500,00",
+    ])
+    field = extract_fields(text)['valor_total']
+    assert field.confidence < 0.9
+
+
+def test_label_proximity_fields_stay_below_validation_threshold():
+    text = "EMITENTE\nDistribuidora Horizonte Ltda CNPJ 11.222.333/0001-81\nVALOR TOTAL DA NOTA 1.500,00"
+    fields = extract_fields(text)
+    assert fields['cnpj_emitente'].value == '11222333000181'
+    assert fields['cnpj_emitente'].confidence < 0.9
+    assert fields['valor_total'] == (1500.0, 0.8, 'valor após rótulo de total da nota')
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from job_queue import STATUS_DONE, STATUS_FAILED, STATUS_PENDING, STATUS_RUNNING, JobManager, QueueFullError
+
+
+def wait_finished(manager, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job['status'] in (STATUS_DONE, STATUS_FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} não terminou")
+
+
+@pytest.fixture
+def manager_factory():
+    managers = []
+
+    def factory(worker_fn, **kwargs):
+        manager = JobManager(worker_fn, max_workers=1, **kwargs)
+        managers.append(manager)
+        return manager
+
+    yield factory
+    for manager in managers:
+        manager.shutdown()
+
+
+@pytest.mark.parametrize('result, status, erro', [
+    ({'valor': 1}, STATUS_DONE, None),
+    ({'erro': 'Falhou'}, STATUS_FAILED, 'Falhou'),
+    (None, STATUS_FAILED, 'Não foi possível extrair os dados da nota fiscal'),
+])
+def test_job_result_sets_status(manager_factory, result, status, erro):
+    manager = manager_factory(lambda job_id: result)
+    job = wait_finished(manager, manager.submit())
+    assert job['status'] == status
+    assert job['erro'] == erro
+    assert job['tempos'] is not None
+
+
+def test_queue_full(manager_factory):
+    release = threading.Event()
+    manager = manager_factory(lambda job_id: release.wait() and {'ok': True}, max_pending=1)
+    job_id = manager.submit()
+    with pytest.raises(QueueFullError):
+        manager.submit()
+    release.set()
+    assert wait_finished(manager, job_id)['status'] == STATUS_DONE
+
+
+def test_job_is_visible_to_other_process(manager_factory, tmp_path):
+    manager = manager_factory(lambda job_id: {'ok': True}, store_dir=str(tmp_path))
+    job_id = manager.submit()
+    wait_finished(manager, job_id)
+    other = manager_factory(lambda job_id: None, store_dir=str(tmp_path))
+    assert other.get(job_id)['resultado'] == {'ok': True}
+    assert other.get('../' + job_id) is None
+
+
+def write_job(store_dir, job_id, status, finished, age):
+    path = os.path.join(store_dir, f"{job_id}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'id': job_id, 'status': status, 'finalizado_em': finished}, f)
+    old = time.time() - age
+    os.utime(path, (old, old))
+    return path
+
+
+def test_disk_eviction_keeps_unfinished_jobs(manager_factory, tmp_path):
+    manager = manager_factory(lambda job_id: None, ttl_seconds=60, store_dir=str(tmp_path))
+    now = time.time()
+    expired = write_job(str(tmp_path), 'a' * 32, STATUS_DONE, now - 120, 120)
+    queued = write_job(str(tmp_path), 'b' * 32, STATUS_PENDING, None, 3600)
+    running = write_job(str(tmp_path), 'c' * 32, STATUS_RUNNING, None, 3600)
+    recent = write_job(str(tmp_path), 'd' * 32, STATUS_DONE, now - 10, 10)
+
+    manager.evict_expired()
+
+    assert not os.path.exists(expired)
+    assert all(os.path.exists(path) for path in (queued, running, recent))
+    assert manager.get('b' * 32)['status'] == STATUS_PENDING
@@ -0,0 +1,175 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import llm_client
+from llm_client import LLMClient
+
+MESSAGES = [{'role': 'user', 'content': 'nota'}]
+
+
+def completion(content='{}'):
+    return httpx.Response(200, json={
+        'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-test',
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+    })
+
+
+def error(status, retry_after=None):
+    headers = {'retry-after': str(retry_after)} if retry_after is not None else {}
+    return httpx.Response(status, headers=headers, json={'error': {'message': 'falha', 'type': 'x'}})
+
+
+class Server:
+    """Transporte falso: responde a cada requisição com a próxima resposta (ou função) da lista."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        with self._lock:
+            index = self.requests
+            self.requests += 1
+        response = self.responses[min(index, len(self.responses) - 1)]
+        return response() if callable(response) else response
+
+
+class FakeClock:
+    """Substitui time.monotonic/time.sleep do llm_client: as esperas só avançam o relógio."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(llm_client, 'time', SimpleNamespace(monotonic=fake.monotonic, sleep=fake.sleep))
+    return fake
+
+
+def make_client(server, **kwargs):
+    options = dict(api_key='sk-test', base_url='http://api.test/v1', max_retries=3, backoff_base=0.5,
+                   backoff_max=8, deadline=150, hedge=False)
+    options.update(kwargs)
+    return LLMClient(transport=httpx.MockTransport(server), **options)
+
+
+def create(client):
+    return client.chat.completions.create(model='gpt-test', messages=MESSAGES)
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_retries_transient_status(clock, status):
+    server = Server(error(status), error(status), completion('ok'))
+    response = create(make_client(server))
+    assert response.choices[0].message.content == 'ok'
+    assert server.requests == 3
+    assert len(clock.sleeps) == 2
+    assert all(0 <= delay <= 8 for delay in clock.sleeps)
+
+
+def test_retry_after_header_is_honoured(clock):
+    server = Server(error(429, retry_after=3), completion())
+    create(make_client(server))
+    assert clock.sleeps == [3.0]
+
+
+def test_retries_timeouts(clock):
+    def timeout():
+        raise httpx.ReadTimeout('lento')
+
+    server = Server(timeout, completion('ok'))
+    assert create(make_client(server)).choices[0].message.content == 'ok'
+    assert server.requests == 2
+
+
+@pytest.mark.parametrize('status, error_type', [
+    (400, openai.BadRequestError), (401, openai.AuthenticationError), (404, openai.NotFoundError),
+])
+def test_other_client_errors_are_not_retried(clock, status, error_type):
+    server = Server(error(status), completion())
+    with pytest.raises(error_type):
+        create(make_client(server))
+    assert server.requests == 1
+    assert clock.sleeps == []
+
+
+def test_gives_up_after_max_retries(clock):
+    server = Server(error(503))
+    with pytest.raises(openai.InternalServerError):
+        create(make_client(server, max_retries=2))
+    assert server.requests == 3
+
+
+def test_stops_at_the_deadline(clock):
+    # Cada espera de 4 s cabe no prazo de 10 s até a terceira, que passaria dele
+    server = Server(error(503, retry_after=4))
+    with pytest.raises(openai.InternalServerError):
+        create(make_client(server, deadline=10, max_retries=10))
+    assert clock.sleeps == [4.0, 4.0]
+    assert server.requests == 3
+
+
+def slow(content, seconds):
+    def respond():
+        time.sleep(seconds)
+        return completion(content)
+    return respond
+
+
+def hedged_client(server):
+    client = make_client(server, hedge=True, hedge_min_samples=5)
+    client._latencies.extend([0.05] * 5) # p95 das latências recentes: 50 ms
+    return client
+
+
+def test_hedged_request_wins_when_primary_is_slow():
+    server = Server(slow('primária', 1.0), completion('paralela'))
+    client = hedged_client(server)
+    start = time.perf_counter()
+    assert create(client).choices[0].message.content == 'paralela'
+    assert time.perf_counter() - start < 0.8
+    assert server.requests == 2
+    client.close()
+
+
+def test_primary_reply_wins_and_backup_is_discarded():
+    server = Server(slow('primária', 0.2), slow('paralela', 1.5))
+    client = hedged_client(server)
+    start = time.perf_counter()
+    assert create(client).choices[0].message.content == 'primária'
+    assert time.perf_counter() - start < 1.2
+    assert server.requests == 2
+    client.close()
+
+
+def test_no_hedge_when_primary_answers_before_p95():
+    server = Server(completion('primária'), completion('paralela'))
+    client = hedged_client(server)
+    client._latencies.extend([1.0] * 5) # p95 alto: a primeira resposta chega antes
+    assert create(client).choices[0].message.content == 'primária'
+    assert server.requests == 1
+    client.close()
+
+
+def test_hedge_waits_for_enough_samples():
+    client = make_client(Server(completion()), hedge=True, hedge_min_samples=20)
+    client._latencies.extend([0.05] * 19)
+    assert client._hedge_delay() is None
+    client._latencies.append(0.05)
+    assert client._hedge_delay() == 0.05
@@ -0,0 +1,33 @@
+import time
+
+import pytest
+
+from nf_processor import MAX_PAGE_NUMBER, parse_page_spec
+
+
+@pytest.mark.parametrize('spec, expected', [
+    (None, None),
+    ('', None),
+    ('todas', 'all'),
+    (' ALL ', 'all'),
+    ('3,1-2, 2', [1, 2, 3]),
+    (4, [4]),
+    ([2, '1'], [1, 2]),
+    (f"1-{MAX_PAGE_NUMBER}", list(range(1, MAX_PAGE_NUMBER + 1))),
+])
+def test_parse_page_spec(spec, expected):
+    assert parse_page_spec(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['0', '3-1', 'a', ',', '1-', [0]])
+def test_parse_page_spec_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_page_spec(spec)
+
+
+@pytest.mark.parametrize('spec', ['1-20000000', f"{MAX_PAGE_NUMBER + 1}", f"1,{10 ** 18}", [MAX_PAGE_NUMBER + 1]])
+def test_parse_page_spec_rejects_huge_pages_without_expanding(spec):
+    start = time.perf_counter()
+    with pytest.raises(ValueError):
+        parse_page_spec(spec)
+    assert time.perf_counter() - start < 0.5
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from page_stream import MemoryBudget, stream_map
+
+
+def test_results_keep_item_order():
+    def process(item, loaded):
+        time.sleep(0.001 * (item % 3)) # Consumidoras terminam fora de ordem
+        return loaded * 10
+
+    assert stream_map(range(20), lambda item: item, process, workers=4) == [item * 10 for item in range(20)]
+
+
+def test_in_flight_items_are_bounded():
+    lock = threading.Lock()
+    live = [0, 0] # atual, pico
+
+    def load(item):
+        with lock:
+            live[0] += 1
+            live[1] = max(live[1], live[0])
+        return item
+
+    def release(loaded):
+        with lock:
+            live[0] -= 1
+
+    stream_map(range(50), load, lambda item, loaded: time.sleep(0.002), workers=2, queue_size=2,
+               max_in_flight=3, release=release)
+    assert live[0] == 0
+    assert live[1] <= 3
+
+
+def test_budget_limits_loaded_cost():
+    budget = MemoryBudget(100)
+    stream_map(range(30), lambda item: item, lambda item, loaded: time.sleep(0.001), workers=3,
+               budget=budget, cost=lambda item: 40)
+    assert budget.peak <= 100 # Duas reservas de 40 cabem; a terceira espera
+    assert budget.used == 0
+
+
+def test_oversized_item_runs_alone_and_real_cost_is_charged():
+    budget = MemoryBudget(100)
+    costs = {0: 30, 1: 250, 2: 30}
+    stream_map(range(3), lambda item: item, lambda item, loaded: None, budget=budget,
+               cost=lambda item: 10, loaded_cost=lambda loaded: costs[loaded])
+    assert budget.peak >= 250
+    assert budget.used == 0
+
+
+@pytest.mark.parametrize('stage', ['load', 'process'])
+def test_first_error_is_raised_and_items_released(stage):
+    released = []
+
+    def load(item):
+        if stage == 'load' and item == 5:
+            raise ValueError('falha ao carregar')
+        return item
+
+    def process(item, loaded):
+        if stage == 'process' and item == 5:
+            raise ValueError('falha no OCR')
+        return item
+
+    with pytest.raises(ValueError):
+        stream_map(range(100), load, process, workers=2, release=released.append)
+    assert len(released) < 100 # O fluxo parou no erro
+    assert len(set(released)) == len(released)
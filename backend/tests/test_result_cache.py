@@ -0,0 +1,90 @@
+import os
+import time
+
+from result_cache import ResultCache, make_cache_key
+
+
+def test_make_cache_key_separates_parts():
+    assert make_cache_key('ab', 'c') != make_cache_key('a', 'bc')
+    assert make_cache_key('a', 1) == make_cache_key('a', '1')
+
+
+def test_get_returns_independent_copies():
+    cache = ResultCache(max_entries=4)
+    value = {'itens': [{'descricao': 'Cabo'}]}
+    cache.put('k', value)
+    value['itens'].append({'descricao': 'alterado depois do put'})
+
+    first = cache.get('k')
+    first['itens'][0]['descricao'] = 'alterado pelo chamador'
+    assert cache.get('k') == {'itens': [{'descricao': 'Cabo'}]}
+    assert cache.get('k') is not cache.get('k')
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert cache.stats() == {'entradas': 2, 'acertos': 3, 'falhas': 1}
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache(max_entries=0)
+    cache.put('k', 1)
+    assert not cache.enabled
+    assert cache.get('k') is None
+
+
+def test_memory_entry_expires_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = ResultCache(max_entries=4, ttl=10)
+    cache.put('k', 1)
+    now[0] += 10
+    assert cache.get('k') == 1
+    now[0] += 1
+    assert cache.get('k') is None
+    assert cache.stats()['entradas'] == 0
+
+
+def test_disk_entry_is_shared_and_expires(tmp_path):
+    writer = ResultCache(max_entries=4, directory=str(tmp_path), ttl=60)
+    writer.put('k', {'valor': 1})
+    reader = ResultCache(max_entries=4, directory=str(tmp_path), ttl=60)
+    assert reader.get('k') == {'valor': 1}
+
+    path = tmp_path / 'k.json'
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert ResultCache(max_entries=4, directory=str(tmp_path), ttl=60).get('k') is None
+    assert not path.exists()
+
+
+def test_corrupted_disk_entry_is_a_miss(tmp_path):
+    (tmp_path / 'k.json').write_text('{corrompido', encoding='utf-8')
+    assert ResultCache(max_entries=4, directory=str(tmp_path)).get('k') is None
+
+
+def test_prune_disk_respects_entry_limit(tmp_path):
+    cache = ResultCache(max_entries=200, directory=str(tmp_path), max_disk_entries=50)
+    for index in range(100):
+        cache.put(f"k{index}", index)
+    # A limpeza roda a cada 100 gravações
+    assert len(list(tmp_path.glob('*.json'))) == 50
+
+
+def test_defaults_apply_when_environment_is_unset(monkeypatch, tmp_path):
+    monkeypatch.delenv('TEST_CACHE_DIR', raising=False)
+    monkeypatch.delenv('TEST_CACHE_TTL_SECONDS', raising=False)
+    cache = ResultCache(env_prefix='TEST_CACHE', default_directory=str(tmp_path), default_ttl=60)
+    assert (cache.directory, cache.ttl) == (str(tmp_path), 60)
+
+
+def test_environment_overrides_defaults(monkeypatch, tmp_path):
+    monkeypatch.setenv('TEST_CACHE_DIR', '')
+    monkeypatch.setenv('TEST_CACHE_TTL_SECONDS', '5')
+    cache = ResultCache(env_prefix='TEST_CACHE', default_directory=str(tmp_path), default_ttl=60)
+    assert (cache.directory, cache.ttl) == (None, 5)
@@ -0,0 +1,73 @@
+import time
+
+import httpx
+import openai
+import pytest
+
+from structured_output import (INVOICE_JSON_SCHEMA, find_json_object, is_structured_output_error, next_structured_output_mode,
+                               request_options, structured_output_mode)
+
+
+def bad_request(message, param=None):
+    response = httpx.Response(400, request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+    return openai.BadRequestError(message, response=response, body={'message': message, 'param': param})
+
+
+@pytest.mark.parametrize('error', [
+    bad_request("Invalid parameter: 'response_format' of type 'json_schema' is not supported with this model.",
+                param='response_format'),
+    bad_request("tools is not supported in this model."),
+])
+def test_structured_output_errors_are_recognized(error):
+    assert is_structured_output_error(error)
+
+
+@pytest.mark.parametrize('error', [
+    bad_request("This model's maximum context length is 8192 tokens.", param='messages'),
+    bad_request("Your request was rejected as a result of our safety system."),
+])
+def test_other_bad_requests_do_not_downgrade(error):
+    assert not is_structured_output_error(error)
+
+
+def test_modes():
+    assert structured_output_mode(None) == 'json_schema'
+    assert structured_output_mode(' TOOLS ') == 'tools'
+    assert structured_output_mode('0') == 'off'
+    with pytest.raises(ValueError):
+        structured_output_mode('xml')
+    assert [next_structured_output_mode(mode) for mode in ('json_schema', 'tools', 'off')] == ['tools', 'off', 'off']
+
+
+def test_request_options():
+    schema = request_options('json_schema')['response_format']['json_schema']
+    assert schema['strict'] and schema['schema'] is INVOICE_JSON_SCHEMA
+    tools = request_options('tools')
+    assert tools['tool_choice']['function']['name'] == tools['tools'][0]['function']['name']
+    assert request_options('off') == {}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"a": 1}', {'a': 1}),
+    ('Aqui está:\n```json\n{"itens": [{"descricao": "Cabo {2m}", "valor": 1.5}], "b": "x\\"}"}\n```',
+     {'itens': [{'descricao': 'Cabo {2m}', 'valor': 1.5}], 'b': 'x"}'}),
+    ('pre { unmatched then {"a":1}', {'a': 1}),
+    ('{not json} e depois {"a": {"b": 2}}', {'a': {'b': 2}}),
+    ('[1, 2] {"a": 1}', {'a': 1}),
+    ('Resposta "final": {"a": "barra \\\\", "b": "}"}', {'a': 'barra \\', 'b': '}'}),
+    ('{"a": [1, {"b": }]} {"c": 3}', {'c': 3}),
+])
+def test_find_json_object(text, expected):
+    assert find_json_object(text) == expected
+
+
+@pytest.mark.parametrize('text', [None, '', 'sem json', '{"a": 1', '{ { {'])
+def test_find_json_object_without_object(text):
+    assert find_json_object(text) is None
+
+
+@pytest.mark.parametrize('text', ['{' * 100000 + '{"a": 1}', 'chave solta { ' * 20000 + '{"a": 1}'], ids=['chaves', 'texto'])
+def test_find_json_object_is_linear_on_stray_braces(text):
+    start = time.perf_counter()
+    assert find_json_object(text) == {'a': 1}
+    assert time.perf_counter() - start < 0.5
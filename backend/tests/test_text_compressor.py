@@ -0,0 +1,85 @@
+import types
+
+import pytest
+
+import text_compressor
+from text_compressor import TRUNCATION_MARKER, TextCompressor, TokenCounter, dedupe_lines, strip_boilerplate
+
+
+class FakeEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return ' '.join(tokens)
+
+
+def fake_tiktoken(known_models=(), fail=False):
+    loaded = []
+
+    def encoding_name_for_model(model):
+        if model not in known_models:
+            raise KeyError(model)
+        return 'o200k_base'
+
+    def get_encoding(name):
+        loaded.append(name)
+        if fail:
+            raise OSError('sem rede')
+        return FakeEncoding()
+
+    return types.SimpleNamespace(encoding_name_for_model=encoding_name_for_model, get_encoding=get_encoding), loaded
+
+
+def test_counter_without_tiktoken_approximates(monkeypatch):
+    monkeypatch.setattr(text_compressor, 'tiktoken', None)
+    counter = TokenCounter('gpt-4o-mini')
+    assert counter.name == 'aproximado'
+    assert counter.count('a' * 9) == 3
+
+
+@pytest.mark.parametrize('model, expected', [('gpt-4o-mini', 'o200k_base'), ('modelo-novo', 'cl100k_base'), (None, 'cl100k_base')])
+def test_counter_resolves_encoding_name(monkeypatch, model, expected):
+    fake, loaded = fake_tiktoken(known_models=('gpt-4o-mini',))
+    monkeypatch.setattr(text_compressor, 'tiktoken', fake)
+    counter = TokenCounter(model)
+    assert loaded == [expected]
+    assert counter.name == 'tiktoken'
+    assert counter.count('tres palavras aqui') == 3
+
+
+def test_counter_falls_back_when_encoding_cannot_load(monkeypatch):
+    # Modelo desconhecido e vocabulário indisponível: não pode levantar exceção
+    fake, loaded = fake_tiktoken(fail=True)
+    monkeypatch.setattr(text_compressor, 'tiktoken', fake)
+    counter = TokenCounter('modelo-novo')
+    assert loaded == ['cl100k_base']
+    assert counter.name == 'aproximado'
+
+
+def test_strip_boilerplate_removes_danfe_notices():
+    text = "EMITENTE LTDA\nRESERVADO AO FISCO\nDocumento Auxiliar da Nota Fiscal Eletrônica\nTOTAL 10,00"
+    stripped = strip_boilerplate(text)
+    assert 'FISCO' not in stripped and 'Documento Auxiliar' not in stripped
+    assert 'EMITENTE LTDA' in stripped and 'TOTAL 10,00' in stripped
+
+
+def test_dedupe_lines_keeps_repeated_amounts():
+    text = "Cabeçalho  da   página\nItem A 5,00\n\ncabeçalho da página\nItem A 5,00"
+    assert dedupe_lines(text) == "Cabeçalho da página\nItem A 5,00\nItem A 5,00"
+
+
+def test_compress_truncates_to_budget(monkeypatch):
+    monkeypatch.setattr(text_compressor, 'tiktoken', None)
+    text = '\n'.join(f"linha {index} {'x' * 30}" for index in range(200))
+    result = TextCompressor(token_budget=200, enabled=True).compress(text)
+    assert result.truncated
+    assert result.tokens <= 200 < result.original_tokens
+    assert TRUNCATION_MARKER in result.text
+    assert result.text.startswith('linha 0 ') and result.text.endswith('linha 199 ' + 'x' * 30)
+
+
+def test_compress_within_budget_is_untouched(monkeypatch):
+    monkeypatch.setattr(text_compressor, 'tiktoken', None)
+    result = TextCompressor(token_budget=0, enabled=False).compress('curto')
+    assert result == ('curto', 2, 2, False)
@@ -0,0 +1,150 @@
+"""
+Compressão do texto da nota antes do envio ao modelo, dentro de um orçamento de tokens.
+
+O texto extraído traz trechos que não contribuem para nenhum campo do JSON: avisos legais do
+DANFE (canhoto de recebimento, consulta de autenticidade, Simples Nacional, tributos aproximados),
+além de cabeçalhos e rodapés repetidos em cada página. TextCompressor remove esses trechos,
+elimina linhas repetidas e, se o texto ainda passar de OPENAI_INPUT_TOKEN_BUDGET tokens, mantém o
+início e o fim do documento (onde ficam emitente, chave de acesso e totais), marcando o corte.
+
+Os tokens são contados com o tiktoken quando ele está instalado (opcional); sem ele, usa-se a
+aproximação de 4 caracteres por token.
+"""
+import os
+import re
+from collections import namedtuple
+
+try:
+    import tiktoken # Contagem exata de tokens (opcional)
+except ImportError:
+    tiktoken = None
+
+from log_config import get_logger
+
+logger = get_logger('llm')
+
+# Trechos padronizados de DANFE e NFS-e, sem nenhum dos campos extraídos
+BOILERPLATE_PATTERNS = [re.compile(pattern, re.IGNORECASE | re.DOTALL) for pattern in (
+    r'RECEBEMOS DE\b.{0,200}?(?:INDICAD[AO]\s+(?:AO\s+LADO|ABAIXO)|AO\s+LADO)',
+    r'DATA\s+DE\s+RECEBIMENTO',
+    r'IDENTIFICA[ÇC][ÃA]O\s+E\s+ASSINATURA\s+DO\s+RECEBEDOR',
+    r'Consulta\s+de\s+autenticidade\s+no\s+portal\s+nacional\s+da\s+NF-?e(?:.{0,160}?Autorizadora|.{0,120}?fazenda\.gov\.br(?:/portal)?)',
+    r'Documento\s+Auxiliar\s+da\s+Nota\s+Fiscal\s+Eletr[ôo]nica',
+    r'0\s*-\s*ENTRADA\s+1\s*-\s*SA[ÍI]DA',
+    r'DOCUMENTO\s+EMITIDO\s+POR\s+(?:ME|MICROEMPRESA)\s+OU\s+EPP\s+OPTANTE\s+PELO\s+SIMPLES\s+NACIONAL\.?',
+    r'N[ÃA]O\s+GERA\s+DIREITO\s+A\s+CR[ÉE]DITO\s+FISCAL\s+DE\s+(?:IPI|ICMS)(?:\s+(?:E|OU)\s+(?:DE\s+)?(?:IPI|ICMS))?\.?',
+    r'RESERVADO\s+AO\s+FISCO',
+    r'Val(?:or)?\.?\s+aprox(?:imado)?\.?\s+(?:dos\s+)?tributos.{0,200}?(?:IBPT|12\.?741/2012)[^\n]{0,40}',
+)]
+
+# Linhas com valores monetários (itens, totais) nunca são descartadas como repetidas
+AMOUNT_PATTERN = re.compile(r'\d,\d{2}\b')
+
+TRUNCATION_MARKER = '[...]'
+
+# Fração do orçamento reservada ao início do texto quando é preciso cortar
+HEAD_SHARE = 0.7
+
+CompressedText = namedtuple('CompressedText', ['text', 'original_tokens', 'tokens', 'truncated'])
+
+
+class TokenCounter:
+    """Conta tokens com o tokenizador do modelo (tiktoken) ou, sem ele, por aproximação."""
+
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, model=None):
+        self.encoding = None
+        if tiktoken is not None:
+            name = 'cl100k_base'
+            if model:
+                try:
+                    name = tiktoken.encoding_name_for_model(model)
+                except KeyError: # Modelo desconhecido pelo tiktoken
+                    pass
+            try:
+                self.encoding = tiktoken.get_encoding(name)
+            except Exception as e: # Ex.: sem acesso à rede para baixar o vocabulário
+                logger.warning(f"tiktoken indisponível ({e}); contando tokens por aproximação.")
+        self.name = 'tiktoken' if self.encoding is not None else 'aproximado'
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return -(-len(text) // self.CHARS_PER_TOKEN)
+
+    def head_tail(self, text, head_tokens, tail_tokens):
+        """Início e fim de 'text' com (aproximadamente) o número de tokens pedido em cada parte."""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            tail = tokens[len(tokens) - tail_tokens:] if tail_tokens > 0 else []
+            return self.encoding.decode(tokens[:head_tokens]), self.encoding.decode(tail)
+        head_chars = head_tokens * self.CHARS_PER_TOKEN
+        tail_chars = tail_tokens * self.CHARS_PER_TOKEN
+        return text[:head_chars], text[len(text) - tail_chars:] if tail_chars > 0 else ''
+
+
+def strip_boilerplate(text):
+    """Remove os avisos padronizados (BOILERPLATE_PATTERNS) do texto."""
+    for pattern in BOILERPLATE_PATTERNS:
+        text = pattern.sub(' ', text)
+    return text
+
+
+def dedupe_lines(text):
+    """
+    Remove linhas repetidas (cabeçalhos e rodapés de cada página), mantendo a primeira
+    ocorrência, e linhas que ficaram vazias. Linhas com valores monetários são mantidas, pois
+    itens idênticos podem aparecer mais de uma vez.
+    """
+    seen = set()
+    lines = []
+    for line in text.split('\n'):
+        line = ' '.join(line.split())
+        if not line:
+            continue
+        key = line.casefold()
+        if key in seen and not AMOUNT_PATTERN.search(line):
+            continue
+        seen.add(key)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+class TextCompressor:
+    def __init__(self, token_budget=None, model=None, enabled=None):
+        """
+        Argumentos:
+            token_budget (int): Máximo de tokens do texto enviado ao modelo
+                (padrão: OPENAI_INPUT_TOKEN_BUDGET ou 6000; 0 desativa o corte).
+            model (str): Modelo cujo tokenizador é usado na contagem.
+            enabled (bool): Remove avisos e linhas repetidas (padrão: OCR_COMPRESS_TEXT, ativado).
+        """
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv('OPENAI_INPUT_TOKEN_BUDGET', '6000'))
+        self.enabled = enabled if enabled is not None else os.getenv('OCR_COMPRESS_TEXT', '1') != '0'
+        self.counter = TokenCounter(model)
+
+    def describe(self):
+        """Configuração que altera o texto enviado (entra na chave do cache de resultados)."""
+        return f"{int(self.enabled)}:{self.token_budget}"
+
+    def compress(self, text):
+        """Retorna CompressedText com o texto reduzido e a contagem de tokens antes e depois."""
+        original_tokens = self.counter.count(text)
+        compressed = dedupe_lines(strip_boilerplate(text)) if self.enabled else text
+        tokens = self.counter.count(compressed) if compressed != text else original_tokens
+
+        truncated = False
+        if self.token_budget > 0 and tokens > self.token_budget:
+            available = max(self.token_budget - self.counter.count(f"\n{TRUNCATION_MARKER}\n"), 1)
+            head_tokens = int(available * HEAD_SHARE)
+            head, tail = self.counter.head_tail(compressed, head_tokens, available - head_tokens)
+            # Descarta a palavra possivelmente cortada ao meio em cada emenda
+            if len(head.split()) > 1:
+                head = head.rsplit(None, 1)[0]
+            if len(tail.split()) > 1:
+                tail = tail.split(None, 1)[1]
+            compressed = f"{head}\n{TRUNCATION_MARKER}\n{tail}"
+            tokens = self.counter.count(compressed)
+            truncated = True
+        return CompressedText(compressed, original_tokens, tokens, truncated)